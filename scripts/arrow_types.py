@@ -0,0 +1,156 @@
+import json
+
+import pyarrow as pa
+
+# BigQuery column types and their Arrow equivalents
+_BIGQUERY_TYPES = {
+    "STRING": pa.string(),
+    "BYTES": pa.binary(),
+    "INTEGER": pa.int64(),
+    "INT64": pa.int64(),
+    "FLOAT": pa.float64(),
+    "FLOAT64": pa.float64(),
+    "NUMERIC": pa.decimal128(38, 9),
+    "BIGNUMERIC": pa.decimal256(76, 38),
+    "BOOLEAN": pa.bool_(),
+    "BOOL": pa.bool_(),
+    "TIMESTAMP": pa.timestamp("us", tz="UTC"),
+    "DATE": pa.date32(),
+    "TIME": pa.time64("us"),
+    "DATETIME": pa.timestamp("us"),
+    "GEOGRAPHY": pa.string(),  # WKT text
+    "JSON": pa.string(),
+    "INTERVAL": pa.string(),
+}
+
+# PostgreSQL type OIDs and their Arrow equivalents; array types map to lists of the element type
+_POSTGRES_TYPES = {
+    16: pa.bool_(),
+    17: pa.binary(),
+    18: pa.string(),
+    19: pa.string(),
+    20: pa.int64(),
+    21: pa.int16(),
+    23: pa.int32(),
+    25: pa.string(),
+    26: pa.int64(),
+    114: pa.string(),  # json
+    700: pa.float32(),
+    701: pa.float64(),
+    1042: pa.string(),
+    1043: pa.string(),
+    1082: pa.date32(),
+    1083: pa.time64("us"),
+    1114: pa.timestamp("us"),
+    1184: pa.timestamp("us", tz="UTC"),
+    2950: pa.string(),  # uuid
+    3802: pa.string(),  # jsonb
+}
+_POSTGRES_ARRAY_TYPES = {
+    1000: 16, 1001: 17, 1005: 21, 1007: 23, 1009: 25, 1014: 1042, 1015: 1043, 1016: 20,
+    1021: 700, 1022: 701, 1115: 1114, 1182: 1082, 1185: 1184, 2951: 2950,
+}
+_POSTGRES_NUMERIC = 1700
+_POSTGRES_NUMERIC_ARRAY = 1231
+
+
+def bigquery_field_type(field):
+    """
+    Returns the Arrow type of a BigQuery SchemaField, including nested RECORD fields and REPEATED modes.
+    """
+    if field.field_type in ("RECORD", "STRUCT"):
+        arrow_type = pa.struct([pa.field(sub_field.name, bigquery_field_type(sub_field)) for sub_field in field.fields])
+    else:
+        arrow_type = _BIGQUERY_TYPES.get(field.field_type, pa.string())
+    if field.mode == "REPEATED":
+        return pa.list_(arrow_type)
+    return arrow_type
+
+
+def bigquery_arrow_schema(fields):
+    """
+    Converts the schema of a BigQuery result (a list of SchemaField) into an Arrow schema.
+    """
+    return pa.schema([pa.field(field.name, bigquery_field_type(field), nullable=field.mode != "REQUIRED") for field in fields])
+
+
+def _postgres_numeric_type(precision, scale):
+    # Only numeric columns declared with a precision have a fixed scale; others are kept as text
+    if precision and 0 < precision <= 38 and scale is not None and scale >= 0:
+        return pa.decimal128(precision, scale)
+    return pa.string()
+
+
+def postgres_arrow_schema(description):
+    """
+    Converts a psycopg2 cursor description into an Arrow schema. Types without an Arrow
+    equivalent (intervals, ranges, geometric types, ...) are exported as text.
+    """
+    fields = []
+    for column in description:
+        if column.type_code == _POSTGRES_NUMERIC:
+            arrow_type = _postgres_numeric_type(column.precision, column.scale)
+        elif column.type_code == _POSTGRES_NUMERIC_ARRAY:
+            arrow_type = pa.list_(_postgres_numeric_type(column.precision, column.scale))
+        elif column.type_code in _POSTGRES_ARRAY_TYPES:
+            arrow_type = pa.list_(_POSTGRES_TYPES[_POSTGRES_ARRAY_TYPES[column.type_code]])
+        else:
+            arrow_type = _POSTGRES_TYPES.get(column.type_code, pa.string())
+        fields.append(pa.field(column.name, arrow_type))
+    return pa.schema(fields)
+
+
+def _to_text(value):
+    if value is None or isinstance(value, str):
+        return value
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, default=str)
+    return str(value)
+
+
+def _prepare_values(values, arrow_type):
+    # Adapt the values the drivers return to what pyarrow accepts for the column type
+    if pa.types.is_string(arrow_type):
+        return [_to_text(value) for value in values]
+    if pa.types.is_binary(arrow_type):
+        return [bytes(value) if value is not None else None for value in values]
+    if pa.types.is_list(arrow_type):
+        return [_prepare_values(value, arrow_type.value_type) if value is not None else None for value in values]
+    if pa.types.is_struct(arrow_type):
+        prepared = []
+        for value in values:
+            if value is None:
+                prepared.append(None)
+            else:
+                prepared.append({field.name: _prepare_values([value.get(field.name)], field.type)[0] for field in arrow_type})
+        return prepared
+    return values
+
+
+def infer_arrow_schema(columns, rows):
+    """
+    Infers an Arrow schema from the values of a batch of rows, for results whose column types
+    are unknown. Columns with no values in the batch are typed as text.
+    """
+    fields = []
+    for name, values in zip(columns, zip(*rows) if rows else [()] * len(columns)):
+        try:
+            arrow_type = pa.array(values).type
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            arrow_type = pa.string()  # Mixed types
+        if pa.types.is_null(arrow_type):
+            arrow_type = pa.string()
+        elif pa.types.is_decimal(arrow_type):
+            # The precision inferred from one batch may be too small for the next ones
+            arrow_type = pa.decimal128(38, 9) if arrow_type.scale <= 9 else pa.string()
+        fields.append(pa.field(name, arrow_type))
+    return pa.schema(fields)
+
+
+def rows_to_record_batch(rows, schema):
+    """
+    Converts a batch of row tuples into an Arrow record batch with the given schema.
+    """
+    columns = list(zip(*rows)) if rows else [()] * len(schema)
+    arrays = [pa.array(_prepare_values(values, field.type), type=field.type) for values, field in zip(columns, schema)]
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
@@ -0,0 +1,99 @@
+import queue
+from concurrent.futures import ThreadPoolExecutor
+
+
+class BackgroundWorker:
+    """
+    Runs slow calls (model requests, queries, schema fetches) on a thread pool and
+    delivers their results back on the Tk main thread.
+
+    Tk widgets must only be touched from the main thread, so the callbacks passed to
+    submit() are queued by the worker threads and run from a root.after polling loop.
+    Tasks submitted while all threads are busy wait in the executor's queue.
+    """
+    def __init__(self, root, max_workers=4, poll_interval=50, on_busy_change=None):
+        """
+        Parameters:
+        - root: The Tk root window.
+        - max_workers: The number of tasks that run at the same time.
+        - poll_interval: Milliseconds between checks for finished tasks.
+        - on_busy_change: Optional function called on the main thread with the descriptions
+          of the unfinished tasks whenever a task is submitted or finishes.
+        """
+        self.root = root
+        self.poll_interval = poll_interval
+        self.on_busy_change = on_busy_change
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._finished = queue.Queue()
+        self._calls = queue.Queue()  # Functions scheduled from worker threads with run_on_main_thread
+        self._pending = []  # Descriptions of the submitted tasks that have not finished yet
+        self.root.after(self.poll_interval, self._poll)
+
+    def submit(self, description, func, *args, on_success=None, on_error=None):
+        """
+        Runs func(*args) in the background.
+
+        Parameters:
+        - description: A short text describing the task, shown while it is pending.
+        - func: The function to run. It must not touch any Tk widget.
+        - args: The arguments passed to func.
+        - on_success: Optional function called on the main thread with the return value of func.
+        - on_error: Optional function called on the main thread with the exception raised by func.
+
+        Returns:
+        - The Future of the task.
+        """
+        self._pending.append(description)
+        self._notify()
+
+        future = self._executor.submit(func, *args)
+        future.add_done_callback(lambda future: self._finished.put((description, future, on_success, on_error)))
+        return future
+
+    def run_on_main_thread(self, func, *args):
+        """
+        Schedules func(*args) to run on the main thread. Safe to call from a worker thread,
+        e.g. to show partial results while a task is still running.
+        """
+        self._calls.put((func, args))
+
+    def pending(self):
+        """
+        Returns the descriptions of the tasks that have not finished yet, oldest first.
+        """
+        return list(self._pending)
+
+    def _notify(self):
+        if self.on_busy_change is not None:
+            self.on_busy_change(self.pending())
+
+    def _poll(self):
+        try:
+            # Take the finished tasks before running the scheduled calls, so that every call a task
+            # scheduled while it was running happens before its on_success or on_error callback
+            finished = []
+            while not self._finished.empty():
+                finished.append(self._finished.get_nowait())
+            while not self._calls.empty():
+                func, args = self._calls.get_nowait()
+                func(*args)
+            for description, future, on_success, on_error in finished:
+                self._pending.remove(description)
+                self._notify()
+                if future.cancelled():
+                    continue
+                error = future.exception()
+                if error is not None:
+                    if on_error is not None:
+                        on_error(error)
+                elif on_success is not None:
+                    on_success(future.result())
+        finally:
+            # Keep polling even if a callback raised
+            self.root.after(self.poll_interval, self._poll)
+
+    def shutdown(self):
+        """
+        Stops accepting tasks and drops the queued ones. Running tasks finish in the background.
+        """
+        self._executor.shutdown(wait=False, cancel_futures=True)
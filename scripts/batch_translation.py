@@ -0,0 +1,233 @@
+import asyncio
+import random
+import time
+
+import openai
+
+from sql_translation import MAX_RESPONSE_TOKENS, SYSTEM_MESSAGE, translation_messages
+
+# Rate limits of the OpenAI account used when none are given; see the limits page of the account
+REQUESTS_PER_MINUTE = 500
+TOKENS_PER_MINUTE = 200000
+
+# Retry settings for rate limited (429) and transient errors
+MAX_RETRIES = 6  # Attempts per request after the first one
+RETRY_BACKOFF = 1.0  # Initial delay in seconds, doubled after each failed attempt
+MAX_RETRY_DELAY = 60.0
+
+# Adaptive rate: each 429 halves the rate the buckets refill at, each success raises it again
+MIN_RATE_FACTOR = 0.1
+RATE_RECOVERY_STEP = 0.05
+
+# Model calls in flight at the same time, on top of the rate limits
+MAX_CONCURRENT_REQUESTS = 16
+
+
+class TokenBucket:
+    """
+    A token bucket refilled continuously at a rate per minute, holding at most one minute of tokens.
+    """
+    def __init__(self, per_minute):
+        self.rate = per_minute / 60.0  # Tokens per second
+        self.capacity = float(per_minute)
+        self.tokens = self.capacity
+        self._updated = time.monotonic()
+
+    def _refill(self, rate_factor):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate * rate_factor)
+        self._updated = now
+
+    def wait_time(self, amount, rate_factor=1.0):
+        """
+        Returns the seconds until amount tokens are available (0 if they are). Amounts larger
+        than the capacity wait for a full bucket.
+        """
+        self._refill(rate_factor)
+        missing = min(amount, self.capacity) - self.tokens
+        return max(0.0, missing / (self.rate * rate_factor))
+
+    def take(self, amount):
+        self.tokens -= min(amount, self.capacity)
+
+    def give_back(self, amount):
+        """
+        Returns tokens taken in excess, or takes more when amount is negative (the bucket may go into debt).
+        """
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class RateLimiter:
+    """
+    Schedules model requests under a requests-per-minute and a tokens-per-minute limit.
+
+    Requests wait in arrival order until both buckets hold enough tokens. A rate limited (429)
+    response pauses every request until its Retry-After delay has passed and halves the rate
+    the buckets refill at; the rate recovers step by step as requests succeed. Use one limiter
+    per event loop.
+    """
+    def __init__(self, requests_per_minute=REQUESTS_PER_MINUTE, tokens_per_minute=TOKENS_PER_MINUTE):
+        self.request_bucket = TokenBucket(requests_per_minute)
+        self.token_bucket = TokenBucket(tokens_per_minute)
+        self.rate_factor = 1.0
+        self.paused_until = 0.0
+        self.requests = 0
+        self.rate_limited = 0
+        self.waited_seconds = 0.0
+        self._lock = None  # Created in the event loop the limiter is first used in
+
+    async def acquire(self, token_count):
+        """
+        Waits until a request of token_count estimated tokens (prompt and completion) may be sent.
+        """
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            while True:
+                delay = max(self.paused_until - time.monotonic(),
+                            self.request_bucket.wait_time(1, self.rate_factor),
+                            self.token_bucket.wait_time(token_count, self.rate_factor))
+                if delay <= 0:
+                    break
+                self.waited_seconds += delay
+                await asyncio.sleep(delay)
+            self.request_bucket.take(1)
+            self.token_bucket.take(token_count)
+            self.requests += 1
+
+    def record_usage(self, estimated_tokens, used_tokens):
+        """
+        Corrects the token bucket once the actual usage of a request is known.
+        """
+        self.token_bucket.give_back(estimated_tokens - used_tokens)
+        self.rate_factor = min(1.0, self.rate_factor + RATE_RECOVERY_STEP)
+
+    def on_rate_limited(self, delay):
+        """
+        Pauses every request for delay seconds and halves the refill rate after a 429 response.
+        """
+        self.rate_limited += 1
+        self.rate_factor = max(MIN_RATE_FACTOR, self.rate_factor / 2)
+        self.paused_until = max(self.paused_until, time.monotonic() + delay)
+
+    def stats(self):
+        return {"requests": self.requests, "rate_limited": self.rate_limited,
+                "waited_seconds": round(self.waited_seconds, 1), "rate_factor": round(self.rate_factor, 2)}
+
+
+def estimate_tokens(prompt):
+    """
+    Estimates the tokens a translation request counts against the limit: about four characters
+    per prompt token, plus the completion tokens requested.
+    """
+    return (len(SYSTEM_MESSAGE) + len(prompt)) // 4 + MAX_RESPONSE_TOKENS
+
+
+def _retry_after(e):
+    # Seconds the server asked to wait, from the Retry-After header of a 429 response
+    try:
+        return float(e.response.headers.get("retry-after"))
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+
+async def complete_prompt(async_client, prompt, model, temperature, limiter, max_retries=MAX_RETRIES, on_usage=None):
+    """
+    Sends one translation prompt through the rate limiter, retrying 429 responses, server
+    errors and connection errors with exponential backoff and jitter.
+
+    Parameters:
+    - async_client: An openai.AsyncOpenAI client, created with max_retries=0 so that retries
+      go through the limiter.
+    - prompt: The translation prompt.
+    - model, temperature: The model settings.
+    - limiter: The RateLimiter shared by the requests of the batch.
+    - max_retries: The attempts after the first one.
+    - on_usage: Optional function called with the token usage of the response.
+
+    Returns:
+    - The model response text.
+    """
+    estimated_tokens = estimate_tokens(prompt)
+    delay = RETRY_BACKOFF
+    for attempt in range(max_retries + 1):
+        await limiter.acquire(estimated_tokens)
+        try:
+            response = await async_client.chat.completions.create(
+                model=model,
+                messages=translation_messages(prompt),
+                max_tokens=MAX_RESPONSE_TOKENS,
+                temperature=temperature,
+                stop=["SQL Query:"]
+            )
+        except openai.RateLimitError as e:
+            if attempt == max_retries:
+                raise
+            limiter.on_rate_limited(_retry_after(e) or delay + random.uniform(0, delay))
+        except (openai.APIConnectionError, openai.InternalServerError):
+            if attempt == max_retries:
+                raise
+            await asyncio.sleep(delay + random.uniform(0, delay))
+        else:
+            used_tokens = response.usage.total_tokens if response.usage is not None else estimated_tokens
+            limiter.record_usage(estimated_tokens, used_tokens)
+            if on_usage is not None and response.usage is not None:
+                on_usage(response.usage)
+            return response.choices[0].message.content.strip()
+        delay = min(delay * 2, MAX_RETRY_DELAY)
+
+
+async def complete_prompts(async_client, prompts, model, temperature, limiter=None, max_concurrency=MAX_CONCURRENT_REQUESTS,
+                           max_retries=MAX_RETRIES, on_usage=None):
+    """
+    Sends many translation prompts concurrently (see complete_prompt).
+
+    Returns:
+    - One entry per prompt, in the order of the prompts: the response text, or the exception
+      raised for that prompt once its retries were used up.
+    """
+    limiter = limiter or RateLimiter()
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+
+    async def complete(prompt):
+        async with semaphore:
+            return await complete_prompt(async_client, prompt, model, temperature, limiter, max_retries, on_usage)
+
+    return await asyncio.gather(*(complete(prompt) for prompt in prompts), return_exceptions=True)
+
+
+def translate_questions(engine, async_client, questions, limiter=None, max_concurrency=MAX_CONCURRENT_REQUESTS,
+                        max_retries=MAX_RETRIES):
+    """
+    Translates many questions with one engine (PostgresEngine or BigQueryEngine), sending the
+    model requests concurrently under the rate limits. Questions already in the translation
+    cache are not sent, and new responses are added to it. The translations are not checked;
+    pass them to the engine's translate_and_check as first_translation to check and repair them.
+
+    Parameters:
+    - engine: The engine whose schema, prompt and settings are used.
+    - async_client: An openai.AsyncOpenAI client created with max_retries=0.
+    - questions: The natural language questions.
+    - limiter: Optional RateLimiter; one with the default limits is used otherwise.
+    - max_concurrency, max_retries: See complete_prompts.
+
+    Returns:
+    - One entry per question, in order: a (sql_query, explanation) tuple, or the exception
+      raised while translating it.
+    """
+    requests = [engine.translation_request(question, engine.schema_to_text(engine.relevant_schema(question)))
+                for question in questions]
+    cache = engine.translation_cache
+    responses = [cache.get(cache_key) if cache is not None else None for _, cache_key in requests]
+    missing = [i for i, response in enumerate(responses) if response is None]
+
+    if missing:
+        completed = asyncio.run(complete_prompts(async_client, [requests[i][0] for i in missing], engine.model,
+                                                 engine.temperature, limiter, max_concurrency, max_retries,
+                                                 engine.prompt_stats.record))
+        for i, response in zip(missing, completed):
+            responses[i] = response
+            if cache is not None and not isinstance(response, BaseException):
+                cache.put(requests[i][1], response)
+
+    return [response if isinstance(response, BaseException) else engine.parse_response(response) for response in responses]
@@ -0,0 +1,91 @@
+import re
+
+from google.cloud import bigquery
+
+PRICE_PER_TIB_USD = 6.25  # On-demand analysis price per TiB scanned
+
+# Pseudo-columns filtering ingestion-time partitioned tables
+_INGESTION_TIME_COLUMNS = ("_PARTITIONTIME", "_PARTITIONDATE")
+
+
+def format_bytes(byte_count):
+    """
+    Formats a number of bytes with a binary unit, e.g. 1536 -> "1.5 KiB".
+    """
+    size = float(byte_count or 0)
+    for unit in ("B", "KiB", "MiB", "GiB", "TiB"):
+        if size < 1024 or unit == "TiB":
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+
+
+def partition_columns(table):
+    """
+    Returns the columns a query can filter on to prune the partitions of a table.
+
+    Parameters:
+    - table: A bigquery.Table.
+
+    Returns:
+    - A tuple of column names, empty if the table is not partitioned.
+    """
+    if table.time_partitioning is not None:
+        if table.time_partitioning.field:
+            return (table.time_partitioning.field,)
+        return _INGESTION_TIME_COLUMNS
+    if table.range_partitioning is not None:
+        return (table.range_partitioning.field,)
+    return ()
+
+
+def has_partition_filter(sql_query, columns):
+    """
+    Tells whether a query filters on one of the partition columns, i.e. whether one of them
+    appears after a WHERE keyword. This is a text heuristic: it can miss filters applied
+    through views and accepts filters that do not actually prune partitions.
+    """
+    return any(re.search(rf'\bWHERE\b.*\b{re.escape(column)}\b', sql_query, re.IGNORECASE | re.DOTALL) for column in columns)
+
+
+def dry_run_query(client, sql_query, price_per_tib=PRICE_PER_TIB_USD):
+    """
+    Validates a query with a dry run, which is free, and estimates what running it would cost.
+
+    Parameters:
+    - client: The bigquery.Client to run the dry run with.
+    - sql_query: The SQL query.
+    - price_per_tib: The price per TiB processed used for the estimate.
+
+    Returns:
+    - A dictionary with "bytes_processed", "estimated_cost" (in USD), "unfiltered_partitioned_tables",
+      the referenced partitioned tables the query reads without filtering on their partition column,
+      and "freshness_token", see below.
+
+    The freshness token lists the modification time and row count of every referenced table, so
+    it changes whenever their data changes. It is None when a referenced table can change without
+    its modification time being updated (external tables and tables with a streaming buffer).
+    """
+    job_config = bigquery.QueryJobConfig(dry_run=True, use_query_cache=False)
+    query_job = client.query(sql_query, job_config=job_config)
+    bytes_processed = query_job.total_bytes_processed or 0
+
+    unfiltered_tables = []
+    freshness_token = []
+    for table_ref in query_job.referenced_tables or []:
+        table = client.get_table(table_ref)
+        table_name = f"{table_ref.project}.{table_ref.dataset_id}.{table_ref.table_id}"
+        columns = partition_columns(table)
+        if columns and not has_partition_filter(sql_query, columns):
+            unfiltered_tables.append(table_name)
+        if freshness_token is not None:
+            if table.table_type == "EXTERNAL" or table.streaming_buffer is not None:
+                freshness_token = None
+            else:
+                freshness_token.append([table_name, table.modified.isoformat() if table.modified else None, table.num_rows])
+
+    return {
+        "bytes_processed": bytes_processed,
+        "estimated_cost": bytes_processed / 2 ** 40 * price_per_tib,
+        "unfiltered_partitioned_tables": unfiltered_tables,
+        "freshness_token": sorted(freshness_token) if freshness_token is not None else None,
+    }
@@ -0,0 +1,626 @@
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+from google.cloud import bigquery
+from google.api_core import exceptions as google_exceptions
+from google.auth import exceptions as google_auth_exceptions
+
+from bigquery_cost import dry_run_query
+from bigquery_storage_reader import create_read_client, query_preserves_order, read_table
+from prompt_builder import PromptBuilder, PromptStats
+from query_result import QueryResult
+from query_repair import RepairStats, translate_with_repair
+from result_cache import ResultCache, is_cacheable
+from schema_cache import connection_cache_key, load_cached_tables, save_cached_tables, stale_tables
+from schema_linking import SchemaLinker
+from schema_vector_index import open_schema_index
+from sql_translation import OPENAI_MODEL, OPENAI_TEMPERATURE, parse_translation, request_translation, stream_translation
+from sql_validation import validate_sql
+from table_qualifier import qualify_tables
+from translation_cache import TranslationCache
+
+# Messages of the engine go to logging rather than standard output, which the CLI writes its results to
+logger = logging.getLogger(__name__)
+
+# Schema fetch settings
+SCHEMA_FETCH_WORKERS = 8  # Maximum number of concurrent table metadata requests
+SCHEMA_FETCH_RETRIES = 4  # Attempts per table before giving up
+SCHEMA_FETCH_BACKOFF = 0.5  # Initial retry delay in seconds, doubled after each failed attempt
+
+# Query limits used when an engine is created without them
+QUERY_TIMEOUT_SECONDS = 300  # Queries running longer than this are cancelled
+QUERY_ROW_LIMIT = 100000  # Maximum number of rows fetched per query
+EXPORT_PAGE_SIZE = 10000  # Rows read per request when exporting results
+MAXIMUM_BYTES_BILLED = 1024 ** 4  # Queries that would bill more bytes than this fail instead of running
+QUERY_REPAIR_ATTEMPTS = 3  # Translations tried per question, including the first one; 1 disables the repair
+
+# Storage Read API settings: large results are read as Arrow batches over parallel streams
+STORAGE_READ_MIN_ROWS = 50000  # Smaller results are read over the REST API
+
+# Schema linking settings used when an engine is created without them
+SCHEMA_LINKING_TOP_K = 8  # Number of best matching tables sent to the model
+SCHEMA_TOKEN_BUDGET = 3000  # Maximum estimated prompt tokens spent on the schema
+
+
+class QueryCancelledError(Exception):
+    """
+    Raised by execute_query when the user cancels the running query.
+    """
+
+
+def fill_placeholders(sql_query, project_id, dataset_name):
+    """
+    Replaces the {project_id} and {dataset_name} placeholders of the qualified table names
+    with the project and dataset the query runs on.
+    """
+    return sql_query.replace("{dataset_name}", dataset_name).replace("{project_id}", project_id)
+
+
+def query_error_message(e):
+    """
+    Returns the message of an error BigQuery raised because of the query itself (invalid syntax,
+    unknown column or table), or None for any other error.
+    """
+    if isinstance(e, google_exceptions.GoogleAPICallError):
+        reasons = {error.get("reason") for error in e.errors or [] if isinstance(error, dict)}
+        if "invalidQuery" in reasons or (isinstance(e, google_exceptions.NotFound) and "Table" in e.message):
+            return e.message
+    return None
+
+
+def field_to_column(field):
+    """
+    Converts a BigQuery SchemaField into the column tuple used by the schema dictionary.
+
+    Parameters:
+    - field: The SchemaField to convert. RECORD fields are converted recursively at any depth.
+
+    Returns:
+    - (name, type, mode) for scalar fields, or (name, 'RECORD', nested_columns, mode) for RECORD fields.
+    """
+    if field.field_type in ('RECORD', 'STRUCT'):
+        return (field.name, 'RECORD', [field_to_column(subfield) for subfield in field.fields], field.mode)
+    return (field.name, field.field_type, field.mode)
+
+
+def get_table_with_retry(client, table_ref):
+    """
+    Fetches a table's metadata, retrying rate limit and server errors with exponential backoff.
+
+    Parameters:
+    - client: The BigQuery client.
+    - table_ref: The reference of the table to fetch.
+
+    Returns:
+    - The Table object.
+    """
+    delay = SCHEMA_FETCH_BACKOFF
+    for attempt in range(SCHEMA_FETCH_RETRIES):
+        try:
+            return client.get_table(table_ref)
+        except (google_exceptions.TooManyRequests, google_exceptions.ServerError):
+            if attempt == SCHEMA_FETCH_RETRIES - 1:
+                raise
+            time.sleep(delay + random.uniform(0, delay))
+            delay *= 2
+
+
+def fetch_table_schemas(client, dataset_ref, table_ids, max_workers=SCHEMA_FETCH_WORKERS):
+    """
+    Fetches the schemas of the given tables in parallel using a bounded thread pool.
+
+    Parameters:
+    - client: The BigQuery client.
+    - dataset_ref: The reference of the dataset containing the tables.
+    - table_ids: The IDs of the tables to fetch.
+    - max_workers: The maximum number of concurrent requests.
+
+    Returns:
+    - A dictionary mapping each table ID to its list of columns, in the order of table_ids.
+    """
+    def fetch_one(table_id):
+        table_obj = get_table_with_retry(client, dataset_ref.table(table_id))
+        return [field_to_column(field) for field in table_obj.schema]
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        columns_per_table = list(executor.map(fetch_one, table_ids))
+    return dict(zip(table_ids, columns_per_table))
+
+
+def fetch_table_fingerprints(client, project_id, dataset_name):
+    """
+    Fetches a fingerprint for every table in the dataset with a single metadata query.
+
+    Parameters:
+    - client: The BigQuery client.
+    - project_id: The project containing the dataset.
+    - dataset_name: The dataset whose tables are listed.
+
+    Returns:
+    - A dictionary mapping table IDs to their last modification time.
+    """
+    query = f"SELECT table_id, last_modified_time FROM `{project_id}.{dataset_name}.__TABLES__`"
+    return {row.table_id: str(row.last_modified_time) for row in client.query(query).result()}
+
+
+def load_dataset_schema(project_id, dataset_name, client=None):
+    """
+    Loads the schema of all tables in a dataset.
+
+    Table schemas are cached on disk per project and dataset; only tables that are new
+    or were modified since they were cached are fetched again.
+
+    Parameters:
+    - project_id: The project containing the dataset.
+    - dataset_name: The dataset to load.
+    - client: Optional BigQuery client for the project.
+
+    Returns:
+    - A tuple (schema, index, refreshed_count) with the schema dictionary, the updated schema
+      index and the number of tables that had to be fetched.
+    """
+    client = client or bigquery.Client(project=project_id)
+    dataset_ref = client.dataset(dataset_name)
+    cache_key = connection_cache_key("bigquery", project_id, dataset_name)
+    cached_tables = load_cached_tables(cache_key)
+
+    try:
+        fingerprints = fetch_table_fingerprints(client, project_id, dataset_name)
+    except google_exceptions.GoogleAPICallError:
+        fingerprints = None  # Fall back to fetching every table without caching
+
+    if fingerprints is None:
+        table_ids = [table.table_id for table in client.list_tables(dataset_ref)]
+        stale_table_ids = table_ids
+    else:
+        table_ids = list(fingerprints)
+        stale_table_ids = stale_tables(cached_tables, fingerprints)
+
+    fetched_tables = fetch_table_schemas(client, dataset_ref, stale_table_ids)
+    dataset_schema = {
+        table_id: fetched_tables[table_id] if table_id in fetched_tables else cached_tables[table_id]["columns"]
+        for table_id in table_ids
+    }
+    if fingerprints is not None:
+        save_cached_tables(cache_key, {
+            table_id: {"fingerprint": fingerprints[table_id], "columns": dataset_schema[table_id]}
+            for table_id in table_ids
+        })
+    return dataset_schema, open_schema_index(cache_key, dataset_schema), len(stale_table_ids)
+
+
+class BigQueryEngine:
+    """
+    Translates questions into BigQuery queries and runs them, without any user interface.
+
+    The engine holds the schema, the caches and the settings; the project and dataset are passed
+    to each call. Translations, checks and queries can run from several threads at the same time.
+    """
+    dialect = "bigquery"
+
+    def __init__(self, openai_client, translation_cache=None, result_cache=None, model=OPENAI_MODEL,
+                 temperature=OPENAI_TEMPERATURE, query_timeout=QUERY_TIMEOUT_SECONDS, row_limit=QUERY_ROW_LIMIT,
+                 maximum_bytes_billed=MAXIMUM_BYTES_BILLED, export_page_size=EXPORT_PAGE_SIZE,
+                 storage_read_enabled=False, storage_read_min_rows=STORAGE_READ_MIN_ROWS,
+                 repair_attempts=QUERY_REPAIR_ATTEMPTS, schema_linking_top_k=SCHEMA_LINKING_TOP_K,
+                 schema_token_budget=SCHEMA_TOKEN_BUDGET):
+        """
+        Parameters:
+        - openai_client: The OpenAI client used for translations.
+        - translation_cache: Optional TranslationCache of model responses.
+        - result_cache: Optional ResultCache of query results.
+        - model, temperature: The model settings used for every translation.
+        - query_timeout: Seconds after which a query is cancelled.
+        - row_limit: The maximum number of rows fetched per query.
+        - maximum_bytes_billed: Queries that would bill more bytes than this fail without running.
+        - export_page_size: Rows read per request by stream_job_results.
+        - storage_read_enabled: Whether large results are read with the BigQuery Storage Read API.
+        - storage_read_min_rows: Results with fewer rows are read over the REST API.
+        - repair_attempts: Translations tried per question, including the first one.
+        - schema_linking_top_k, schema_token_budget: See SchemaLinker.select_tables.
+        """
+        self.openai_client = openai_client
+        self.translation_cache = translation_cache
+        self.result_cache = result_cache
+        self.model = model
+        self.temperature = temperature
+        self.query_timeout = query_timeout
+        self.row_limit = row_limit
+        self.maximum_bytes_billed = maximum_bytes_billed
+        self.export_page_size = export_page_size
+        self.storage_read_enabled = storage_read_enabled
+        self.storage_read_min_rows = storage_read_min_rows
+        self.repair_attempts = repair_attempts
+        self.schema_linking_top_k = schema_linking_top_k
+        self.schema_token_budget = schema_token_budget
+        self.repair_stats = RepairStats()
+        self.prompt_builder = PromptBuilder(self.dialect)
+        self.prompt_stats = PromptStats()
+
+        self.schema = {}
+        self.schema_version = 0  # Incremented whenever the schema changes, so that cached schema texts are not reused
+        self.schema_linker = SchemaLinker(lambda table, columns: self.render_schema({table: columns}))
+        self._schema_lock = threading.Lock()  # The schema linker is not safe to update from several threads
+        self._clients = {}  # Project ID -> bigquery.Client, shared by every call for the project
+        self._clients_lock = threading.Lock()
+        self._storage_read_client = None  # BigQueryReadClient, created the first time the Storage Read API is used
+        self._running_query_jobs = set()  # Query jobs currently running, cancelled by cancel()
+        self._cancelled_job_ids = set()  # IDs of the jobs cancelled by the user
+
+    def bigquery_client(self, project_id):
+        """
+        Returns the BigQuery client of a project, created the first time it is needed.
+        """
+        with self._clients_lock:
+            if project_id not in self._clients:
+                self._clients[project_id] = bigquery.Client(project=project_id)
+            return self._clients[project_id]
+
+    def fetch_schema(self, project_id, dataset_name):
+        """
+        Loads the schema of a dataset (see load_dataset_schema) and uses it for the next translations.
+
+        Returns:
+        - A tuple (schema, refreshed_count).
+        """
+        dataset_schema, index, refreshed_count = load_dataset_schema(project_id, dataset_name, self.bigquery_client(project_id))
+        self.set_schema(dataset_schema, index)
+        return dataset_schema, refreshed_count
+
+    def set_schema(self, schema, index=None):
+        """
+        Replaces the schema used for translations.
+
+        Parameters:
+        - schema: The schema dictionary.
+        - index: Optional SchemaVectorIndex used by the schema linker for fuzzy matching.
+        """
+        with self._schema_lock:
+            self.schema = schema
+            self.schema_linker.vector_index = index
+            self._schema_changed()
+
+    def update_schema(self, tables):
+        """
+        Adds tables to the schema, replacing tables with the same name.
+
+        Parameters:
+        - tables: A schema dictionary, e.g. entered by hand.
+        """
+        with self._schema_lock:
+            self.schema.update(tables)
+            self._schema_changed()
+
+    def _schema_changed(self):
+        # Called with _schema_lock held; the schema linker is brought up to date here rather than
+        # on every question, since it re-hashes every table of the schema
+        self.schema_linker.update(self.schema)
+        self.schema_version += 1
+
+    def schema_snapshot(self):
+        """
+        Returns a copy of the schema, taken while no other thread is changing it.
+        """
+        with self._schema_lock:
+            return dict(self.schema)
+
+    def relevant_schema(self, question):
+        """
+        Selects the tables relevant to a question so that only they are sent to the model.
+
+        Parameters:
+        - question: The natural language question.
+
+        Returns:
+        - A schema dictionary with the selected tables. The whole schema is returned when it fits
+          in the schema token budget.
+        """
+        with self._schema_lock:
+            selected_tables = self.schema_linker.select_tables(question, self.schema_linking_top_k, self.schema_token_budget)
+            # Kept in schema order, so that the schema text is the same whenever the same tables are selected
+            selected_tables = set(selected_tables)
+            return {table: columns for table, columns in self.schema.items() if table in selected_tables}
+
+    def schema_to_text(self, schema):
+        """
+        Returns the text of the engine's schema, or of the tables of it selected by relevant_schema.
+        The text is rendered once per schema version and set of tables (see PromptBuilder.schema_text).
+        """
+        return self.prompt_builder.schema_text((self.schema_version, tuple(schema)), lambda: self.render_schema(schema))
+
+    def render_schema(self, schema):
+        """
+        Converts the internal schema dictionary into a text representation.
+
+        Parameters:
+        - schema: The schema dictionary to convert.
+
+        Returns:
+        - A string representing the schema in text format.
+        """
+        def columns_to_text(columns):
+            column_texts = []
+            for col in columns:
+                if col[1] == 'RECORD':
+                    nested_text = columns_to_text(col[2])
+                    column_texts.append(f"{col[0]} RECORD({nested_text}) MODE({col[3]})")
+                else:
+                    column_texts.append(f"{col[0]} {col[1]} MODE({col[2]})")
+            return ', '.join(column_texts)
+
+        schema_text = "Tables:\n"
+        for table, columns in schema.items():
+            schema_text += f"- {table} ({columns_to_text(columns)})\n"
+        return schema_text
+
+    def translation_request(self, user_query, database_schema, feedback=None):
+        """
+        Builds the prompt of a translation and its translation cache key.
+
+        Parameters:
+        - user_query: The natural language question from the user.
+        - database_schema: The database schema to use for query generation.
+        - feedback: Optional feedback to refine the query.
+
+        Returns:
+        - A tuple (prompt, cache_key).
+        """
+        prompt = self.prompt_builder.build(database_schema, user_query, feedback)
+        cache_key = TranslationCache.make_key(user_query, database_schema, feedback, self.model, self.temperature, self.dialect,
+                                              self.prompt_builder.static_prefix)
+        return prompt, cache_key
+
+    def parse_response(self, full_response):
+        """
+        Extracts the SQL query and its explanation from a model response, and qualifies the
+        tables of the schema referenced in FROM and JOIN clauses.
+
+        Returns:
+        - A tuple (sql_query, explanation).
+        """
+        sql_query, explanation = parse_translation(full_response)
+
+        if sql_query.lower().startswith("sql"):
+            sql_query = sql_query[sql_query.lower().find("select"):].strip()
+
+        # The placeholders are replaced with the dataset and project when the query is executed
+        sql_query = qualify_tables(sql_query, list(self.schema), lambda table_name: f"`{{project_id}}.{{dataset_name}}.{table_name}`")
+        return sql_query, explanation
+
+    def translate_to_sql(self, user_query, database_schema, feedback=None, on_progress=None):
+        """
+        Translates a natural language question into an SQL query using OpenAI, or reuses the
+        cached translation.
+
+        Parameters:
+        - user_query, database_schema, feedback: See translation_request.
+        - on_progress: Optional function receiving the response as it is streamed (see stream_translation).
+
+        Returns:
+        - A tuple containing the SQL query and an explanation of the query.
+        """
+        prompt, cache_key = self.translation_request(user_query, database_schema, feedback)
+        if on_progress is not None:
+            full_response = stream_translation(self.openai_client, prompt, on_progress, self.model, self.temperature,
+                                               self.translation_cache, cache_key, self.prompt_stats.record)
+        else:
+            full_response = request_translation(self.openai_client, prompt, self.model, self.temperature, self.translation_cache, cache_key,
+                                                self.prompt_stats.record)
+        return self.parse_response(full_response)
+
+    def check_sql(self, sql_query, project_id, dataset_name):
+        """
+        Checks a generated query without running it: validate_sql first, then a dry run, which is
+        free and reports syntax errors and unknown tables or columns.
+
+        Parameters:
+        - sql_query: The SQL query to check.
+        - project_id, dataset_name: Where the query would run; without them the query is only validated locally.
+
+        Returns:
+        - The error message, or None if the query is valid or could not be checked (e.g. missing credentials).
+        """
+        errors, _ = validate_sql(sql_query, self.schema, dialect=self.dialect)
+        if errors:
+            return " ".join(errors)
+        if not project_id or not dataset_name:
+            return None
+        try:
+            client = self.bigquery_client(project_id)
+            client.query(fill_placeholders(sql_query, project_id, dataset_name),
+                         job_config=bigquery.QueryJobConfig(dry_run=True, use_query_cache=False))
+        except google_exceptions.GoogleAPICallError as e:
+            error_message = query_error_message(e)
+            if error_message is not None:
+                return error_message
+            logger.warning("Could not check the query with a dry run: %s", e)
+        except google_auth_exceptions.GoogleAuthError as e:
+            logger.warning("Could not check the query with a dry run: %s", e)
+        return None
+
+    def translate_and_check(self, user_query, database_schema, project_id, dataset_name, feedback=None, failed_query=None,
+                            first_translation=None, on_progress=None):
+        """
+        Translates a question and, while check_sql reports an error, sends the error back to the
+        model to repair the query, up to repair_attempts translations (see translate_with_repair).
+
+        Parameters:
+        - user_query, database_schema, feedback: See translate_to_sql.
+        - project_id, dataset_name: Where the dry runs of check_sql run.
+        - failed_query: Optional (sql_query, error_message) of a query that failed on execution.
+        - first_translation: Optional (sql_query, explanation) already translated for the question
+          (e.g. by batch_translation.translate_questions), checked as the first attempt.
+        - on_progress: Optional function receiving each attempt's response as it is streamed (see stream_translation).
+
+        Returns:
+        - A tuple (sql_query, explanation, attempts), attempts being the timed attempts of translate_with_repair.
+        """
+        pending = [first_translation] if first_translation is not None else []
+
+        def translate(attempt_feedback):
+            if pending:
+                return pending.pop()
+            return self.translate_to_sql(user_query, database_schema, attempt_feedback, on_progress)
+
+        return translate_with_repair(
+            translate,
+            lambda sql_query: self.check_sql(sql_query, project_id, dataset_name),
+            max_attempts=self.repair_attempts, feedback=feedback, failed_query=failed_query, stats=self.repair_stats
+        )
+
+    def estimate_query_cost(self, sql_query, project_id, dataset_name):
+        """
+        Runs a dry run of a query, which validates it and reports the bytes it would process
+        without billing anything, then looks the query up in the result cache.
+
+        Returns:
+        - The estimate returned by dry_run_query, with a "cache_key" (None if the query cannot be
+          cached) and a "cached_result" (None if the results are not cached or the tables changed).
+        """
+        sql_query = fill_placeholders(sql_query, project_id, dataset_name)
+        estimate = dry_run_query(self.bigquery_client(project_id), sql_query)
+        estimate["cache_key"] = estimate["cached_result"] = None
+        if self.result_cache is not None and estimate["freshness_token"] is not None and is_cacheable(sql_query):
+            estimate["cache_key"] = ResultCache.make_key(sql_query, connection_cache_key("bigquery", project_id),
+                                                         estimate["freshness_token"], self.row_limit)
+            estimate["cached_result"] = self.result_cache.get(estimate["cache_key"])
+        return estimate
+
+    def execute_query(self, sql_query, project_id, dataset_name, cache_key=None, on_batch=None):
+        """
+        Executes a SQL query on Google BigQuery using the provided dataset name and project ID.
+
+        The query is cancelled if it runs longer than query_timeout, fails without being billed
+        if it would bill more than maximum_bytes_billed, and at most row_limit rows are fetched (the
+        result is marked truncated when the query returned more).
+
+        Parameters:
+        - sql_query: The SQL query to execute.
+        - project_id: The project to run the query in.
+        - dataset_name: The dataset substituted for the {dataset_name} placeholder.
+        - cache_key: Optional result cache key the results are stored under.
+        - on_batch: Optional function called with the (partial) QueryResult each time a page of
+          rows has been added to it. Results read with the Storage Read API are added at once,
+          without calling it. An exception raised by on_batch stops the reading of the results
+          (the query job itself has already finished).
+
+        Returns:
+        - A QueryResult holding the rows column by column.
+        """
+        client = self.bigquery_client(project_id)
+        sql_query = fill_placeholders(sql_query, project_id, dataset_name)
+        logger.info("Executing query: %s", sql_query)
+
+        query_timeout, row_limit = self.query_timeout, self.row_limit
+        job_config = bigquery.QueryJobConfig(job_timeout_ms=query_timeout * 1000, maximum_bytes_billed=self.maximum_bytes_billed)
+        query_job = client.query(sql_query, job_config=job_config)
+        self._running_query_jobs.add(query_job)
+        try:
+            results = query_job.result(timeout=query_timeout, max_results=row_limit)
+            columns = [field.name for field in results.schema]
+            result = None
+            if self.storage_read_enabled and query_job.destination is not None and (results.total_rows or 0) >= self.storage_read_min_rows:
+                result = self.read_results_with_storage_api(query_job, project_id, sql_query, columns, row_limit)
+
+            if result is None:
+                result = QueryResult(columns)
+                # Pack the rows page by page instead of building a dictionary per row
+                for page in results.pages:
+                    result.append_rows([row.values() for row in page][:row_limit - len(result)])
+                    if on_batch is not None:
+                        on_batch(result)
+            result.source = (project_id, query_job.job_id, query_job.location)  # Used to export the complete results
+            result.truncated = (results.total_rows or 0) > row_limit
+
+            if cache_key is not None and self.result_cache is not None:
+                self.result_cache.put(cache_key, result)
+            return result
+        except FutureTimeoutError:
+            query_job.cancel()
+            raise TimeoutError(f"The query did not finish within {query_timeout} seconds and was cancelled.")
+        except Exception:
+            if query_job.job_id in self._cancelled_job_ids:
+                raise QueryCancelledError("The query was cancelled.")
+            raise
+        finally:
+            self._running_query_jobs.discard(query_job)
+            self._cancelled_job_ids.discard(query_job.job_id)
+
+    def execute_cached_query(self, sql_query, project_id, dataset_name, on_batch=None):
+        """
+        Returns the cached results of a query when the tables it reads did not change since, and
+        executes it otherwise (see estimate_query_cost and execute_query). on_batch is not called
+        for cached results.
+
+        Returns:
+        - A tuple (result, from_cache).
+        """
+        estimate = self.estimate_query_cost(sql_query, project_id, dataset_name)
+        if estimate["cached_result"] is not None:
+            return estimate["cached_result"], True
+        return self.execute_query(sql_query, project_id, dataset_name, estimate["cache_key"], on_batch), False
+
+    def read_results_with_storage_api(self, query_job, project_id, sql_query, columns, row_limit):
+        """
+        Reads the destination table of a finished query job as Arrow record batches over parallel
+        streams (a single stream when the query sorts its results).
+
+        Parameters:
+        - query_job: The finished query job.
+        - project_id: The project billed for the read session.
+        - sql_query: The executed SQL query, checked for an ORDER BY clause.
+        - columns: The column names of the results.
+        - row_limit: The maximum number of rows read.
+
+        Returns:
+        - A QueryResult, or None if the Storage Read API cannot be used (library not installed or
+          the read session was refused), in which case the caller reads the results over REST.
+        """
+        if self._storage_read_client is None:
+            self._storage_read_client = create_read_client()
+            if self._storage_read_client is None:
+                return None
+        try:
+            return read_table(self._storage_read_client, project_id, query_job.destination, columns,
+                              row_limit=row_limit, preserve_order=query_preserves_order(sql_query))
+        except google_exceptions.GoogleAPICallError as e:
+            logger.warning("Storage Read API unavailable, reading the results over REST: %s", e)
+            return None
+
+    def stream_job_results(self, project_id, job_id, location, on_schema=None):
+        """
+        Reads the complete results of a finished query job page by page, without the row limit.
+
+        Parameters:
+        - project_id: The project the job ran in.
+        - job_id: The ID of the query job.
+        - location: The location of the job.
+        - on_schema: Optional function called with the result schema (a list of SchemaField)
+          before the first page is yielded.
+
+        Yields:
+        - (columns, rows) tuples, where rows is one page of row tuples. Results without rows
+          yield one empty page, so that their columns are known.
+        """
+        client = self.bigquery_client(project_id)
+        results = client.get_job(job_id, location=location).result(page_size=self.export_page_size)
+        if on_schema is not None:
+            on_schema(results.schema)
+        columns = [field.name for field in results.schema]
+        page_count = 0
+        for page in results.pages:
+            page_count += 1
+            yield columns, [row.values() for row in page]
+        if not page_count:
+            yield columns, []
+
+    def cancel(self):
+        """
+        Cancels every running query job.
+        """
+        for query_job in list(self._running_query_jobs):
+            self._cancelled_job_ids.add(query_job.job_id)
+            query_job.cancel()
@@ -0,0 +1,139 @@
+import queue
+import re
+import threading
+
+import pyarrow as pa
+
+from query_result import QueryResult
+
+try:
+    from google.cloud import bigquery_storage
+except ImportError:  # The Storage Read API is optional; results are then read over REST
+    bigquery_storage = None
+
+STORAGE_READ_MAX_STREAMS = 4  # Streams read in parallel
+_QUEUE_BATCHES_PER_STREAM = 2  # Record batches each stream may read ahead of the consumer
+_ORDER_BY_PATTERN = re.compile(r'\bORDER\s+BY\b', re.IGNORECASE)
+
+
+def create_read_client():
+    """
+    Returns a BigQueryReadClient, or None when google-cloud-bigquery-storage is not installed.
+    """
+    if bigquery_storage is None:
+        return None
+    return bigquery_storage.BigQueryReadClient()
+
+
+def query_preserves_order(sql_query):
+    """
+    Tells whether a query sorts its results, in which case its result table must be read
+    through a single stream to keep the order.
+    """
+    return bool(_ORDER_BY_PATTERN.search(sql_query))
+
+
+def _table_path(table):
+    return f"projects/{table.project}/datasets/{table.dataset_id}/tables/{table.table_id}"
+
+
+def _requested_session(table_path):
+    return bigquery_storage.types.ReadSession(table=table_path, data_format=bigquery_storage.types.DataFormat.ARROW)
+
+
+def _read_stream(read_client, session, stream_name, batches, stop):
+    # Runs in a reader thread: puts the stream's record batches on the queue, then None
+    try:
+        for page in read_client.read_rows(stream_name).rows(session).pages:
+            if stop.is_set():
+                break
+            batches.put(page.to_arrow())
+        batches.put(None)
+    except BaseException as e:
+        batches.put(e)
+
+
+def iter_record_batches(read_client, project_id, table, max_streams=STORAGE_READ_MAX_STREAMS, preserve_order=False):
+    """
+    Reads a table with the BigQuery Storage Read API as Arrow record batches, reading up to
+    max_streams streams in parallel. With several streams the batches arrive in no particular order.
+
+    Parameters:
+    - read_client: A BigQueryReadClient, as returned by create_read_client.
+    - project_id: The project billed for the read session.
+    - table: The table to read (e.g. the destination table of a query job).
+    - max_streams: The maximum number of streams read in parallel.
+    - preserve_order: Read through a single stream to keep the row order of the table.
+
+    Yields:
+    - pyarrow RecordBatch objects. Closing the generator stops the reader threads.
+    """
+    session = read_client.create_read_session(
+        parent=f"projects/{project_id}",
+        read_session=_requested_session(_table_path(table)),
+        max_stream_count=1 if preserve_order else max_streams
+    )
+    streams = list(session.streams)
+    if not streams:
+        return
+    batches = queue.Queue(maxsize=_QUEUE_BATCHES_PER_STREAM * len(streams))
+    stop = threading.Event()
+    threads = [threading.Thread(target=_read_stream, args=(read_client, session, stream.name, batches, stop), daemon=True)
+               for stream in streams]
+    for thread in threads:
+        thread.start()
+    try:
+        finished = 0
+        while finished < len(threads):
+            item = batches.get()
+            if item is None:
+                finished += 1
+            elif isinstance(item, BaseException):
+                raise item
+            else:
+                yield item
+    finally:
+        stop.set()
+        # Unblock reader threads waiting for room in the queue
+        while any(thread.is_alive() for thread in threads):
+            try:
+                batches.get(timeout=0.1)
+            except queue.Empty:
+                pass
+
+
+def _column_values(array):
+    # Columns without NULLs of plain numeric or boolean types are converted without Python objects
+    if array.null_count == 0 and (pa.types.is_integer(array.type) or pa.types.is_floating(array.type) or pa.types.is_boolean(array.type)):
+        return array.to_numpy(zero_copy_only=False)
+    return array.to_pylist()
+
+
+def read_table(read_client, project_id, table, columns, row_limit=None, max_streams=STORAGE_READ_MAX_STREAMS,
+               preserve_order=False):
+    """
+    Reads a table with the BigQuery Storage Read API into a QueryResult.
+
+    Parameters:
+    - read_client, project_id, table, max_streams, preserve_order: See iter_record_batches.
+    - columns: The column names of the table, used when it has no rows.
+    - row_limit: The maximum number of rows read; the remaining streams are stopped once it is reached.
+
+    Returns:
+    - A QueryResult with the rows of the table.
+    """
+    result = None
+    record_batches = iter_record_batches(read_client, project_id, table, max_streams, preserve_order)
+    try:
+        for record_batch in record_batches:
+            if result is None:
+                result = QueryResult(record_batch.schema.names)
+            if row_limit is not None:
+                record_batch = record_batch.slice(0, row_limit - len(result))
+            result.append_columns([_column_values(array) for array in record_batch.columns], record_batch.num_rows)
+            if row_limit is not None and len(result) >= row_limit:
+                break
+    finally:
+        record_batches.close()
+    return result if result is not None else QueryResult(columns)
+
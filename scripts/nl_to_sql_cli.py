@@ -0,0 +1,220 @@
+import argparse
+import json
+import sys
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from openai import AsyncOpenAI, OpenAI
+
+from batch_translation import MAX_CONCURRENT_REQUESTS, REQUESTS_PER_MINUTE, TOKENS_PER_MINUTE, RateLimiter, translate_questions
+from result_cache import ResultCache
+from result_export import json_default
+from translation_cache import TranslationCache, TRANSLATION_CACHE_PATH
+
+# Default number of questions processed at the same time
+CLI_WORKERS = 4
+
+# Rows of each result written to the output by default; the row limit still bounds what is fetched
+OUTPUT_ROWS = 100
+
+# What the CLI and the server need from a database: its engine, and functions checking a question's
+# first translation (repairing it when needed), executing a query (optionally calling on_batch with the
+# partial result as batches of rows arrive), loading the schema and releasing the connections
+Backend = namedtuple("Backend", ["engine", "translate", "execute", "load_schema", "close"])
+
+
+def postgres_backend(args, openai_client, translation_cache, result_cache):
+    """
+    Creates the PostgreSQL engine and a connection pool with one connection per worker. The
+    connections run read-only transactions, so that a query passing validate_sql still cannot
+    write (e.g. by calling setval or lo_unlink).
+    """
+    from postgres_engine import PostgresEngine
+    from postgres_pool import PostgresConnectionPool
+
+    details = {'dbname': args.dbname, 'user': args.user, 'password': args.password, 'host': args.host, 'port': args.port}
+    pool = PostgresConnectionPool(details, min_size=1, max_size=args.workers, readonly=True)
+    engine = PostgresEngine(openai_client, translation_cache, result_cache, model=args.model,
+                            query_timeout=args.timeout, row_limit=args.row_limit, repair_attempts=args.repair_attempts)
+    schema_names = [name.strip() for name in args.schemas.split(",") if name.strip()] or ["public"]
+    return Backend(
+        engine,
+        lambda question, database_schema, translation: engine.translate_and_check(question, database_schema, pool,
+                                                                                    first_translation=translation),
+        lambda sql_query, on_batch=None: engine.execute_cached_query(sql_query, pool, on_batch),
+        lambda: engine.fetch_schema(pool, schema_names),
+        pool.close
+    )
+
+
+def bigquery_backend(args, openai_client, translation_cache, result_cache):
+    """
+    Creates the BigQuery engine for the project and dataset of the arguments.
+    """
+    from bigquery_engine import BigQueryEngine
+
+    engine = BigQueryEngine(openai_client, translation_cache, result_cache, model=args.model,
+                            query_timeout=args.timeout, row_limit=args.row_limit, repair_attempts=args.repair_attempts,
+                            maximum_bytes_billed=args.max_gib_billed * 1024 ** 3)
+    return Backend(
+        engine,
+        lambda question, database_schema, translation: engine.translate_and_check(question, database_schema, args.project, args.dataset,
+                                                                                    first_translation=translation),
+        lambda sql_query, on_batch=None: engine.execute_cached_query(sql_query, args.project, args.dataset, on_batch),
+        lambda: engine.fetch_schema(args.project, args.dataset),
+        lambda: None
+    )
+
+
+def read_questions(path):
+    """
+    Reads one question per line from a file ("-" for standard input), skipping empty lines
+    and lines starting with #.
+    """
+    questions_file = sys.stdin if path == "-" else open(path, encoding="utf-8")
+    with questions_file:
+        return [line.strip() for line in questions_file if line.strip() and not line.lstrip().startswith("#")]
+
+
+def answer_question(backend, question, translation, execute=False, output_rows=OUTPUT_ROWS):
+    """
+    Checks the translation of a question (repairing the query while its check fails) and
+    optionally executes it. Runs in a worker thread; errors are recorded instead of raised, so
+    one failing question does not stop the batch.
+
+    Parameters:
+    - backend: The Backend of the database.
+    - question: The natural language question.
+    - translation: Its (sql_query, explanation) from translate_questions, or the exception raised
+      while translating it.
+    - execute: Whether to execute the query once it passes its check.
+    - output_rows: The number of rows of the result kept in the record.
+
+    Returns:
+    - A dictionary with the question, the SQL query, its explanation, the number of attempts,
+      the check error of the last attempt, and when executed the columns, the number of rows,
+      the first output_rows rows and whether they came from the result cache.
+    """
+    record = {"question": question}
+    started = time.perf_counter()
+    try:
+        if isinstance(translation, BaseException):
+            raise translation
+        engine = backend.engine
+        database_schema = engine.schema_to_text(engine.relevant_schema(question))
+        sql_query, explanation, attempts = backend.translate(question, database_schema, translation)
+        record.update(sql=sql_query, explanation=explanation, attempts=len(attempts), check_error=attempts[-1]["error"])
+        if execute and attempts[-1]["error"] is None:
+            result, from_cache = backend.execute(sql_query)
+            record.update(columns=result.columns, row_count=len(result), rows=result.rows(0, output_rows), from_cache=from_cache)
+    except Exception as e:
+        record["error"] = f"{e.__class__.__name__}: {e}"
+    record["seconds"] = round(time.perf_counter() - started, 3)
+    return record
+
+
+def engine_options():
+    """
+    Returns a parent parser with the options of the engines and the model, shared by the CLI and the server.
+    """
+    options = argparse.ArgumentParser(add_help=False)
+    options.add_argument("--schema-file", help="Schema saved from the tool as JSON, used instead of fetching the schema")
+    options.add_argument("--api-key", help="OpenAI API key (default: the OPENAI_API_KEY environment variable)")
+    options.add_argument("--base-url", help="Base URL of the chat completions API, e.g. a local OpenAI-compatible server")
+    options.add_argument("--model", default="gpt-4o-mini", help="OpenAI model (default: gpt-4o-mini)")
+    options.add_argument("--timeout", type=int, default=300, help="Query timeout in seconds (default: 300)")
+    options.add_argument("--row-limit", type=int, default=100000, help="Maximum number of rows fetched per query (default: 100000)")
+    options.add_argument("--repair-attempts", type=int, default=3, help="Translations tried per question (default: 3)")
+    return options
+
+
+def add_backends(parser, common):
+    """
+    Adds a postgres and a bigquery subcommand to parser, both with the options of the common parent parser.
+    """
+    backends = parser.add_subparsers(dest="backend", required=True)
+
+    postgres = backends.add_parser("postgres", parents=[common], help="Translate for a PostgreSQL database")
+    postgres.add_argument("--host", default="localhost")
+    postgres.add_argument("--port", default="5432")
+    postgres.add_argument("--dbname", required=True)
+    postgres.add_argument("--user", required=True)
+    postgres.add_argument("--password", help="Password (default: PGPASSWORD or ~/.pgpass)")
+    postgres.add_argument("--schemas", default="public", help="Comma-separated schemas to read the tables of (default: public)")
+    postgres.set_defaults(create_backend=postgres_backend)
+
+    bigquery = backends.add_parser("bigquery", parents=[common], help="Translate for a Google BigQuery dataset")
+    bigquery.add_argument("--project", required=True)
+    bigquery.add_argument("--dataset", required=True)
+    bigquery.add_argument("--max-gib-billed", type=int, default=1024, help="Queries billing more GiB than this fail (default: 1024)")
+    bigquery.set_defaults(create_backend=bigquery_backend)
+
+
+def load_schema(backend, schema_file=None):
+    """
+    Loads the schema of the engine from a schema file saved from the tool, or from the database.
+    """
+    if schema_file:
+        with open(schema_file, encoding="utf-8") as f:
+            backend.engine.update_schema(json.load(f))
+    else:
+        backend.load_schema()
+
+
+def build_parser():
+    common = argparse.ArgumentParser(add_help=False, parents=[engine_options()])
+    common.add_argument("questions", help="File with one natural language question per line, or - for standard input")
+    common.add_argument("-o", "--output", default="-", help="JSON Lines file the results are written to (default: standard output)")
+    common.add_argument("-w", "--workers", type=int, default=CLI_WORKERS, help=f"Questions processed at the same time (default: {CLI_WORKERS})")
+    common.add_argument("--execute", action="store_true", help="Execute the queries that pass their check and write their rows")
+    common.add_argument("--output-rows", type=int, default=OUTPUT_ROWS, help=f"Rows written per result (default: {OUTPUT_ROWS})")
+    common.add_argument("--rpm", type=int, default=REQUESTS_PER_MINUTE, help=f"Model requests per minute (default: {REQUESTS_PER_MINUTE})")
+    common.add_argument("--tpm", type=int, default=TOKENS_PER_MINUTE, help=f"Model tokens per minute (default: {TOKENS_PER_MINUTE})")
+    common.add_argument("--concurrent-requests", type=int, default=MAX_CONCURRENT_REQUESTS,
+                        help=f"Model requests in flight at the same time (default: {MAX_CONCURRENT_REQUESTS})")
+
+    parser = argparse.ArgumentParser(description="Translate a file of natural language questions into SQL and optionally run them.")
+    add_backends(parser, common)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    questions = read_questions(args.questions)
+    openai_client = OpenAI(api_key=args.api_key, base_url=args.base_url)
+    backend = args.create_backend(args, openai_client, TranslationCache(path=TRANSLATION_CACHE_PATH), ResultCache())
+    started = time.perf_counter()
+    output = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    failed = 0
+    try:
+        load_schema(backend, args.schema_file)
+
+        # Every question is first translated through the rate limiter with concurrent requests; the
+        # threads then check, repair and execute the queries, the repairs using the blocking client
+        limiter = RateLimiter(args.rpm, args.tpm)
+        async_client = AsyncOpenAI(api_key=args.api_key, base_url=args.base_url, max_retries=0)
+        translations = translate_questions(backend.engine, async_client, questions, limiter, args.concurrent_requests)
+
+        with ThreadPoolExecutor(max_workers=max(1, args.workers)) as executor:
+            # map yields the records in the order of the questions, each as soon as it and those before it are done
+            records = executor.map(lambda item: answer_question(backend, *item, args.execute, args.output_rows),
+                                   zip(questions, translations))
+            for record in records:
+                failed += "error" in record or record.get("check_error") is not None
+                output.write(json.dumps(record, default=json_default) + "\n")
+                output.flush()
+    finally:
+        if output is not sys.stdout:
+            output.close()
+        backend.close()
+
+    print(f"{len(questions)} questions, {failed} failed, in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+    print(backend.engine.repair_stats.summary(), file=sys.stderr)
+    print(backend.engine.prompt_stats.summary(), file=sys.stderr)
+    print(", ".join(f"{key.replace('_', ' ').capitalize()}: {value}" for key, value in limiter.stats().items()), file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,281 @@
+import argparse
+import asyncio
+import json
+import logging
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from urllib.parse import urlsplit
+
+from openai import OpenAI
+
+from nl_to_sql_cli import add_backends, answer_question, engine_options, load_schema
+from result_cache import ResultCache
+from result_export import json_default
+from sql_validation import validate_sql
+from translation_cache import TranslationCache, TRANSLATION_CACHE_PATH
+
+logger = logging.getLogger(__name__)
+
+# Requests translated or executed at the same time; also the size of the connection pool
+SERVER_WORKERS = 8
+
+# Largest request body accepted, in bytes
+MAX_REQUEST_BYTES = 1024 * 1024
+
+# Rows per line of a streamed result, and lines buffered before the query waits for the client
+RESPONSE_BATCH_ROWS = 1000
+RESPONSE_QUEUE_SIZE = 4
+
+
+class RequestError(Exception):
+    """
+    Raised for a request that cannot be served; answered with its HTTP status and message.
+    """
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class NlToSqlServer:
+    """
+    Serves one engine to many users over HTTP: every request shares the engine's schema, its
+    translation and result caches and, for PostgreSQL, one connection pool.
+
+    Endpoints (JSON bodies and responses):
+    - GET /schema: The tables of the schema and their columns.
+    - POST /schema/refresh: Fetches the schema again (reusing the schema cache).
+    - POST /translate {"question": ...}: The checked (and repaired) SQL query, as written by the CLI.
+    - POST /execute {"sql": ...}: Streams the result as JSON lines: {"columns": [...]}, then
+      {"rows": [...]} batches, then {"row_count": ..., "from_cache": ..., "seconds": ...}, or
+      {"error": ...} if the query fails.
+
+    The event loop only parses requests and writes responses; translations, checks and queries
+    run on a thread pool of workers threads.
+
+    The server has no authentication: anyone reaching it can run queries as the database user.
+    Keep it bound to localhost, or put it behind a proxy that authenticates the users.
+    """
+    def __init__(self, backend, workers=SERVER_WORKERS):
+        self.backend = backend
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self._refresh_lock = None  # Created in the event loop, so that concurrent refreshes fetch the schema once
+
+    async def run_in_worker(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+
+    async def handle_connection(self, reader, writer):
+        """
+        Reads one request from a connection, answers it and closes the connection.
+        """
+        try:
+            try:
+                method, path, body = await self.read_request(reader)
+                await self.route(method, path, body, writer)
+            except RequestError as e:
+                await self.send_json(writer, {"error": str(e)}, e.status)
+            except ConnectionError:
+                raise
+            except Exception as e:
+                logger.exception("Error handling request")
+                await self.send_json(writer, {"error": f"{e.__class__.__name__}: {e}"}, HTTPStatus.INTERNAL_SERVER_ERROR)
+        except ConnectionError:
+            pass  # The client went away
+        finally:
+            writer.close()
+
+    async def read_request(self, reader):
+        """
+        Reads the request line, the headers and the body of a request.
+
+        Returns:
+        - A tuple (method, path, body), where body is the decoded JSON body or None.
+        """
+        try:
+            method, target, _ = (await reader.readline()).decode("latin-1").split(" ", 2)
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                headers[name.strip().lower()] = value.strip()
+            length = int(headers.get("content-length", 0))
+        except ValueError:
+            raise RequestError(HTTPStatus.BAD_REQUEST, "Malformed request.")
+        if length > MAX_REQUEST_BYTES:
+            raise RequestError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, f"Request bodies are limited to {MAX_REQUEST_BYTES} bytes.")
+        try:
+            body = json.loads(await reader.readexactly(length)) if length else None
+        except asyncio.IncompleteReadError:
+            raise RequestError(HTTPStatus.BAD_REQUEST, "The request body is incomplete.")
+        except ValueError:
+            raise RequestError(HTTPStatus.BAD_REQUEST, "The request body is not valid JSON.")
+        return method.upper(), urlsplit(target).path.rstrip("/") or "/", body
+
+    async def route(self, method, path, body, writer):
+        routes = {
+            "/schema": ("GET", self.get_schema),
+            "/schema/refresh": ("POST", self.refresh_schema),
+            "/translate": ("POST", self.translate),
+            "/execute": ("POST", self.execute),
+        }
+        if path not in routes:
+            raise RequestError(HTTPStatus.NOT_FOUND, f"Unknown endpoint {path}.")
+        expected_method, handler = routes[path]
+        if method != expected_method:
+            raise RequestError(HTTPStatus.METHOD_NOT_ALLOWED, f"{path} expects {expected_method}.")
+        await handler(body, writer)
+
+    async def get_schema(self, body, writer):
+        # Serialised from a copy, as a schema refresh may change the schema in the meantime
+        await self.send_json(writer, {"tables": self.backend.engine.schema_snapshot()})
+
+    async def refresh_schema(self, body, writer):
+        if self._refresh_lock is None:
+            self._refresh_lock = asyncio.Lock()
+        async with self._refresh_lock:
+            await self.run_in_worker(self.backend.load_schema)
+        await self.send_json(writer, {"tables": len(self.backend.engine.schema)})
+
+    async def translate(self, body, writer):
+        question = required_field(body, "question")
+        record = await self.run_in_worker(answer_question, self.backend, question, None)
+        await self.send_json(writer, record)
+
+    async def execute(self, body, writer):
+        """
+        Executes a read-only query and streams its result in chunked JSON lines. When the client
+        stops reading, the query waits after RESPONSE_QUEUE_SIZE lines; when it disconnects, the
+        query is stopped at its next batch and its connection returned to the pool. BigQuery
+        results are sent page by page once the query job has finished; a disconnect stops the
+        reading of the pages, not the job.
+
+        validate_sql only rejects statements that are not SELECT queries; PostgreSQL queries
+        also run in read-only transactions (see postgres_backend), but can still call functions
+        such as pg_terminate_backend that the database user is allowed to call.
+        """
+        sql_query = required_field(body, "sql")
+        engine = self.backend.engine
+        errors, _ = validate_sql(sql_query, engine.schema_snapshot(), dialect=engine.dialect)
+        if errors:
+            raise RequestError(HTTPStatus.BAD_REQUEST, " ".join(errors))
+
+        loop = asyncio.get_running_loop()
+        lines = asyncio.Queue(maxsize=RESPONSE_QUEUE_SIZE)
+        disconnected = threading.Event()
+
+        def put(line):
+            # Called from the worker thread; blocks while the queue is full
+            if disconnected.is_set():
+                raise ConnectionResetError("The client disconnected.")
+            asyncio.run_coroutine_threadsafe(lines.put(line), loop).result()
+
+        def run():
+            started = time.perf_counter()
+            streamed = None  # Rows of the result already put in the queue, None until the columns are
+
+            def put_rows(result):
+                nonlocal streamed
+                if streamed is None:
+                    put({"columns": result.columns})
+                    streamed = 0
+                for start in range(streamed, len(result), RESPONSE_BATCH_ROWS):
+                    put({"rows": result.rows(start, min(start + RESPONSE_BATCH_ROWS, len(result)))})
+                streamed = max(streamed, len(result))
+
+            try:
+                try:
+                    result, from_cache = self.backend.execute(sql_query, put_rows)
+                    put_rows(result)  # Cached results and results read at once are sent here
+                    put({"row_count": len(result), "from_cache": from_cache, "seconds": round(time.perf_counter() - started, 3)})
+                except ConnectionResetError:
+                    raise
+                except Exception as e:
+                    put({"error": f"{e.__class__.__name__}: {e}"})
+                put(None)  # End of the response
+            except ConnectionResetError:
+                pass  # The client disconnected; the query stopped at its next batch
+
+        writer.write(response_head(HTTPStatus.OK, "application/x-ndjson", chunked=True))
+        task = loop.run_in_executor(self.executor, run)
+        try:
+            while (line := await lines.get()) is not None:
+                data = (json.dumps(line, default=json_default) + "\n").encode("utf-8")
+                writer.write(b"%x\r\n%s\r\n" % (len(data), data))
+                await writer.drain()
+            writer.write(b"0\r\n\r\n")
+            await writer.drain()
+        finally:
+            # Unblock the worker thread if the client went away while it waited for the queue
+            disconnected.set()
+            while not task.done():
+                if not lines.empty():
+                    lines.get_nowait()
+                await asyncio.sleep(0.01)
+
+    async def send_json(self, writer, data, status=HTTPStatus.OK):
+        body = json.dumps(data, default=json_default).encode("utf-8")
+        writer.write(response_head(status, "application/json", length=len(body)) + body)
+        await writer.drain()
+
+    async def serve(self, host, port):
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        print(f"Serving on http://{host}:{port}", file=sys.stderr)
+        async with server:
+            await server.serve_forever()
+
+
+def required_field(body, name):
+    """
+    Returns a non-empty string field of a JSON request body, raising a RequestError otherwise.
+    """
+    value = body.get(name) if isinstance(body, dict) else None
+    if not isinstance(value, str) or not value.strip():
+        raise RequestError(HTTPStatus.BAD_REQUEST, f'The request body must be a JSON object with a "{name}" string.')
+    return value.strip()
+
+
+def response_head(status, content_type, length=None, chunked=False):
+    """
+    Returns the status line and headers of a response closing the connection once it is sent.
+    """
+    headers = [f"HTTP/1.1 {status.value} {status.phrase}", f"Content-Type: {content_type}", "Connection: close"]
+    if chunked:
+        headers.append("Transfer-Encoding: chunked")
+    else:
+        headers.append(f"Content-Length: {length}")
+    return ("\r\n".join(headers) + "\r\n\r\n").encode("latin-1")
+
+
+def build_parser():
+    common = argparse.ArgumentParser(add_help=False, parents=[engine_options()])
+    common.add_argument("--bind", default="127.0.0.1", help="Address the server listens on (default: 127.0.0.1); the server has no authentication")
+    common.add_argument("--http-port", type=int, default=8080, help="Port the server listens on (default: 8080)")
+    common.add_argument("-w", "--workers", type=int, default=SERVER_WORKERS,
+                        help=f"Requests translated or executed at the same time, and database connections (default: {SERVER_WORKERS})")
+
+    parser = argparse.ArgumentParser(description="Serve natural language to SQL translation and query execution over HTTP.")
+    add_backends(parser, common)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    openai_client = OpenAI(api_key=args.api_key, base_url=args.base_url)
+    backend = args.create_backend(args, openai_client, TranslationCache(path=TRANSLATION_CACHE_PATH), ResultCache())
+    try:
+        load_schema(backend, args.schema_file)
+        print(f"Loaded {len(backend.engine.schema)} tables", file=sys.stderr)
+        asyncio.run(NlToSqlServer(backend, args.workers).serve(args.bind, args.http_port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        backend.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,165 +1,329 @@
 import tkinter as tk
 from tkinter import simpledialog, scrolledtext, messagebox, ttk, filedialog, Menu
-from google.cloud import bigquery
 import json
-import re
-import csv
 import os
 import openai
 from openai import OpenAI
+from translation_cache import TranslationCache, TRANSLATION_CACHE_PATH
+from background_worker import BackgroundWorker
+from result_grid import ResultGrid
+from result_export import EXPORT_FORMATS, TYPED_EXPORT_FORMATS
+from bigquery_cost import format_bytes
+from bigquery_engine import BigQueryEngine, QueryCancelledError, load_dataset_schema, query_error_message
+from result_cache import ResultCache
+from sql_validation import validate_sql
+from query_repair import describe_attempts
 
 # Initialize OpenAI client with API key
 client = OpenAI(api_key="your_openai_api_key")
 
+# Model settings used for every translation
+OPENAI_MODEL = "gpt-4o-mini"
+OPENAI_TEMPERATURE = 0.3
+STREAM_MODEL_OUTPUT = True  # Show the model output as it is generated instead of waiting for the complete response
+
+# Cache of model responses, persisted across sessions
+translation_cache = TranslationCache(path=TRANSLATION_CACHE_PATH)
+
+# Results of executed queries, reused while the tables they read are unchanged
+RESULT_CACHE_MAX_BYTES = 1024 ** 3  # Least recently used results are evicted above this size on disk
+result_cache = ResultCache(max_bytes=RESULT_CACHE_MAX_BYTES)
+
 # Set Google application credentials environment variable for BigQuery
 os.environ['GOOGLE_APPLICATION_CREDENTIALS'] = '/path/to/your/credentials.json'
 
+# Query limits, adjustable from the context menu
+QUERY_TIMEOUT_SECONDS = 300  # Queries running longer than this are cancelled
+QUERY_ROW_LIMIT = 100000  # Maximum number of rows fetched per query
+EXPORT_PAGE_SIZE = 10000  # Rows read per request when exporting results
+
+# Cost guards, adjustable from the context menu
+MAXIMUM_BYTES_BILLED = 1024 ** 4  # Queries that would bill more bytes than this fail instead of running
+COST_CONFIRM_BYTES = 10 * 1024 ** 3  # Ask before running queries that process more bytes than this
+
+# Storage Read API settings: large results are read as Arrow batches over parallel streams
+STORAGE_READ_ENABLED = False  # Opt-in, toggled from the context menu
+STORAGE_READ_MIN_ROWS = 50000  # Smaller results are read over the REST API
+
+# Automatic repair of generated queries that the dry run or BigQuery rejects
+QUERY_REPAIR_ATTEMPTS = 3  # Translations tried per question, including the first one; 1 disables the repair
+
+# Number of model calls, queries and schema fetches that can run at the same time
+WORKER_THREADS = 4
+
+# Schema linking settings
+SCHEMA_LINKING_TOP_K = 8  # Number of best matching tables sent to the model
+SCHEMA_TOKEN_BUDGET = 3000  # Maximum estimated prompt tokens spent on the schema
+
+# Translates questions and runs queries; holds the schema and the query limits, which start at the settings above
+engine = BigQueryEngine(client, translation_cache, result_cache, model=OPENAI_MODEL, temperature=OPENAI_TEMPERATURE,
+                        query_timeout=QUERY_TIMEOUT_SECONDS, row_limit=QUERY_ROW_LIMIT, maximum_bytes_billed=MAXIMUM_BYTES_BILLED,
+                        export_page_size=EXPORT_PAGE_SIZE, storage_read_enabled=STORAGE_READ_ENABLED,
+                        storage_read_min_rows=STORAGE_READ_MIN_ROWS, repair_attempts=QUERY_REPAIR_ATTEMPTS,
+                        schema_linking_top_k=SCHEMA_LINKING_TOP_K, schema_token_budget=SCHEMA_TOKEN_BUDGET)
+
 # Global variables to store dataset name and project ID
 global_dataset_name = ""
 global_project_id = ""
 
-# Function to execute the SQL query on BigQuery and return the results
-def execute_query(sql_query):
+# Function to switch the Storage Read API fast path on or off
+def toggle_storage_read():
     """
-    Executes a SQL query on Google BigQuery using the provided dataset name and project ID.
+    Enables or disables reading large results with the BigQuery Storage Read API.
+    """
+    engine.storage_read_enabled = storage_read_enabled.get()
 
-    Parameters:
-    - sql_query: The SQL query to execute.
+# Function to cancel the running queries
+def on_cancel():
+    """
+    Cancels every running query job.
+    """
+    engine.cancel()
 
-    Returns:
-    - A list of dictionaries containing the query results, or None if an error occurs.
+# Function to change the query time and row limits
+def set_query_limits():
     """
-    global global_dataset_name, global_project_id
-    
-    client = bigquery.Client(project=global_project_id)
-    sql_query = sql_query.replace("{dataset_name}", global_dataset_name).replace("{project_id}", global_project_id)
-    print(f"Executing query: {sql_query}")  # Debug print
-    
-    try:
-        query_job = client.query(sql_query)
-        results = query_job.result()
-        result_list = []
-
-        for row in results:
-            result_list.append(dict(row))  # Convert each row to a dictionary
-
-        return result_list
-    except Exception as e:
-        # Handle errors and display appropriate messages
-        error_message = str(e)
-        if "invalidQuery" in error_message:
-            messagebox.showerror("Query Error", "There was an error with the SQL query: Please check the syntax and try again.")
-        elif "notFound" in error_message:
-            messagebox.showerror("Not Found", "The specified dataset or table was not found: Please check the names and try again.")
-        else:
-            messagebox.showerror("Error", f"An unexpected error occurred: {e}")
-        return None
+    Asks the user for the query timeout, the row limit, the maximum bytes billed and the number
+    of translations tried per question.
+    """
+    timeout = simpledialog.askinteger("Query Limits", "Query timeout in seconds:", initialvalue=engine.query_timeout, minvalue=1)
+    if timeout:
+        engine.query_timeout = timeout
+    row_limit = simpledialog.askinteger("Query Limits", "Maximum number of rows:", initialvalue=engine.row_limit, minvalue=1)
+    if row_limit:
+        engine.row_limit = row_limit
+    gib_billed = simpledialog.askinteger("Query Limits", "Maximum GiB billed per query:", initialvalue=engine.maximum_bytes_billed // 1024 ** 3, minvalue=1)
+    if gib_billed:
+        engine.maximum_bytes_billed = gib_billed * 1024 ** 3
+    repair_attempts = simpledialog.askinteger("Query Limits", "Translations tried per question (1 disables automatic repair):",
+                                              initialvalue=engine.repair_attempts, minvalue=1, maxvalue=10)
+    if repair_attempts:
+        engine.repair_attempts = repair_attempts
+
+# Function to display an error raised while executing a query
+def show_query_error(e):
+    """
+    Displays an appropriate message for an error raised by BigQueryEngine.execute_query.
+
+    Parameters:
+    - e: The exception raised.
+    """
+    error_message = str(e)
+    if isinstance(e, QueryCancelledError):
+        messagebox.showinfo("Query Cancelled", error_message)
+    elif isinstance(e, TimeoutError):
+        messagebox.showerror("Query Timeout", error_message)
+    elif "bytesBilledLimitExceeded" in error_message or "limit for bytes billed" in error_message:
+        messagebox.showerror("Query Too Expensive", f"The query would bill more than {format_bytes(engine.maximum_bytes_billed)} and was not run. "
+                             "Add filters to the query or raise the limit in Query Limits.")
+    elif "invalidQuery" in error_message:
+        messagebox.showerror("Query Error", "There was an error with the SQL query: Please check the syntax and try again.")
+    elif "notFound" in error_message:
+        messagebox.showerror("Not Found", "The specified dataset or table was not found: Please check the names and try again.")
+    else:
+        messagebox.showerror("Error", f"An unexpected error occurred: {e}")
 
 # Function to handle the execution of the latest SQL query
 def on_execute():
     """
-    Executes the latest SQL query using the provided dataset name and project ID, 
-    and displays the results in the UI.
+    Executes the latest SQL query in the background using the provided dataset name and project ID.
+    A dry run first estimates the bytes processed (see confirm_query_cost) and tells whether the
+    cached results of the query are still fresh; the results are displayed by show_query_results
+    once the query finishes, or straight away when they come from the result cache.
     """
-    global global_dataset_name, global_project_id
+    global global_dataset_name, global_project_id, streaming_to_view
     global_dataset_name = dataset_entry.get().strip()
     global_project_id = project_entry.get().strip()
 
     if not global_dataset_name or not global_project_id:
         messagebox.showerror("Error", "Please provide both Dataset Name and Project ID.")
         return
+    if not check_query(latest_sql_query):
+        return
 
-    global latest_sql_query, latest_result_list, showing_results  # Access the global variables
-    result_list = execute_query(latest_sql_query)
-    
-    if result_list:
-        latest_result_list = result_list  # Store the result for toggling
-        display_results(result_list)
+    streaming_to_view = False  # The rest of a streamed translation must not replace the results
+    sql_query, project_id, dataset_name = latest_sql_query, global_project_id, global_dataset_name
+    worker.submit("Estimating query cost", engine.estimate_query_cost, sql_query, project_id, dataset_name,
+                  on_success=lambda estimate: confirm_query_cost(estimate, sql_query, project_id, dataset_name),
+                  on_error=lambda e: on_execute_error(e, sql_query))
+
+# Function to handle an error raised while estimating or executing a query
+def on_execute_error(e, sql_query):
+    """
+    Handles an error raised by the dry run or the execution of a query. Errors in the query
+    itself are sent back to the model, and the repaired query is shown for review; other
+    errors are displayed.
+
+    Parameters:
+    - e: The exception raised.
+    - sql_query: The query that failed.
+    """
+    error_message = query_error_message(e)
+    user_query = user_input.get()
+    if error_message is None or not user_query:
+        show_query_error(e)
+        return
+    database_schema = engine.schema_to_text(engine.relevant_schema(user_query))
+    worker.submit("Repairing query", translate_and_check, user_query, database_schema, global_project_id, global_dataset_name,
+                  None, (sql_query, error_message),
+                  on_success=lambda result: show_translation(result, repairing_failed_query=True), on_error=show_translation_error)
+
+# Function to validate a query before sending it to BigQuery
+def check_query(sql_query):
+    """
+    Validates a query locally before it is executed (see validate_sql), saving a round trip to
+    BigQuery for queries that would fail. Queries that are not a single read-only SELECT are
+    refused; references to tables or columns missing from the schema are shown and the user
+    decides whether to run the query anyway.
+
+    Parameters:
+    - sql_query: The SQL query to validate.
+
+    Returns:
+    - True if the query can be executed.
+    """
+    errors, warnings = validate_sql(sql_query, engine.schema, dialect="bigquery")
+    if errors:
+        messagebox.showerror("Invalid Query", "The query was not executed:\n\n" + "\n".join(f"- {error}" for error in errors))
+        return False
+    if warnings:
+        return messagebox.askyesno("Check Query", "\n".join(f"- {warning}" for warning in warnings) + "\n\nRun the query anyway?", icon="warning")
+    return True
+
+# Function to check the estimated cost of a query before running it
+def confirm_query_cost(estimate, sql_query, project_id, dataset_name):
+    """
+    Runs the query if its estimated cost is acceptable, unless its results are cached.
+
+    Queries that would process more than the maximum bytes billed are not run. The user is asked to
+    confirm queries that process more than COST_CONFIRM_BYTES or read a partitioned table
+    without filtering on its partition column; other queries run straight away.
+
+    Parameters:
+    - estimate: The estimate returned by BigQueryEngine.estimate_query_cost.
+    - sql_query, project_id, dataset_name: The query to run and where to run it.
+    """
+    if estimate["cached_result"] is not None:
+        show_query_results(estimate["cached_result"], sql_query, from_cache=True)
+        return
+
+    bytes_processed = estimate["bytes_processed"]
+    summary = f"This query will process {format_bytes(bytes_processed)} (estimated cost ${estimate['estimated_cost']:.2f})."
+    if bytes_processed > engine.maximum_bytes_billed:
+        messagebox.showerror("Query Too Expensive", f"{summary}\n\nThis is more than the limit of {format_bytes(engine.maximum_bytes_billed)} "
+                             "billed per query, so it was not run. Add filters to the query or raise the limit in Query Limits.")
+        return
+
+    warnings = [f"- {table} is partitioned but the query does not filter on its partition column, so every partition is scanned."
+                for table in estimate["unfiltered_partitioned_tables"]]
+    if warnings or bytes_processed > COST_CONFIRM_BYTES:
+        message = "\n\n".join([summary] + (["\n".join(warnings)] if warnings else []) + ["Run the query?"])
+        if not messagebox.askyesno("Confirm Query Cost", message, icon="warning"):
+            return
+
+    worker.submit(f"Executing query ({format_bytes(bytes_processed)} to process)", engine.execute_query, sql_query, project_id, dataset_name,
+                  estimate["cache_key"], on_success=lambda result: show_query_results(result, sql_query),
+                  on_error=lambda e: on_execute_error(e, sql_query))
+
+# Function to display the results of a finished query
+def show_query_results(result, sql_query, from_cache=False):
+    """
+    Displays the results of a finished query and enables the export and toggle buttons.
+
+    Parameters:
+    - result: The QueryResult returned by BigQueryEngine.execute_query.
+    - sql_query: The executed SQL query, which the latest translation may have replaced meanwhile.
+    - from_cache: Whether the results were read from the result cache instead of running the query.
+    """
+    global latest_result, latest_executed_query, showing_results  # Access the global variables
+    if result:
+        latest_result = result  # Store the result for toggling
+        latest_executed_query = sql_query
+        display_results(result)
 
         # Enable the export results button and bind the context menu
         export_results_button.config(state="normal")
-        export_results_button.bind("<Button-1>", lambda event: show_export_menu(event, result_list))
+        export_results_button.bind("<Button-1>", lambda event: show_export_menu(event, result))
 
         # Enable the toggle view button and set the initial state
         toggle_view_button.config(state="normal", text="Switch")
         showing_results = True  # Set to True initially after execution, so it toggles to query first
 
+        cache_note = " from the result cache" if from_cache else ""
+        if result.truncated:
+            status_label.config(text=f"Showing the first {len(result)} rows{cache_note} (row limit reached)")
+        elif from_cache:
+            status_label.config(text=f"Showing {len(result)} rows{cache_note}")
+
 # Function to display the query results in the UI
-def display_results(result_list):
+def display_results(result):
     """
-    Displays the query results in the text area.
+    Displays the query results in the results grid, in place of the query text.
+    Only the visible rows are rendered.
 
     Parameters:
-    - result_list: The list of dictionaries containing the query results.
-    """
-    if result_list:
-        result_output.config(state="normal")
-        result_output.delete("1.0", tk.END)
-        
-        columns = result_list[0].keys()  # Extract column names from the first row
-        result_output.insert(tk.END, "\t".join(columns) + "\n")
-        
-        for row in result_list:
-            row_values = [str(row[column]) for column in columns]
-            result_output.insert(tk.END, "\t".join(row_values) + "\n")
-        
-        result_output.config(state="disabled")
-
-# Function to export query results as a CSV file
-def export_results_as_csv(result_list):
-    """
-    Exports the query results as a CSV file.
+    - result: The QueryResult containing the query results.
+    """
+    if result:
+        result_output.grid_remove()
+        result_grid.grid()
+        result_grid.show(result)
 
-    Parameters:
-    - result_list: The list of dictionaries containing the query results.
+# Function to show how many rows an export has written so far
+def show_export_progress(row_count):
     """
-    if not result_output.get("1.0", tk.END).strip():
-        messagebox.showwarning("No Results", "There are no results to export")
-        return
-    
-    file_path = filedialog.asksaveasfilename(defaultextension=".csv", filetypes=[("CSV files", "*.csv")])
-    if file_path:
-        with open(file_path, 'w', newline='') as f:
-            writer = csv.writer(f)
-            columns = result_list[0].keys()
-            writer.writerow(columns)  # Write the header row
-            
-            for row in result_list:
-                writer.writerow([row[column] for column in columns])
-        
-        messagebox.showinfo("Success", "Results exported as CSV successfully")
+    Shows the number of rows written by the running export in the status line.
+    """
+    status_label.config(text=f"Exporting... {row_count} rows written")
 
-# Function to export query results as a JSON file
-def export_results_as_json(result_list):
+# Function to export query results in one of the EXPORT_FORMATS
+def export_results(result, export_format):
     """
-    Exports the query results as a JSON file.
+    Exports the query results in the background. The rows are read again from the query job's
+    results page by page and streamed to the file, so exports are not limited by the row limit
+    or by the available memory. CSV and JSON files whose name ends with .gz are compressed with gzip.
+    Parquet and Arrow files keep the column types, including nested RECORD and REPEATED columns.
 
     Parameters:
-    - result_list: The list of dictionaries containing the query results.
+    - result: The QueryResult containing the query results.
+    - export_format: A key of EXPORT_FORMATS (CSV, JSON, NDJSON, Parquet or Arrow).
     """
-    if not result_output.get("1.0", tk.END).strip():
+    if not latest_result:
         messagebox.showwarning("No Results", "There are no results to export")
         return
     
-    file_path = filedialog.asksaveasfilename(defaultextension=".json", filetypes=[("JSON files", "*.json")])
+    write_export, extension = EXPORT_FORMATS[export_format]
+    filetypes = [(f"{export_format} files", f"*{extension}")]
+    if export_format not in TYPED_EXPORT_FORMATS:
+        filetypes.append((f"Compressed {export_format} files", f"*{extension}.gz"))
+    file_path = filedialog.asksaveasfilename(defaultextension=extension, filetypes=filetypes)
     if file_path:
-        with open(file_path, 'w') as f:
-            json.dump(result_list, f, indent=4)  # Export the list of dictionaries as JSON with indentation
-        
-        messagebox.showinfo("Success", "Results exported as JSON successfully")
+        export_args = [file_path, lambda row_count: worker.run_on_main_thread(show_export_progress, row_count)]
+        schemas = []
+        if export_format in TYPED_EXPORT_FORMATS and result.source is not None:
+            # Map the BigQuery column types (these formats are only offered when pyarrow is installed)
+            from arrow_types import bigquery_arrow_schema
+            export_args.append(lambda columns: bigquery_arrow_schema(schemas[0]))
+        if result.source is not None:
+            batches = engine.stream_job_results(*result.source, on_schema=schemas.append)
+        else:
+            batches = ((result.columns, rows) for rows in result.iter_batches())
+        worker.submit(f"Exporting {export_format}", write_export, batches, *export_args,
+                      on_success=lambda row_count: messagebox.showinfo("Success", f"{row_count} rows exported as {export_format} successfully"),
+                      on_error=show_query_error)
 
-# Function to show the export options (CSV/JSON) as a context menu
-def show_export_menu(event, result_list):
+# Function to show the export options as a context menu
+def show_export_menu(event, result):
     """
-    Displays a context menu with options to export the query results as CSV or JSON.
+    Displays a context menu with the export formats.
 
     Parameters:
     - event: The event object containing details about the context menu event.
-    - result_list: The list of dictionaries containing the query results.
+    - result: The QueryResult containing the query results.
     """
     export_menu = Menu(root, tearoff=0)
-    export_menu.add_command(label="Export as CSV", command=lambda: export_results_as_csv(result_list))
-    export_menu.add_command(label="Export as JSON", command=lambda: export_results_as_json(result_list))
+    for export_format in EXPORT_FORMATS:
+        export_menu.add_command(label=f"Export as {export_format}", command=lambda export_format=export_format: export_results(result, export_format))
     export_menu.post(event.x_root, event.y_root)
 
 # Function to populate the schema Treeview with tables and columns
@@ -169,7 +333,7 @@ def populate_treeview():
     """
     for item in schema_tree.get_children():
         schema_tree.delete(item)
-    for table, columns in schema.items():
+    for table, columns in engine.schema.items():
         table_id = schema_tree.insert('', 'end', text=table)
         add_columns_to_treeview(table_id, columns)
 
@@ -203,7 +367,7 @@ def show_tables():
     tree.heading("Mode", text="Mode")
     tree.pack(fill=tk.BOTH, expand=True)
 
-    for table, columns in schema.items():
+    for table, columns in engine.schema.items():
         table_id = tree.insert("", "end", text=table, values=(table, "", ""))
         for col in columns:
             if col[1] == 'RECORD':
@@ -236,7 +400,7 @@ def save_schema():
     file_path = filedialog.asksaveasfilename(defaultextension=".json", filetypes=[("JSON files", "*.json")])
     if file_path:
         with open(file_path, 'w') as f:
-            json.dump(schema, f)
+            json.dump(engine.schema, f)
         messagebox.showinfo("Success", "Schema saved successfully")
 
 # Function to load a schema from a JSON file and update the UI
@@ -248,11 +412,10 @@ def load_schema():
     if file_path:
         with open(file_path, 'r') as f:
             loaded_schema = json.load(f)
-            global schema
-            schema = loaded_schema
+            engine.set_schema(loaded_schema)
             schema_display.config(state='normal')
             schema_display.delete("1.0", tk.END)
-            schema_display.insert(tk.END, schema_to_text(schema))
+            schema_display.insert(tk.END, engine.schema_to_text(engine.schema))
             schema_display.config(state='disabled')
             populate_treeview()
         messagebox.showinfo("Success", "Schema loaded successfully")
@@ -260,9 +423,9 @@ def load_schema():
 def fetch_schema():
     """
     Fetches the schema of all tables in the specified dataset from Google BigQuery
-    and updates the UI with the fetched schema.
+    in the background. The UI is updated by on_schema_fetched once it is loaded.
     """
-    global global_dataset_name, global_project_id, schema
+    global global_dataset_name, global_project_id
     global_dataset_name = dataset_entry.get().strip()
     global_project_id = project_entry.get().strip()
 
@@ -270,69 +433,141 @@ def fetch_schema():
         messagebox.showerror("Error", "Please provide both Dataset Name and Project ID.")
         return
 
-    client = bigquery.Client(project=global_project_id)
-    dataset_ref = client.dataset(global_dataset_name)
-    schema = {}
-
-    try:
-        tables = client.list_tables(dataset_ref)
-        for table in tables:
-            table_ref = dataset_ref.table(table.table_id)
-            table_obj = client.get_table(table_ref)
-            schema[table.table_id] = [
-                (field.name, field.field_type, field.mode, []) if field.field_type != 'RECORD' else
-                (field.name, field.field_type, field.mode, [(subfield.name, subfield.field_type, subfield.mode) for subfield in field.fields])
-                for field in table_obj.schema
-            ]
-        
-        # Update the UI with the fetched schema
-        schema_display.config(state='normal')
-        schema_display.delete("1.0", tk.END)
-        schema_display.insert(tk.END, schema_to_text(schema))
-        schema_display.config(state='disabled')
-        populate_treeview()
+    worker.submit("Fetching schema", load_dataset_schema, global_project_id, global_dataset_name,
+                  on_success=on_schema_fetched,
+                  on_error=lambda e: messagebox.showerror("Error", f"An error occurred while fetching the schema: {e}"))
+
+# Function to update the UI with a fetched schema
+def on_schema_fetched(result):
+    """
+    Replaces the current schema with a fetched one and updates the UI.
+
+    Parameters:
+    - result: The tuple returned by load_dataset_schema.
+    """
+    dataset_schema, index, refreshed_count = result
+    engine.set_schema(dataset_schema, index)
 
-        messagebox.showinfo("Success", "Schema fetched successfully")
+    # Update the UI with the fetched schema
+    schema_display.config(state='normal')
+    schema_display.delete("1.0", tk.END)
+    schema_display.insert(tk.END, engine.schema_to_text(engine.schema))
+    schema_display.config(state='disabled')
+    populate_treeview()
 
-    except Exception as e:
-        messagebox.showerror("Error", f"An error occurred while fetching the schema: {e}")
+    messagebox.showinfo("Success", f"Schema fetched successfully ({refreshed_count} of {len(dataset_schema)} tables refreshed)")
 
 # Function to handle the submission of a user query
 def on_submit():
     """
-    Handles the submission of a user query, translates it to SQL, and displays the result.
+    Handles the submission of a user query and translates it to SQL in the background.
+    The result is displayed by show_translation.
     """
-    global latest_sql_query, latest_explanation  # Store the query and explanation for toggling
     user_query = user_input.get()
-    database_schema = schema_to_text(schema)
+    database_schema = engine.schema_to_text(engine.relevant_schema(user_query))
     if not database_schema:
         messagebox.showerror("Error", "Please enter the database schema.")
         return
-    sql_query, explanation = translate_to_sql(user_query, database_schema)
-    latest_sql_query = sql_query
-    latest_explanation = explanation
-    display_query()
+    worker.submit("Translating question", translate_and_check, user_query, database_schema,
+                  project_entry.get().strip(), dataset_entry.get().strip(),
+                  on_success=show_translation, on_error=show_translation_error)
+
+# Function to display a finished translation
+def show_translation(result, repairing_failed_query=False):
+    """
+    Stores and displays a generated SQL query and its explanation.
+
+    Parameters:
+    - result: The (sql_query, explanation, attempts) tuple returned by translate_and_check.
+    - repairing_failed_query: Whether the query repairs a query that failed on execution.
+    """
+    global latest_sql_query, latest_explanation  # Store the query and explanation for toggling
+    latest_sql_query, latest_explanation, attempts = result
+    execute_button.config(state="normal")
+    if STREAM_MODEL_OUTPUT and result_grid.winfo_ismapped():
+        # The streamed query was executed before its check finished; keep its results in view
+        toggle_view_button.config(state="normal", text="Switch")
+    else:
+        display_query()
+        # Disable the toggle button initially until results are available
+        toggle_view_button.config(state="disabled", text="Switch")
+
+    # Report automatic repairs, or flag problems right away so the query can be refined before executing it
+    errors, warnings = validate_sql(latest_sql_query, engine.schema, dialect="bigquery")
+    repair_note = describe_attempts(attempts, repairing_failed_query)
+    if repair_note:
+        status_label.config(text=repair_note)
+    elif errors or warnings:
+        status_label.config(text=f"Check the query: {(errors + warnings)[0]}")
+
+# Function to display an error raised while translating a question
+def show_translation_error(e):
+    """
+    Displays an error raised while translating a question.
 
-    # Disable the toggle button initially until results are available
-    toggle_view_button.config(state="disabled", text="Switch")
+    Parameters:
+    - e: The exception raised.
+    """
+    execute_button.config(state="normal")
+    messagebox.showerror("Error", f"Failed to translate the question: {e}")
 
 # Function to display the generated SQL query and its explanation
 def display_query():
     """
-    Displays the generated SQL query and its explanation in the text area.
+    Displays the generated SQL query and its explanation in the text area, followed by the
+    executed query when the results were produced by another query (e.g. before a repair).
     """
+    result_grid.grid_remove()
+    result_output.grid()
     result_output.config(state="normal")
     result_output.delete("1.0", tk.END)
     result_output.insert(tk.END, f"SQL Query:\n{latest_sql_query}\n\nExplanation:\n{latest_explanation}")
+    if latest_result and latest_executed_query != latest_sql_query:
+        result_output.insert(tk.END, f"\n\nThe results are those of the previously executed query:\n{latest_executed_query}")
     result_output.config(state="disabled")
 
+# Function to display a translation while the model is still writing it
+def show_partial_translation(sql_text, explanation, sql_complete):
+    """
+    Displays the model output received so far while a translation is streamed. Executing is
+    disabled until the SQL part is complete; from then on the query can be validated, dry-run
+    and executed while the explanation is still being written and the query checked. Once the
+    query is executed, the rest of the output is no longer displayed, so that it does not
+    replace the results; show_translation stores the finished translation.
+
+    Parameters:
+    - sql_text: The SQL part received so far.
+    - explanation: The explanation received so far (empty until the SQL part is complete).
+    - sql_complete: Whether the SQL part is complete.
+    """
+    global latest_sql_query, latest_explanation
+    if not streaming_to_view:
+        return
+    result_grid.grid_remove()
+    result_output.grid()
+    result_output.config(state="normal")
+    result_output.delete("1.0", tk.END)
+    result_output.insert(tk.END, f"SQL Query:\n{sql_text}" + (f"\n\nExplanation:\n{explanation}" if sql_complete else ""))
+    result_output.config(state="disabled")
+
+    if not sql_complete:
+        execute_button.config(state="disabled")
+        return
+    latest_explanation = explanation
+    if str(execute_button["state"]) == "disabled":
+        latest_sql_query = engine.parse_response(sql_text)[0]
+        execute_button.config(state="normal")
+        errors, warnings = validate_sql(latest_sql_query, engine.schema, dialect="bigquery")
+        if errors or warnings:
+            status_label.config(text=f"Check the query: {(errors + warnings)[0]}")
+
 # Function to display the results of the latest query
 def display_results_view():
     """
     Displays the results of the latest SQL query in the text area.
     """
-    if latest_result_list:
-        display_results(latest_result_list)
+    if latest_result:
+        display_results(latest_result)
 
 # Function to toggle between displaying the query or the results
 def toggle_view():
@@ -349,19 +584,15 @@ def toggle_view():
 # Function to handle feedback submission for query refinement
 def on_feedback():
     """
-    Handles the submission of feedback to refine the generated SQL query.
+    Handles the submission of feedback to refine the generated SQL query in the background.
     """
     feedback = simpledialog.askstring("Feedback", "Please provide feedback to refine the query:")
     if feedback:
         user_query = user_input.get()
-        database_schema = schema_to_text(schema)
-        sql_query, explanation = translate_to_sql(user_query, database_schema, feedback)
-        latest_sql_query = sql_query
-        latest_explanation = explanation
-        display_query()
-
-        # Disable the toggle button until results are available
-        toggle_view_button.config(state="disabled", text="Switch")
+        database_schema = engine.schema_to_text(engine.relevant_schema(f"{user_query} {feedback}"))
+        worker.submit("Refining query", translate_and_check, user_query, database_schema,
+                      project_entry.get().strip(), dataset_entry.get().strip(), feedback,
+                      on_success=show_translation, on_error=show_translation_error)
 
 # Function to open the manual schema entry dialog
 def on_schema_entry():
@@ -370,11 +601,10 @@ def on_schema_entry():
     """
     dialog = SchemaEntryDialog(root)
     if dialog.schema:
-        global schema
-        schema.update(dialog.schema)
+        engine.update_schema(dialog.schema)
         schema_display.config(state="normal")
         schema_display.delete("1.0", tk.END)
-        schema_display.insert(tk.END, schema_to_text(schema))
+        schema_display.insert(tk.END, engine.schema_to_text(engine.schema))
         schema_display.config(state="disabled")
         populate_treeview()
 
@@ -409,98 +639,80 @@ def on_history_select(event, listbox):
         user_query, sql_query, explanation = query_history[index]
         user_input.delete(0, tk.END)
         user_input.insert(0, user_query)
-        global latest_sql_query, latest_explanation, latest_result_list, showing_results
+        global latest_sql_query, latest_explanation, latest_result, showing_results
         latest_sql_query = sql_query
         latest_explanation = explanation
-        latest_result_list = None
+        latest_result = None
 
         display_query()
         toggle_view_button.config(state="disabled", text="Switch")
         showing_results = False
 
-# Function to translate a natural language query into SQL using OpenAI's API
-def translate_to_sql(user_query, database_schema, feedback=None):
+# Function to translate a question and repair the query until its check passes
+def translate_and_check(user_query, database_schema, project_id, dataset_name, feedback=None, failed_query=None):
     """
-    Translates a natural language question into an SQL query using OpenAI.
+    Translates a question with BigQueryEngine.translate_and_check, which repairs the query while
+    the dry run rejects it, and adds the translation to the query history. Runs in a background thread;
+    with STREAM_MODEL_OUTPUT, the model output is displayed as it arrives by show_partial_translation.
 
     Parameters:
-    - user_query: The natural language question from the user.
-    - database_schema: The database schema to use for query generation.
-    - feedback: Optional feedback to refine the query.
+    - user_query, database_schema, feedback: See BigQueryEngine.translate_to_sql.
+    - project_id, dataset_name: Where the dry runs run.
+    - failed_query: Optional (sql_query, error_message) of a query that failed on execution.
 
     Returns:
-    - A tuple containing the SQL query and an explanation of the query.
+    - A tuple (sql_query, explanation, attempts).
     """
-    global latest_sql_query  
-    
-    prompt = f"""
-    You are an expert SQL query generator. Your role is to translate user natural language questions into SQL queries based on a given database schema provided by the user.
-    When giving the answer to the user, follow these rules:
-
-    - Use PostgreSQL syntax to write the SQL query.
-    - Provide the answer as only SQL query in correct format that is ready to be executed using Google BigQuery.
-    - Provide a brief explanation of the SQL query after the query itself. Write it in the following format: Explanation: [explanation itself]
-    - If no table or column satisfies the user's natural language request, return a message indicating that it is not possible to create a query.
-    - If feedback is provided, use it to refine the query.
-    - If a column's type is RECORD, the details/fields of the nested structure are given inside the consecutive parenthesis block. For example, the following is a valid syntax for columns with RECORD structure: details RECORD(price FLOAT MODE(NULLABLE), quantity INTEGER MODE(REQUIRED)) MODE(NULLABLE)
-    - If a column's type is RECORD and is REPEATED, use the UNNEST function to flatten the structure. Do not use JSON extraction syntax (->>).
-    - Access nested fields directly using the dot notation. For example, use details.price to access the price field within the details record.
-    - While providing the SQL query do not give it in comment block.
-    - When generating queries do not forget to use aliases.
-
-    The schema is provided in the following format:
-    - Each table is listed with its columns inside parentheses.
-    - Columns of type RECORD have their fields listed inside nested parentheses.
-    - Each column has its mode (NULLABLE or REQUIRED) specified.
-
-    Database Schema:
-    {database_schema}
-
-    Question:
-    {user_query}
-
-    Feedback:
-    {feedback if feedback else "None"}
-
-    SQL Query:
-    """
-    response = client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[
-            {"role": "system", "content": "You are an expert SQL query generator."},
-            {"role": "user", "content": prompt}
-        ],
-        max_tokens=200,
-        temperature=0.3,
-        stop=["SQL Query:"]
-    )
-    full_response = response.choices[0].message.content.strip()
-
-    sql_query = full_response.split("Explanation:")[0].strip()
-    explanation = full_response.split("Explanation:")[1].strip() if "Explanation:" in full_response else "No explanation provided."
-    
-    # Clean up the extracted SQL query
-    sql_query = sql_query.strip()
+    global streaming_to_view
+    on_progress = None
+    if STREAM_MODEL_OUTPUT:
+        streaming_to_view = True  # A new translation is displayed until its query is executed
+        on_progress = lambda *partial: worker.run_on_main_thread(show_partial_translation, *partial)
+    sql_query, explanation, attempts = engine.translate_and_check(user_query, database_schema, project_id, dataset_name,
+                                                                  feedback, failed_query, on_progress=on_progress)
+    update_query_history(user_query, sql_query, explanation)
+    return sql_query, explanation, attempts
+
+# Function to show the translation cache counters
+def show_translation_cache_stats():
+    """
+    Displays the translation cache hit and miss counters.
+    """
+    stats = translation_cache.stats()
+    messagebox.showinfo("Translation Cache", f"Hits: {stats['hits']}\nMisses: {stats['misses']}\nEntries: {stats['entries']}")
 
-    if sql_query.lower().startswith("sql"):
-        sql_query = sql_query[sql_query.lower().find("select"):].strip()
+# Function to show the automatic repair counters
+def show_repair_stats():
+    """
+    Displays how many translations were valid on the first try or repaired automatically.
+    """
+    messagebox.showinfo("Query Repair", engine.repair_stats.summary())
 
-    dataset_name = "{dataset_name}"
-    project_id = "{project_id}"
-    
-    table_names = re.findall(r'\b\w+\b', database_schema)
-    
-    for table_name in table_names:
-        qualified_name = f"`{project_id}.{dataset_name}.{table_name}`"
-        # Replace only standalone table names in the FROM clause and JOIN conditions
-        sql_query = re.sub(fr'(?i)\bFROM\s+{table_name}\b', f'FROM {qualified_name}', sql_query)
-        sql_query = re.sub(fr'(?i)\bJOIN\s+{table_name}\b', f'JOIN {qualified_name}', sql_query)
-        sql_query = re.sub(fr'(?i)\bJOIN\s+\b{table_name}\b', f'JOIN {qualified_name}', sql_query)
-
-    latest_sql_query = sql_query  # Update the global variable with the latest query
-    update_query_history(user_query, sql_query, explanation)  # Update query history
-    
-    return sql_query, explanation
+# Function to show the prompt token counters
+def show_prompt_stats():
+    """
+    Displays the prompt tokens sent to the model, the share served from the provider's prompt
+    cache, and how often the rendered schema text was reused.
+    """
+    builder = engine.prompt_builder
+    messagebox.showinfo("Prompt Tokens", f"{engine.prompt_stats.summary()}\nSchema texts reused: {builder.hits} (rendered {builder.misses})")
+
+# Function to show the result cache counters
+def show_result_cache_stats():
+    """
+    Displays the result cache hit and miss counters and its size on disk.
+    """
+    stats = result_cache.stats()
+    messagebox.showinfo("Result Cache", f"Hits: {stats['hits']}\nMisses: {stats['misses']}\nEntries: {stats['entries']}\n"
+                        f"Size: {format_bytes(stats['bytes'])} of {format_bytes(result_cache.max_bytes)}")
+
+# Function to empty the result cache
+def clear_result_cache():
+    """
+    Removes every cached query result, so that the next executions query BigQuery again.
+    """
+    if messagebox.askyesno("Result Cache", "Remove all cached query results?"):
+        result_cache.clear()
 
 # Function to update the query history with a new entry
 def update_query_history(user_query, sql_query, explanation):
@@ -524,32 +736,6 @@ def show_context_menu(event):
     """
     context_menu.post(event.x_root, event.y_root)
 
-# Function to convert the schema dictionary into a text representation
-def schema_to_text(schema):
-    """
-    Converts the internal schema dictionary into a text representation.
-
-    Parameters:
-    - schema: The schema dictionary to convert.
-
-    Returns:
-    - A string representing the schema in text format.
-    """
-    def columns_to_text(columns):
-        column_texts = []
-        for col in columns:
-            if col[1] == 'RECORD':
-                nested_text = columns_to_text(col[2])
-                column_texts.append(f"{col[0]} RECORD({nested_text}) MODE({col[3]})")
-            else:
-                column_texts.append(f"{col[0]} {col[1]} MODE({col[2]})")
-        return ', '.join(column_texts)
-
-    schema_text = "Tables:\n"
-    for table, columns in schema.items():
-        schema_text += f"- {table} ({columns_to_text(columns)})\n"
-    return schema_text
-
 # Function to open the JSON schema entry dialog and add the schema to the program
 def add_json_schema_as_text():
     """
@@ -557,11 +743,10 @@ def add_json_schema_as_text():
     """
     dialog = JSONSchemaDialog(root, title="Add JSON Schema")
     if dialog.schema:
-        global schema
-        schema.update(dialog.schema)
+        engine.update_schema(dialog.schema)
         schema_display.config(state='normal')
         schema_display.delete('1.0', tk.END)
-        schema_display.insert(tk.END, schema_to_text(schema))
+        schema_display.insert(tk.END, engine.schema_to_text(engine.schema))
         schema_display.config(state='disabled')
         populate_treeview()
 
@@ -750,11 +935,12 @@ class JSONSchemaDialog(simpledialog.Dialog):
             parsed_schema[table_name] = parse_fields(json_data)
         return parsed_schema
 
-# Initialize the global schema dictionary and other state variables
-schema = {}
-latest_result_list = []  # To store the results of the last executed query
+# Initialize the state variables
+latest_result = None  # QueryResult of the last executed query
 query_history = []  # To store the history of queries, explanations, and results
 showing_results = False  # Flag to track the current view state
+latest_executed_query = ""  # The SQL query whose results are shown, which a later translation may differ from
+streaming_to_view = True  # Whether a streamed translation is shown as it arrives, until its query is executed
 
 # Initialize the main application window
 root = tk.Tk()
@@ -798,6 +984,14 @@ context_menu.add_command(label="Show Tables", command=show_tables)
 context_menu.add_command(label="Save Schema", command=save_schema)
 context_menu.add_command(label="Load Schema", command=load_schema)
 context_menu.add_command(label="Fetch Schema from BigQuery", command=fetch_schema)  # Added Fetch Schema option
+context_menu.add_command(label="Translation Cache Stats", command=show_translation_cache_stats)
+context_menu.add_command(label="Result Cache Stats", command=show_result_cache_stats)
+context_menu.add_command(label="Query Repair Stats", command=show_repair_stats)
+context_menu.add_command(label="Prompt Token Stats", command=show_prompt_stats)
+context_menu.add_command(label="Clear Result Cache", command=clear_result_cache)
+context_menu.add_command(label="Query Limits...", command=set_query_limits)
+storage_read_enabled = tk.BooleanVar(value=STORAGE_READ_ENABLED)
+context_menu.add_checkbutton(label="Use Storage Read API for Large Results", variable=storage_read_enabled, command=toggle_storage_read)
 
 tk.Label(root, text="Enter your question:").grid(row=4, column=0, padx=5, pady=5, sticky="w")
 user_input = tk.Entry(root, width=70)
@@ -815,6 +1009,11 @@ tk.Label(root, text="Results:").grid(row=6, column=0, padx=5, pady=5, sticky="nw
 result_output = scrolledtext.ScrolledText(root, height=15, width=70, state="disabled")
 result_output.grid(row=6, column=1, padx=5, pady=5, sticky="nsew")
 
+# Grid showing the query results, in the same place as the query text
+result_grid = ResultGrid(root)
+result_grid.grid(row=6, column=1, padx=5, pady=5, sticky="nsew")
+result_grid.grid_remove()
+
 # Button to export query results
 export_results_button = tk.Button(root, text="Export Results", state="disabled")
 export_results_button.grid(row=7, column=0, padx=5, pady=5, sticky="w")
@@ -823,6 +1022,10 @@ export_results_button.grid(row=7, column=0, padx=5, pady=5, sticky="w")
 execute_button = tk.Button(root, text="Execute on Database", command=on_execute)
 execute_button.grid(row=7, column=1, padx=5, pady=5, sticky="e")
 
+# Button to cancel the running queries
+cancel_button = tk.Button(root, text="Cancel", command=on_cancel)
+cancel_button.grid(row=7, column=2, padx=5, pady=5, sticky="w")
+
 # Button to toggle between query and result views
 toggle_view_button = tk.Button(root, text="Switch", command=toggle_view, state="disabled")
 toggle_view_button.grid(row=8, column=1, padx=5, pady=5, sticky="e")
@@ -831,5 +1034,40 @@ toggle_view_button.grid(row=8, column=1, padx=5, pady=5, sticky="e")
 query_history_button = tk.Button(root, text="Query History", command=open_query_history)
 query_history_button.grid(row=8, column=0, padx=5, pady=5, sticky="w")
 
+# Status line showing the running background tasks
+status_label = tk.Label(root, text="")
+status_label.grid(row=9, column=0, columnspan=2, padx=5, pady=5, sticky="w")
+progress_bar = ttk.Progressbar(root, mode="indeterminate", length=150)
+progress_bar.grid(row=9, column=1, padx=5, pady=5, sticky="e")
+
+# Function to show the running background tasks
+def on_worker_busy(pending):
+    """
+    Shows which background tasks are running or queued.
+
+    Parameters:
+    - pending: The descriptions of the unfinished tasks, oldest first.
+    """
+    if pending:
+        queued = f" (+{len(pending) - 1} more)" if len(pending) > 1 else ""
+        status_label.config(text=f"{pending[0]}...{queued}")
+        progress_bar.start(10)
+    else:
+        status_label.config(text="")
+        progress_bar.stop()
+
+# Background worker running model calls, queries and schema fetches off the UI thread
+worker = BackgroundWorker(root, max_workers=WORKER_THREADS, on_busy_change=on_worker_busy)
+
+# Function to stop the background worker when the window is closed
+def on_close():
+    """
+    Stops the background worker and destroys the main window.
+    """
+    worker.shutdown()
+    root.destroy()
+
+root.protocol("WM_DELETE_WINDOW", on_close)
+
 # Start the Tkinter event loop
 root.mainloop()
\ No newline at end of file
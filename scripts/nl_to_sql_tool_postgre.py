@@ -3,22 +3,68 @@ from tkinter import simpledialog, scrolledtext, messagebox, ttk, filedialog, Men
 import psycopg2
 import json
 import re
-import csv
 import openai
 from openai import OpenAI
-from datetime import date
+from postgres_pool import PostgresConnectionPool
+from postgres_engine import PostgresEngine, QueryCancelledError, connection_key, load_postgres_schema
+from background_worker import BackgroundWorker
+from result_grid import ResultGrid
+from result_export import EXPORT_FORMATS, TYPED_EXPORT_FORMATS
+from result_cache import ResultCache
+from sql_validation import validate_sql
+from query_repair import describe_attempts
+from translation_cache import TranslationCache, TRANSLATION_CACHE_PATH
 
 # Initialize OpenAI client with API key
 client = OpenAI(api_key="your_openai_api_key")
 
+# Model settings used for every translation
+OPENAI_MODEL = "gpt-4o-mini"
+OPENAI_TEMPERATURE = 0.3
+STREAM_MODEL_OUTPUT = True  # Show the model output as it is generated instead of waiting for the complete response
 
-# Global variables to store connection details and schema
+# Cache of model responses, persisted across sessions
+translation_cache = TranslationCache(path=TRANSLATION_CACHE_PATH)
+
+# Results of executed queries, reused while the tables they read are unchanged
+RESULT_CACHE_MAX_BYTES = 1024 ** 3  # Least recently used results are evicted above this size on disk
+result_cache = ResultCache(max_bytes=RESULT_CACHE_MAX_BYTES)
+
+# Connection pool settings
+POOL_MIN_SIZE = 1
+POOL_MAX_SIZE = 5
+POOL_IDLE_TIMEOUT = 300  # Seconds before an idle connection above the minimum is closed
+
+# Query limits, adjustable from the context menu
+QUERY_TIMEOUT_SECONDS = 300  # Queries running longer than this are cancelled by the server
+QUERY_ROW_LIMIT = 100000  # Maximum number of rows fetched per query
+STREAM_BATCH_SIZE = 5000  # Rows fetched per round trip from the server-side cursor
+
+# Automatic repair of generated queries that EXPLAIN or the database rejects
+QUERY_REPAIR_ATTEMPTS = 3  # Translations tried per question, including the first one; 1 disables the repair
+
+# Number of model calls, queries and schema fetches that can run at the same time
+WORKER_THREADS = 4
+
+# Schema linking settings
+SCHEMA_LINKING_TOP_K = 8  # Number of best matching tables sent to the model
+SCHEMA_TOKEN_BUDGET = 3000  # Maximum estimated prompt tokens spent on the schema
+
+# Translates questions and runs queries; holds the schema and the query limits, which start at the settings above
+engine = PostgresEngine(client, translation_cache, result_cache, model=OPENAI_MODEL, temperature=OPENAI_TEMPERATURE,
+                        query_timeout=QUERY_TIMEOUT_SECONDS, row_limit=QUERY_ROW_LIMIT, stream_batch_size=STREAM_BATCH_SIZE,
+                        repair_attempts=QUERY_REPAIR_ATTEMPTS, schema_linking_top_k=SCHEMA_LINKING_TOP_K,
+                        schema_token_budget=SCHEMA_TOKEN_BUDGET)
+
+# Global variables to store connection details
 postgres_connection_details = {}
-schema = {}
-latest_result_list = []  # To store the results of the last executed query
+connection_pool = None  # Shared pool of connections for the current connection details
+latest_result = None  # QueryResult of the last executed query
 query_history = []  # To store the history of queries, explanations, and results
 showing_results = False  # Flag to track the current view state
 latest_sql_query = ""  # Store the latest SQL query
+latest_executed_query = ""  # The SQL query whose results are shown, re-run when exporting
+streaming_to_view = True  # Whether a streamed translation is shown as it arrives, until its query is executed
 latest_explanation = ""  # Store the latest explanation
 latest_user_query = ""  # Store the latest user natural language query
 
@@ -206,135 +252,219 @@ class JSONSchemaDialog(simpledialog.Dialog):
             parsed_schema[table_name] = parse_fields(json_data)
         return parsed_schema
 
+def on_cancel():
+    """
+    Cancels the queries currently running on pooled connections.
+    """
+    engine.cancel()
 
-def execute_query(sql_query):
-    conn = get_postgres_connection()
-    try:
-        cursor = conn.cursor()
-        cursor.execute(sql_query)
-        results = cursor.fetchall()
-        columns = [desc[0] for desc in cursor.description]
-        result_list = [dict(zip(columns, row)) for row in results]
-        return result_list
-    except Exception as e:
-        error_message = str(e)
-        if "syntax error" in error_message:
-            messagebox.showerror("Query Error", "There was an error with the SQL query: Please check the syntax and try again.")
-        elif "relation" in error_message and "does not exist" in error_message:
-            messagebox.showerror("Not Found", "The specified table was not found: Please check the names and try again.")
-        else:
-            messagebox.showerror("Error", f"An unexpected error occurred: {e}")
-        return None
-
-def get_postgres_connection():
-    global postgres_connection_details
-    if not postgres_connection_details:
-        postgres_connection_details = {
-            'dbname': dbname_entry.get(),
-            'user': user_entry.get(),
-            'password': password_entry.get(),
-            'host': host_entry.get(),
-            'port': port_entry.get()
-        }
-    try:
-        conn = psycopg2.connect(**postgres_connection_details)
-        return conn
-    except Exception as e:
-        messagebox.showerror("Connection Error", f"Failed to connect to PostgreSQL: {str(e)}")
-        return None
+def set_query_limits():
+    """
+    Asks the user for the query timeout, the row limit and the number of translations tried per question.
+    """
+    timeout = simpledialog.askinteger("Query Limits", "Query timeout in seconds:", initialvalue=engine.query_timeout, minvalue=1)
+    if timeout:
+        engine.query_timeout = timeout
+    row_limit = simpledialog.askinteger("Query Limits", "Maximum number of rows:", initialvalue=engine.row_limit, minvalue=1)
+    if row_limit:
+        engine.row_limit = row_limit
+    repair_attempts = simpledialog.askinteger("Query Limits", "Translations tried per question (1 disables automatic repair):",
+                                              initialvalue=engine.repair_attempts, minvalue=1, maxvalue=10)
+    if repair_attempts:
+        engine.repair_attempts = repair_attempts
+
+def show_query_error(e):
+    """
+    Displays an error raised while executing a query.
+    """
+    error_message = str(e)
+    if isinstance(e, QueryCancelledError):
+        messagebox.showinfo("Query Cancelled", error_message)
+    elif isinstance(e, TimeoutError):
+        messagebox.showerror("Query Timeout", error_message)
+    elif isinstance(e, psycopg2.OperationalError):
+        messagebox.showerror("Connection Error", f"Failed to connect to PostgreSQL: {error_message}")
+    elif "syntax error" in error_message:
+        messagebox.showerror("Query Error", "There was an error with the SQL query: Please check the syntax and try again.")
+    elif "relation" in error_message and "does not exist" in error_message:
+        messagebox.showerror("Not Found", "The specified table was not found: Please check the names and try again.")
+    else:
+        messagebox.showerror("Error", f"An unexpected error occurred: {e}")
+
+def get_connection_pool():
+    """
+    Returns the connection pool for the connection details entered in the UI,
+    creating it (and closing any pool for previous details) when needed.
+    Connections are only opened when the pool is first used.
+    """
+    global postgres_connection_details, connection_pool
+    details = {
+        'dbname': dbname_entry.get(),
+        'user': user_entry.get(),
+        'password': password_entry.get(),
+        'host': host_entry.get(),
+        'port': port_entry.get()
+    }
+    if connection_pool is not None and details == postgres_connection_details:
+        return connection_pool
+    if connection_pool is not None:
+        connection_pool.close()
+    postgres_connection_details = details
+    connection_pool = PostgresConnectionPool(
+        postgres_connection_details,
+        min_size=POOL_MIN_SIZE,
+        max_size=POOL_MAX_SIZE,
+        idle_timeout=POOL_IDLE_TIMEOUT,
+        readonly=True
+    )
+    return connection_pool
+
+def show_pool_stats():
+    """
+    Displays the connection pool usage counters.
+    """
+    if connection_pool is None:
+        messagebox.showinfo("Connection Pool", "No connection pool has been created yet.")
+        return
+    stats = connection_pool.stats()
+    messagebox.showinfo("Connection Pool", "\n".join(f"{key.replace('_', ' ').capitalize()}: {value}" for key, value in stats.items()))
 
 def fetch_postgres_schema():
-    conn = get_postgres_connection()
-    if conn:
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT table_name
-            FROM information_schema.tables
-            WHERE table_schema='public'
-        """)
-        tables = cursor.fetchall()
-        for table in tables:
-            cursor.execute(f"SELECT column_name, data_type FROM information_schema.columns WHERE table_name='{table[0]}'")
-            columns = cursor.fetchall()
-            schema[table[0]] = [(col[0], col[1]) for col in columns]
-        populate_treeview()
+    """
+    Fetches the columns and keys of all tables in the requested schemas in the background
+    and updates the UI with the fetched schema.
+
+    Table schemas are cached on disk per connection; only tables whose catalog fingerprint
+    changed since they were cached are fetched again.
+    """
+    pool = get_connection_pool()
+    schema_names = [name.strip() for name in schemas_entry.get().split(",") if name.strip()] or ["public"]
+    details = postgres_connection_details
+    cache_key = connection_key(details, ",".join(schema_names))
+    worker.submit("Fetching schema", load_postgres_schema, pool, schema_names, cache_key,
+                  on_success=on_schema_fetched,
+                  on_error=lambda e: messagebox.showerror("Error", f"An error occurred while fetching the schema: {e}"))
+
+def on_schema_fetched(result):
+    engine.set_schema_tables(*result)
+    populate_treeview()
+
+def check_query(sql_query):
+    """
+    Validates a query locally before it is executed (see validate_sql). Queries that are not a
+    single read-only SELECT are refused; references to tables or columns missing from the
+    schema are shown and the user decides whether to run the query anyway.
+
+    Returns:
+    - True if the query can be executed.
+    """
+    errors, warnings = validate_sql(sql_query, engine.schema, dialect="postgresql")
+    if errors:
+        messagebox.showerror("Invalid Query", "The query was not executed:\n\n" + "\n".join(f"- {error}" for error in errors))
+        return False
+    if warnings:
+        return messagebox.askyesno("Check Query", "\n".join(f"- {warning}" for warning in warnings) + "\n\nRun the query anyway?", icon="warning")
+    return True
 
 def on_execute():
-    global latest_sql_query, latest_result_list, showing_results
+    global latest_executed_query, streaming_to_view
+    if not check_query(latest_sql_query):
+        return
+    # Execute the latest refined SQL query in the background, showing rows as they arrive,
+    # unless its results are cached and the tables have not changed since
+    latest_executed_query = latest_sql_query
+    streaming_to_view = False  # The rest of a streamed translation must not replace the results
+    worker.submit("Executing query", engine.execute_cached_query, latest_sql_query, get_connection_pool(),
+                  lambda result: worker.run_on_main_thread(display_results, result),
+                  on_success=lambda outcome: show_query_results(*outcome), on_error=on_execute_error)
+
+def on_execute_error(e):
+    """
+    Handles an error raised while executing a query. Errors in the query itself (e.g. a wrong
+    cast found while reading the rows) are sent back to the model, and the repaired query is
+    shown for review; other errors are displayed.
+    """
+    if isinstance(e, (psycopg2.ProgrammingError, psycopg2.DataError)) and latest_user_query:
+        database_schema = engine.schema_to_text(engine.relevant_schema(latest_user_query))
+        failed_query = (latest_executed_query, str(e).strip())
+        worker.submit("Repairing query", translate_and_check, latest_user_query, database_schema, connection_pool, None, failed_query,
+                      on_success=lambda result: show_translation(result, repairing_failed_query=True), on_error=show_translation_error)
+    else:
+        show_query_error(e)
 
-    # Execute the latest refined SQL query
-    result_list = execute_query(latest_sql_query)
-    
-    if result_list:
-        latest_result_list = result_list
-        display_results(result_list)
+def show_query_results(result, from_cache=False):
+    global latest_result, showing_results
+    if result:
+        latest_result = result
+        display_results(result)
 
         # Enable export options
         export_results_button.config(state="normal")
-        export_results_button.bind("<Button-1>", lambda event: show_export_menu(event, result_list))
+        export_results_button.bind("<Button-1>", lambda event: show_export_menu(event, latest_executed_query))
 
         toggle_view_button.config(state="normal", text="Switch")
         showing_results = True
 
-def display_results(result_list):
-    if result_list:
-        result_output.config(state="normal")
-        result_output.delete("1.0", tk.END)
-        
-        columns = result_list[0].keys()  # Extract column names from the first row
-        result_output.insert(tk.END, "\t".join(columns) + "\n")
-        
-        for row in result_list:
-            row_values = [str(row[column]) for column in columns]
-            result_output.insert(tk.END, "\t".join(row_values) + "\n")
-        
-        result_output.config(state="disabled")
-
-def export_results_as_csv(result_list):
-    if not result_output.get("1.0", tk.END).strip():
-        messagebox.showwarning("No Results", "There are no results to export")
-        return
-    
-    file_path = filedialog.asksaveasfilename(defaultextension=".csv", filetypes=[("CSV files", "*.csv")])
-    if file_path:
-        with open(file_path, 'w', newline='') as f:
-            writer = csv.writer(f)
-            columns = result_list[0].keys()
-            writer.writerow(columns)  # Write the header row
-            
-            for row in result_list:
-                writer.writerow([row[column] for column in columns])
-        
-        messagebox.showinfo("Success", "Results exported as CSV successfully")
-
-def export_results_as_json(result_list):
-    if not result_output.get("1.0", tk.END).strip():
+        cache_note = " from the result cache" if from_cache else ""
+        if result.truncated:
+            status_label.config(text=f"Showing the first {len(result)} rows{cache_note} (row limit reached)")
+        elif from_cache:
+            status_label.config(text=f"Showing {len(result)} rows{cache_note}")
+
+def display_results(result):
+    """
+    Shows a result in the results grid, in place of the query text. Called again for the
+    same result while it is being streamed, to show the rows received so far.
+    """
+    if result:
+        result_output.grid_remove()
+        result_grid.grid()
+        result_grid.show(result)
+
+def show_export_progress(row_count):
+    status_label.config(text=f"Exporting... {row_count} rows written")
+
+def export_results(sql_query, export_format):
+    """
+    Exports the results of a query in the background. The query is run again and its rows are
+    streamed from a server-side cursor to the file, so exports are not limited by the row limit
+    or by the available memory. CSV and JSON files whose name ends with .gz are compressed with gzip.
+
+    Parameters:
+    - sql_query: The SQL query whose results are exported.
+    - export_format: A key of EXPORT_FORMATS (CSV, JSON, NDJSON, Parquet or Arrow).
+    """
+    if not latest_result:
         messagebox.showwarning("No Results", "There are no results to export")
         return
-    
-    file_path = filedialog.asksaveasfilename(defaultextension=".json", filetypes=[("JSON files", "*.json")])
-    if file_path:
-        # Convert any date objects to strings before dumping to JSON
-        def convert_dates(obj):
-            if isinstance(obj, date):
-                return obj.isoformat()
-            raise TypeError(f"Object of type {obj.__class__.__name__} is not JSON serializable")
-
-        with open(file_path, 'w') as f:
-            json.dump(result_list, f, default=convert_dates, indent=4)  # Export the list of dictionaries as JSON with indentation
-        
-        messagebox.showinfo("Success", "Results exported as JSON successfully")
 
-def show_export_menu(event, result_list):
+    write_export, extension = EXPORT_FORMATS[export_format]
+    filetypes = [(f"{export_format} files", f"*{extension}")]
+    if export_format not in TYPED_EXPORT_FORMATS:
+        filetypes.append((f"Compressed {export_format} files", f"*{extension}.gz"))
+    file_path = filedialog.asksaveasfilename(defaultextension=extension, filetypes=filetypes)
+    if file_path:
+        export_args = [file_path, lambda row_count: worker.run_on_main_thread(show_export_progress, row_count)]
+        descriptions = []
+        if export_format in TYPED_EXPORT_FORMATS:
+            # Parquet and Arrow files keep the PostgreSQL column types (these formats are only offered when pyarrow is installed)
+            from arrow_types import postgres_arrow_schema
+            export_args.append(lambda columns: postgres_arrow_schema(descriptions[0]))
+        batches = engine.stream_query(sql_query, get_connection_pool(), on_description=descriptions.append)
+        worker.submit(f"Exporting {export_format}", write_export, batches, *export_args,
+                      on_success=lambda row_count: messagebox.showinfo("Success", f"{row_count} rows exported as {export_format} successfully"),
+                      on_error=show_query_error)
+
+def show_export_menu(event, sql_query):
     export_menu = Menu(root, tearoff=0)
-    export_menu.add_command(label="Export as CSV", command=lambda: export_results_as_csv(result_list))
-    export_menu.add_command(label="Export as JSON", command=lambda: export_results_as_json(result_list))
+    for export_format in EXPORT_FORMATS:
+        export_menu.add_command(label=f"Export as {export_format}", command=lambda export_format=export_format: export_results(sql_query, export_format))
     export_menu.post(event.x_root, event.y_root)
 
 def populate_treeview():
     for item in schema_tree.get_children():
         schema_tree.delete(item)
-    for table, columns in schema.items():
+    for table, columns in engine.schema.items():
         table_id = schema_tree.insert('', 'end', text=table)
         add_columns_to_treeview(table_id, columns)
 
@@ -343,28 +473,80 @@ def add_columns_to_treeview(parent, columns):
         schema_tree.insert(parent, 'end', text=f"{col[0]} ({col[1]})")
 
 def on_submit():
-    global latest_sql_query, latest_explanation, latest_user_query
+    global latest_user_query
     latest_user_query = user_input.get()  # Store the original user query
-    database_schema = schema_to_text(schema)
+    database_schema = engine.schema_to_text(engine.relevant_schema(latest_user_query))
     if not database_schema:
         messagebox.showerror("Error", "Please enter the database schema.")
         return
-    sql_query, explanation = translate_to_sql(latest_user_query, database_schema)
-    latest_sql_query = sql_query
-    latest_explanation = explanation
-    display_query()
+    worker.submit("Translating question", translate_and_check, latest_user_query, database_schema, connection_pool,
+                  on_success=show_translation, on_error=show_translation_error)
+
+def show_translation(result, repairing_failed_query=False):
+    global latest_sql_query, latest_explanation
+    latest_sql_query, latest_explanation, attempts = result
+    execute_button.config(state="normal")
+    if STREAM_MODEL_OUTPUT and result_grid.winfo_ismapped():
+        # The streamed query was executed before its check finished; keep its results in view
+        toggle_view_button.config(state="normal", text="Switch")
+    else:
+        display_query()
+        toggle_view_button.config(state="disabled", text="Switch")
+
+    # Report automatic repairs, or flag problems right away so the query can be refined before executing it
+    errors, warnings = validate_sql(latest_sql_query, engine.schema, dialect="postgresql")
+    repair_note = describe_attempts(attempts, repairing_failed_query)
+    if repair_note:
+        status_label.config(text=repair_note)
+    elif errors or warnings:
+        status_label.config(text=f"Check the query: {(errors + warnings)[0]}")
 
-    toggle_view_button.config(state="disabled", text="Switch")
+def show_translation_error(e):
+    execute_button.config(state="normal")
+    messagebox.showerror("Error", f"Failed to translate the question: {e}")
 
 def display_query():
+    result_grid.grid_remove()
+    result_output.grid()
     result_output.config(state="normal")
     result_output.delete("1.0", tk.END)
     result_output.insert(tk.END, f"SQL Query:\n{latest_sql_query}\n\nExplanation:\n{latest_explanation}")
+    if latest_result and latest_executed_query != latest_sql_query:
+        # The results belong to another query, e.g. the query a repair or a refinement replaced
+        result_output.insert(tk.END, f"\n\nThe results are those of the previously executed query:\n{latest_executed_query}")
+    result_output.config(state="disabled")
+
+def show_partial_translation(sql_text, explanation, sql_complete):
+    """
+    Shows the model output received so far while a translation is streamed. Executing is disabled
+    until the SQL part is complete; from then on the query can be checked and executed while the
+    explanation is still being written and the query checked with EXPLAIN. Once the query is
+    executed, the rest of the output is no longer shown, so that it does not replace the results.
+    """
+    global latest_sql_query, latest_explanation
+    if not streaming_to_view:
+        return
+    result_grid.grid_remove()
+    result_output.grid()
+    result_output.config(state="normal")
+    result_output.delete("1.0", tk.END)
+    result_output.insert(tk.END, f"SQL Query:\n{sql_text}" + (f"\n\nExplanation:\n{explanation}" if sql_complete else ""))
     result_output.config(state="disabled")
 
+    if not sql_complete:
+        execute_button.config(state="disabled")
+        return
+    latest_explanation = explanation
+    if str(execute_button["state"]) == "disabled":
+        latest_sql_query = engine.parse_response(sql_text)[0]
+        execute_button.config(state="normal")
+        errors, warnings = validate_sql(latest_sql_query, engine.schema, dialect="postgresql")
+        if errors or warnings:
+            status_label.config(text=f"Check the query: {(errors + warnings)[0]}")
+
 def display_results_view():
-    if latest_result_list:
-        display_results(latest_result_list)
+    if latest_result:
+        display_results(latest_result)
 
 def toggle_view():
     global showing_results
@@ -375,58 +557,71 @@ def toggle_view():
     showing_results = not showing_results
 
 def on_feedback():
-    global latest_sql_query, latest_explanation, latest_user_query
-
     feedback = simpledialog.askstring("Feedback", "Please provide feedback to refine the query:")
     if feedback:
-        database_schema = schema_to_text(schema)
+        database_schema = engine.schema_to_text(engine.relevant_schema(f"{latest_sql_query} {feedback}"))
         # Use the latest SQL query instead of the original natural language query
-        sql_query, explanation = translate_to_sql(latest_sql_query, database_schema, feedback)
-        latest_sql_query = sql_query
-        latest_explanation = explanation
+        worker.submit("Refining query", translate_and_check, latest_sql_query, database_schema, connection_pool, feedback,
+                      on_success=show_refined_translation, on_error=show_translation_error)
 
-        # Display the updated SQL query and explanation
-        display_query()
+def show_refined_translation(result):
+    show_translation(result)
+    toggle_view_button.config(state="normal", text="Switch")
 
-        toggle_view_button.config(state="normal", text="Switch")
-
-        # Update UI to show refined query
-        result_output.config(state="normal")
-        result_output.delete("1.0", tk.END)
-        result_output.insert(tk.END, f"SQL Query:\n{latest_sql_query}\n\nExplanation:\n{latest_explanation}")
-        result_output.config(state="disabled")
-
-def translate_to_sql(user_query, database_schema, feedback=None):
-    prompt = f"""
-    You are an expert SQL query generator. Translate user questions into SQL queries based on the database schema provided.
-    - Use PostgreSQL syntax.
-    - Provide the SQL query in a format ready to be executed on PostgreSQL.
-    - Provide a brief explanation of the SQL query after the query itself. Write it in the following format: Explanation: [explanation itself]
-    - If no table or column satisfies the user's natural language request, return a message indicating that it is not possible to create a query.
-    - Access nested fields directly using the dot notation. For example, use details.price to access the price field within the details record.
-    - If feedback is provided, use it to refine the query. Specifically, adjust the SQL query to incorporate the feedback provided by the user.
-    - While providing the SQL query do not give it in comment block.
-    Schema: {database_schema}
-    Question: {user_query}
-    Feedback: {feedback if feedback else "None"}
-    SQL Query:
-    """
-    response = client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[{"role": "system", "content": "You are an expert SQL query generator."}, {"role": "user", "content": prompt}],
-        max_tokens=200,
-        temperature=0.3,
-        stop=["SQL Query:"]
-    )
-    full_response = response.choices[0].message.content.strip()
+def translate_and_check(user_query, database_schema, pool, feedback=None, failed_query=None):
+    """
+    Translates a question with PostgresEngine.translate_and_check, which repairs the query while
+    EXPLAIN rejects it, and adds the translation to the query history. Runs in a background thread;
+    with STREAM_MODEL_OUTPUT, the model output is shown as it arrives by show_partial_translation.
 
-    sql_query = full_response.split("Explanation:")[0].strip()
-    explanation = full_response.split("Explanation:")[1].strip() if "Explanation:" in full_response else "No explanation provided."
-    
-    sql_query = sql_query.strip()
-    
+    Returns:
+    - A tuple (sql_query, explanation, attempts).
+    """
+    global streaming_to_view
+    on_progress = None
+    if STREAM_MODEL_OUTPUT:
+        streaming_to_view = True  # A new translation is shown until its query is executed
+        on_progress = lambda *partial: worker.run_on_main_thread(show_partial_translation, *partial)
+    sql_query, explanation, attempts = engine.translate_and_check(user_query, database_schema, pool, feedback, failed_query,
+                                                                  on_progress=on_progress)
     update_query_history(user_query, sql_query, explanation)
-    return sql_query, explanation
+    return sql_query, explanation, attempts
+
+def show_translation_cache_stats():
+    """
+    Displays the translation cache hit and miss counters.
+    """
+    stats = translation_cache.stats()
+    messagebox.showinfo("Translation Cache", f"Hits: {stats['hits']}\nMisses: {stats['misses']}\nEntries: {stats['entries']}")
+
+def show_repair_stats():
+    """
+    Displays how many translations were valid on the first try or repaired automatically.
+    """
+    messagebox.showinfo("Query Repair", engine.repair_stats.summary())
+
+def show_prompt_stats():
+    """
+    Displays the prompt tokens sent to the model, the share served from the provider's prompt
+    cache, and how often the rendered schema text was reused.
+    """
+    builder = engine.prompt_builder
+    messagebox.showinfo("Prompt Tokens", f"{engine.prompt_stats.summary()}\nSchema texts reused: {builder.hits} (rendered {builder.misses})")
+
+def show_result_cache_stats():
+    """
+    Displays the result cache hit and miss counters and its size on disk.
+    """
+    stats = result_cache.stats()
+    messagebox.showinfo("Result Cache", f"Hits: {stats['hits']}\nMisses: {stats['misses']}\nEntries: {stats['entries']}\n"
+                        f"Size: {stats['bytes'] / 1024 ** 2:.1f} MiB of {result_cache.max_bytes / 1024 ** 2:.0f} MiB")
+
+def clear_result_cache():
+    """
+    Removes every cached query result.
+    """
+    if messagebox.askyesno("Result Cache", "Remove all cached query results?"):
+        result_cache.clear()
 
 def update_query_history(user_query, sql_query, explanation):
     query_history.append((user_query, sql_query, explanation))
@@ -434,29 +629,16 @@ def update_query_history(user_query, sql_query, explanation):
 def show_context_menu(event):
     context_menu.post(event.x_root, event.y_root)
 
-def schema_to_text(schema):
-    def columns_to_text(columns):
-        column_texts = []
-        for col in columns:
-            column_texts.append(f"{col[0]} {col[1]}")
-        return ', '.join(column_texts)
-
-    schema_text = "Tables:\n"
-    for table, columns in schema.items():
-        schema_text += f"- {table} ({columns_to_text(columns)})\n"
-    return schema_text
-
 def on_schema_entry():
     """
     Opens the manual schema entry dialog and updates the schema in the program.
     """
     dialog = SchemaEntryDialog(root)
     if dialog.schema:
-        global schema
-        schema.update(dialog.schema)
+        engine.update_schema(dialog.schema)
         schema_display.config(state="normal")
         schema_display.delete("1.0", tk.END)
-        schema_display.insert(tk.END, schema_to_text(schema))
+        schema_display.insert(tk.END, engine.schema_to_text(engine.schema))
         schema_display.config(state="disabled")
         populate_treeview()
 
@@ -466,11 +648,10 @@ def add_json_schema_as_text():
     """
     dialog = JSONSchemaDialog(root, title="Add JSON Schema")
     if dialog.schema:
-        global schema
-        schema.update(dialog.schema)
+        engine.update_schema(dialog.schema)
         schema_display.config(state='normal')
         schema_display.delete('1.0', tk.END)
-        schema_display.insert(tk.END, schema_to_text(schema))
+        schema_display.insert(tk.END, engine.schema_to_text(engine.schema))
         schema_display.config(state='disabled')
         populate_treeview()
 
@@ -487,7 +668,7 @@ def show_tables():
     tree.heading("Mode", text="Mode")
     tree.pack(fill=tk.BOTH, expand=True)
 
-    for table, columns in schema.items():
+    for table, columns in engine.schema.items():
         table_id = tree.insert("", "end", text=table, values=(table, "", ""))
         for col in columns:
             if col[1] == 'RECORD':
@@ -518,7 +699,7 @@ def save_schema():
     file_path = filedialog.asksaveasfilename(defaultextension=".json", filetypes=[("JSON files", "*.json")])
     if file_path:
         with open(file_path, 'w') as f:
-            json.dump(schema, f)
+            json.dump(engine.schema, f)
         messagebox.showinfo("Success", "Schema saved successfully")
 
 # Function to load a schema from a JSON file and update the UI
@@ -530,11 +711,10 @@ def load_schema():
     if file_path:
         with open(file_path, 'r') as f:
             loaded_schema = json.load(f)
-            global schema
-            schema = loaded_schema
+            engine.set_schema(loaded_schema)
             schema_display.config(state='normal')
             schema_display.delete("1.0", tk.END)
-            schema_display.insert(tk.END, schema_to_text(schema))
+            schema_display.insert(tk.END, engine.schema_to_text(engine.schema))
             schema_display.config(state='disabled')
             populate_treeview()
         messagebox.showinfo("Success", "Schema loaded successfully")
@@ -569,10 +749,10 @@ def on_history_select(event, listbox):
         user_query, sql_query, explanation = query_history[index]
         user_input.delete(0, tk.END)
         user_input.insert(0, user_query)
-        global latest_sql_query, latest_explanation, latest_result_list, showing_results
+        global latest_sql_query, latest_explanation, latest_result, showing_results
         latest_sql_query = sql_query
         latest_explanation = explanation
-        latest_result_list = None
+        latest_result = None
 
         display_query()
         toggle_view_button.config(state="disabled", text="Switch")
@@ -601,12 +781,17 @@ tk.Label(root, text="Database Name:").grid(row=4, column=0, padx=5, pady=5, stic
 dbname_entry = tk.Entry(root, width=50)
 dbname_entry.grid(row=4, column=1, padx=5, pady=5, sticky="ew")
 
+tk.Label(root, text="Schemas:").grid(row=5, column=0, padx=5, pady=5, sticky="w")
+schemas_entry = tk.Entry(root, width=50)
+schemas_entry.insert(0, "public")  # Comma-separated list of schemas to introspect
+schemas_entry.grid(row=5, column=1, padx=5, pady=5, sticky="ew")
+
 fetch_schema_button = tk.Button(root, text="Fetch Schema", command=fetch_postgres_schema)
-fetch_schema_button.grid(row=5, column=1, padx=5, pady=5, sticky="e")
+fetch_schema_button.grid(row=6, column=1, padx=5, pady=5, sticky="e")
 
-tk.Label(root, text="Database Schema:").grid(row=6, column=0, padx=5, pady=5, sticky="nw")
+tk.Label(root, text="Database Schema:").grid(row=7, column=0, padx=5, pady=5, sticky="nw")
 schema_tree = ttk.Treeview(root, height=10)
-schema_tree.grid(row=6, column=1, padx=5, pady=5, sticky="nsew")
+schema_tree.grid(row=7, column=1, padx=5, pady=5, sticky="nsew")
 
 # Create the hidden scrolledtext widget to retain the existing logic
 schema_display = scrolledtext.ScrolledText(root, height=10, width=70, state="disabled")
@@ -614,44 +799,89 @@ schema_display.grid(row=2, column=1, padx=5, pady=5, sticky="nsew")
 schema_display.grid_remove()  # Hide the widget
 
 add_schema_button = tk.Button(root, text="Add Schema", command=on_schema_entry)
-add_schema_button.grid(row=7, column=0, padx=5, pady=5, sticky="w")
+add_schema_button.grid(row=8, column=0, padx=5, pady=5, sticky="w")
 
 add_schema_button_JSON = tk.Button(root, text="Add Schema as JSON", command=add_json_schema_as_text)
-add_schema_button_JSON.grid(row=7, column=1, padx=5, pady=5, sticky="e")
+add_schema_button_JSON.grid(row=8, column=1, padx=5, pady=5, sticky="e")
 
 small_button = tk.Button(root, text="...")
-small_button.grid(row=7, column=2, padx=5, pady=5, sticky="e")
+small_button.grid(row=8, column=2, padx=5, pady=5, sticky="e")
 small_button.bind("<Button-1>", show_context_menu)
 
 context_menu = Menu(root, tearoff=0)
 context_menu.add_command(label="Show Tables", command=show_tables)
 context_menu.add_command(label="Save Schema", command=save_schema)
 context_menu.add_command(label="Load Schema", command=load_schema)
-
-tk.Label(root, text="Enter your question:").grid(row=8, column=0, padx=5, pady=5, sticky="w")
+context_menu.add_command(label="Connection Pool Stats", command=show_pool_stats)
+context_menu.add_command(label="Translation Cache Stats", command=show_translation_cache_stats)
+context_menu.add_command(label="Result Cache Stats", command=show_result_cache_stats)
+context_menu.add_command(label="Query Repair Stats", command=show_repair_stats)
+context_menu.add_command(label="Prompt Token Stats", command=show_prompt_stats)
+context_menu.add_command(label="Clear Result Cache", command=clear_result_cache)
+context_menu.add_command(label="Query Limits...", command=set_query_limits)
+
+tk.Label(root, text="Enter your question:").grid(row=9, column=0, padx=5, pady=5, sticky="w")
 user_input = tk.Entry(root, width=70)
-user_input.grid(row=8, column=1, padx=5, pady=5, sticky="ew")
+user_input.grid(row=9, column=1, padx=5, pady=5, sticky="ew")
 
 submit_button = tk.Button(root, text="Submit", command=on_submit)
-submit_button.grid(row=9, column=1, padx=5, pady=5, sticky="e")
+submit_button.grid(row=10, column=1, padx=5, pady=5, sticky="e")
 
 feedback_button = tk.Button(root, text="Provide Feedback", command=on_feedback)
-feedback_button.grid(row=9, column=0, padx=5, pady=5, sticky="w")
+feedback_button.grid(row=10, column=0, padx=5, pady=5, sticky="w")
 
-tk.Label(root, text="Results:").grid(row=10, column=0, padx=5, pady=5, sticky="nw")
+tk.Label(root, text="Results:").grid(row=11, column=0, padx=5, pady=5, sticky="nw")
 result_output = scrolledtext.ScrolledText(root, height=15, width=70, state="disabled")
-result_output.grid(row=10, column=1, padx=5, pady=5, sticky="nsew")
+result_output.grid(row=11, column=1, padx=5, pady=5, sticky="nsew")
+
+# Grid showing the query results, in the same place as the query text
+result_grid = ResultGrid(root)
+result_grid.grid(row=11, column=1, padx=5, pady=5, sticky="nsew")
+result_grid.grid_remove()
 
 export_results_button = tk.Button(root, text="Export Results", state="disabled")
-export_results_button.grid(row=11, column=0, padx=5, pady=5, sticky="w")
+export_results_button.grid(row=12, column=0, padx=5, pady=5, sticky="w")
 
 execute_button = tk.Button(root, text="Execute on Database", command=on_execute)
-execute_button.grid(row=11, column=1, padx=5, pady=5, sticky="e")
+execute_button.grid(row=12, column=1, padx=5, pady=5, sticky="e")
+
+cancel_button = tk.Button(root, text="Cancel", command=on_cancel)
+cancel_button.grid(row=12, column=2, padx=5, pady=5, sticky="w")
 
 toggle_view_button = tk.Button(root, text="Switch", command=toggle_view, state="disabled")
-toggle_view_button.grid(row=12, column=1, padx=5, pady=5, sticky="e")
+toggle_view_button.grid(row=13, column=1, padx=5, pady=5, sticky="e")
 
 query_history_button = tk.Button(root, text="Query History", command=open_query_history)
-query_history_button.grid(row=12, column=0, padx=5, pady=5, sticky="w")
+query_history_button.grid(row=13, column=0, padx=5, pady=5, sticky="w")
+
+status_label = tk.Label(root, text="")
+status_label.grid(row=14, column=0, columnspan=2, padx=5, pady=5, sticky="w")
+progress_bar = ttk.Progressbar(root, mode="indeterminate", length=150)
+progress_bar.grid(row=14, column=1, padx=5, pady=5, sticky="e")
+
+def on_worker_busy(pending):
+    """
+    Shows which background tasks are running or queued.
+    """
+    if pending:
+        queued = f" (+{len(pending) - 1} more)" if len(pending) > 1 else ""
+        status_label.config(text=f"{pending[0]}...{queued}")
+        progress_bar.start(10)
+    else:
+        status_label.config(text="")
+        progress_bar.stop()
+
+# Runs model calls, queries and schema fetches off the UI thread
+worker = BackgroundWorker(root, max_workers=WORKER_THREADS, on_busy_change=on_worker_busy)
+
+def on_close():
+    """
+    Stops the background worker and closes the pooled connections before destroying the main window.
+    """
+    worker.shutdown()
+    if connection_pool is not None:
+        connection_pool.close()
+    root.destroy()
 
+root.protocol("WM_DELETE_WINDOW", on_close)
 root.mainloop()
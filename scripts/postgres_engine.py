@@ -0,0 +1,558 @@
+import logging
+import threading
+import uuid
+
+import psycopg2
+from psycopg2 import extensions
+
+from postgres_pool import PoolTimeoutError
+from prompt_builder import PromptBuilder, PromptStats
+from query_result import QueryResult
+from query_repair import RepairStats, translate_with_repair
+from result_cache import ResultCache, called_functions, is_cacheable
+from schema_cache import connection_cache_key, load_cached_tables, save_cached_tables, stale_tables
+from schema_linking import SchemaLinker
+from schema_vector_index import open_schema_index
+from sql_translation import OPENAI_MODEL, OPENAI_TEMPERATURE, parse_translation, request_translation, stream_translation
+from sql_validation import validate_sql
+from translation_cache import TranslationCache
+
+# Messages of the engine go to logging rather than standard output, which the CLI writes its results to
+logger = logging.getLogger(__name__)
+
+# Query limits used when an engine is created without them
+QUERY_TIMEOUT_SECONDS = 300  # Queries running longer than this are cancelled by the server
+QUERY_ROW_LIMIT = 100000  # Maximum number of rows fetched per query
+STREAM_BATCH_SIZE = 5000  # Rows fetched per round trip from the server-side cursor
+QUERY_REPAIR_ATTEMPTS = 3  # Translations tried per question, including the first one; 1 disables the repair
+
+# Schema linking settings used when an engine is created without them
+SCHEMA_LINKING_TOP_K = 8  # Number of best matching tables sent to the model
+SCHEMA_TOKEN_BUDGET = 3000  # Maximum estimated prompt tokens spent on the schema
+
+# Catalog query returning every column of every table in the requested schemas,
+# together with its primary key flag and foreign key target, in a single round trip
+SCHEMA_INTROSPECTION_QUERY = """
+    WITH key_columns AS (
+        SELECT con.conrelid, con.contype, k.attnum, con.confrelid, con.confkey[k.ord] AS ref_attnum
+        FROM pg_catalog.pg_constraint con
+        CROSS JOIN LATERAL unnest(con.conkey) WITH ORDINALITY AS k(attnum, ord)
+        WHERE con.contype IN ('p', 'f')
+    )
+    SELECT n.nspname, c.relname, a.attnum, a.attname,
+           pg_catalog.format_type(a.atttypid, a.atttypmod), a.attnotnull,
+           kc.contype, rn.nspname, rc.relname, ra.attname
+    FROM pg_catalog.pg_class c
+    JOIN pg_catalog.pg_namespace n ON n.oid = c.relnamespace
+    JOIN pg_catalog.pg_attribute a ON a.attrelid = c.oid AND a.attnum > 0 AND NOT a.attisdropped
+    LEFT JOIN key_columns kc ON kc.conrelid = c.oid AND kc.attnum = a.attnum
+    LEFT JOIN pg_catalog.pg_class rc ON rc.oid = kc.confrelid
+    LEFT JOIN pg_catalog.pg_namespace rn ON rn.oid = rc.relnamespace
+    LEFT JOIN pg_catalog.pg_attribute ra ON ra.attrelid = kc.confrelid AND ra.attnum = kc.ref_attnum
+    WHERE c.relkind IN ('r', 'p', 'v', 'm', 'f')
+      AND NOT c.relispartition
+      AND n.nspname = ANY(%(schemas)s)
+      AND (%(oids)s::oid[] IS NULL OR c.oid = ANY(%(oids)s::oid[]))
+    ORDER BY n.nspname, c.relname, a.attnum
+"""
+
+# Catalog query returning a fingerprint per table that changes whenever the table,
+# its columns or its constraints are altered, used to detect stale cached schemas
+SCHEMA_FINGERPRINT_QUERY = """
+    SELECT n.nspname, c.relname, c.oid,
+           md5(c.oid::text || ':' || c.xmin::text
+               || ':' || COALESCE((SELECT string_agg(a.xmin::text, ',' ORDER BY a.attnum)
+                                   FROM pg_catalog.pg_attribute a WHERE a.attrelid = c.oid), '')
+               || ':' || COALESCE((SELECT string_agg(con.xmin::text, ',' ORDER BY con.oid)
+                                   FROM pg_catalog.pg_constraint con WHERE con.conrelid = c.oid), ''))
+    FROM pg_catalog.pg_class c
+    JOIN pg_catalog.pg_namespace n ON n.oid = c.relnamespace
+    WHERE c.relkind IN ('r', 'p', 'v', 'm', 'f')
+      AND NOT c.relispartition
+      AND n.nspname = ANY(%(schemas)s)
+    ORDER BY n.nspname, c.relname
+"""
+
+# Statistics query telling whether the results of a query may be cached: whether the server counts
+# writes (track_counts), whether a function named like one the query calls is volatile (e.g. nextval or a
+# user-defined function), and a digest of the write counters of every user table. The digest changes
+# when rows are inserted, updated or deleted, a table is truncated or rewritten (new relfilenode)
+# or the statistics of the database are reset
+RESULT_FRESHNESS_QUERY = """
+    SELECT current_setting('track_counts')::boolean,
+           EXISTS (SELECT 1 FROM pg_catalog.pg_proc p WHERE p.proname = ANY(%(functions)s::name[]) AND p.provolatile = 'v'),
+           md5(concat_ws(';',
+               (SELECT d.stats_reset FROM pg_catalog.pg_stat_database d WHERE d.datname = current_database()),
+               (SELECT COALESCE(string_agg(concat_ws(':', s.relid, c.relfilenode, s.n_tup_ins, s.n_tup_upd, s.n_tup_del, s.n_live_tup),
+                                           ',' ORDER BY s.relid), '')
+                FROM pg_catalog.pg_stat_user_tables s
+                JOIN pg_catalog.pg_class c ON c.oid = s.relid)))
+"""
+
+
+class QueryCancelledError(Exception):
+    """
+    Raised by execute_query when the user cancels the running query.
+    """
+
+
+def qualified_table_name(schema_name, table_name):
+    """
+    Returns the name used for a table in the schema dictionary and the prompt.
+    Tables in the public schema keep their bare name, others are schema-qualified.
+    """
+    return table_name if schema_name == "public" else f"{schema_name}.{table_name}"
+
+
+def build_schema_from_catalog(rows):
+    """
+    Builds the schema dictionary and the key information from the catalog query rows.
+
+    Parameters:
+    - rows: The rows returned by SCHEMA_INTROSPECTION_QUERY, ordered by table and column position.
+
+    Returns:
+    - A tuple (schema, keys) where schema maps table names to (column, type, mode) tuples in
+      column order, and keys maps table names to their primary key columns and foreign keys.
+    """
+    fetched_schema = {}
+    keys = {}
+    seen_columns = set()
+    for schema_name, table_name, attnum, column_name, data_type, not_null, contype, ref_schema, ref_table, ref_column in rows:
+        table = qualified_table_name(schema_name, table_name)
+        columns = fetched_schema.setdefault(table, [])
+        table_keys = keys.setdefault(table, {"primary_key": [], "foreign_keys": []})
+        # A column appears once per key constraint it takes part in
+        if (table, attnum) not in seen_columns:
+            seen_columns.add((table, attnum))
+            columns.append((column_name, data_type, "REQUIRED" if not_null else "NULLABLE"))
+        if contype == 'p':
+            table_keys["primary_key"].append(column_name)
+        elif contype == 'f' and ref_table:
+            table_keys["foreign_keys"].append((column_name, qualified_table_name(ref_schema, ref_table), ref_column))
+    return fetched_schema, keys
+
+
+def connection_key(details, *extra):
+    """
+    Returns the cache key identifying a database (and, with extra parts, e.g. the schema names,
+    what was read from it), see connection_cache_key.
+
+    Parameters:
+    - details: The connection details, with 'host', 'port', 'dbname' and 'user' keys.
+    """
+    return connection_cache_key("postgres", details['host'], details['port'], details['dbname'], details['user'], *extra)
+
+
+def load_postgres_schema(pool, schema_names, cache_key):
+    """
+    Loads the schema of the requested schemas, fetching only tables whose catalog fingerprint
+    changed since they were cached.
+
+    Returns:
+    - A tuple (tables, index) with the cache entries of every table and the updated schema index.
+    """
+    cached_tables = load_cached_tables(cache_key)
+    with pool.connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(SCHEMA_FINGERPRINT_QUERY, {"schemas": schema_names})
+        fingerprints = {}
+        oids = {}
+        for schema_name, table_name, oid, fingerprint in cursor.fetchall():
+            table = qualified_table_name(schema_name, table_name)
+            fingerprints[table] = fingerprint
+            oids[table] = oid
+        stale = stale_tables(cached_tables, fingerprints)
+        rows = []
+        if stale:
+            cursor.execute(SCHEMA_INTROSPECTION_QUERY, {"schemas": schema_names, "oids": [oids[table] for table in stale]})
+            rows = cursor.fetchall()
+        cursor.close()
+    fetched_schema, keys = build_schema_from_catalog(rows)
+    stale = set(stale)
+    tables = {}
+    for table in fingerprints:
+        if table in stale:
+            tables[table] = {
+                "fingerprint": fingerprints[table],
+                "columns": fetched_schema.get(table, []),
+                "keys": keys.get(table, {"primary_key": [], "foreign_keys": []})
+            }
+        else:
+            tables[table] = cached_tables[table]
+    save_cached_tables(cache_key, tables)
+    index = open_schema_index(cache_key, {table: entry["columns"] for table, entry in tables.items()})
+    return tables, index
+
+
+class PostgresEngine:
+    """
+    Translates questions into PostgreSQL queries and runs them, without any user interface.
+
+    The engine holds the schema, the caches and the settings; the connection pool is passed to
+    each call, so one engine can serve several databases with the same schema. Translations,
+    checks and queries can run from several threads at the same time.
+    """
+    dialect = "postgresql"
+
+    def __init__(self, openai_client, translation_cache=None, result_cache=None, model=OPENAI_MODEL,
+                 temperature=OPENAI_TEMPERATURE, query_timeout=QUERY_TIMEOUT_SECONDS, row_limit=QUERY_ROW_LIMIT,
+                 stream_batch_size=STREAM_BATCH_SIZE, repair_attempts=QUERY_REPAIR_ATTEMPTS,
+                 schema_linking_top_k=SCHEMA_LINKING_TOP_K, schema_token_budget=SCHEMA_TOKEN_BUDGET):
+        """
+        Parameters:
+        - openai_client: The OpenAI client used for translations.
+        - translation_cache: Optional TranslationCache of model responses.
+        - result_cache: Optional ResultCache of query results.
+        - model, temperature: The model settings used for every translation.
+        - query_timeout: Seconds after which the server cancels a query.
+        - row_limit: The maximum number of rows fetched per query.
+        - stream_batch_size: Rows fetched per round trip from the server-side cursor.
+        - repair_attempts: Translations tried per question, including the first one.
+        - schema_linking_top_k, schema_token_budget: See SchemaLinker.select_tables.
+        """
+        self.openai_client = openai_client
+        self.translation_cache = translation_cache
+        self.result_cache = result_cache
+        self.model = model
+        self.temperature = temperature
+        self.query_timeout = query_timeout
+        self.row_limit = row_limit
+        self.stream_batch_size = stream_batch_size
+        self.repair_attempts = repair_attempts
+        self.schema_linking_top_k = schema_linking_top_k
+        self.schema_token_budget = schema_token_budget
+        self.repair_stats = RepairStats()
+        self.prompt_builder = PromptBuilder(self.dialect)
+        self.prompt_stats = PromptStats()
+
+        self.schema = {}
+        self.schema_version = 0  # Incremented whenever the schema changes, so that cached schema texts are not reused
+        self.schema_keys = {}  # Primary and foreign keys per table, filled when the schema is fetched
+        self.schema_linker = SchemaLinker(lambda table, columns: self.render_schema({table: columns}))
+        self._schema_lock = threading.Lock()  # The schema linker is not safe to update from several threads
+        self._running_connections = set()  # Connections with a query in progress, cancelled by cancel()
+        self._cancelled_connections = set()  # Connections whose query was cancelled
+
+    def fetch_schema(self, pool, schema_names=("public",)):
+        """
+        Loads the schema of the requested schemas (see load_postgres_schema) and uses it for the
+        next translations.
+
+        Returns:
+        - The schema dictionary.
+        """
+        cache_key = connection_key(pool.connection_details, ",".join(schema_names))
+        self.set_schema_tables(*load_postgres_schema(pool, list(schema_names), cache_key))
+        return self.schema
+
+    def set_schema_tables(self, tables, index=None):
+        """
+        Adds the tables returned by load_postgres_schema to the schema.
+
+        Parameters:
+        - tables: Dictionary mapping table names to cache entries with "columns" and "keys".
+        - index: Optional SchemaVectorIndex used by the schema linker for fuzzy matching.
+        """
+        with self._schema_lock:
+            for table, entry in tables.items():
+                self.schema[table] = entry["columns"]
+                self.schema_keys[table] = entry["keys"]
+            self.schema_linker.vector_index = index
+            self._schema_changed()
+
+    def set_schema(self, schema):
+        """
+        Replaces the schema used for translations, e.g. with a schema loaded from a file.
+        """
+        with self._schema_lock:
+            self.schema = schema
+            self._schema_changed()
+
+    def update_schema(self, tables):
+        """
+        Adds tables (a schema dictionary, e.g. entered by hand) to the schema, replacing tables with the same name.
+        """
+        with self._schema_lock:
+            self.schema.update(tables)
+            self._schema_changed()
+
+    def _schema_changed(self):
+        # Called with _schema_lock held; the schema linker is brought up to date here rather than
+        # on every question, since it re-hashes every table of the schema
+        self.schema_linker.update(self.schema, {table: keys["foreign_keys"] for table, keys in self.schema_keys.items()} or None)
+        self.schema_version += 1
+
+    def schema_snapshot(self):
+        """
+        Returns a copy of the schema, taken while no other thread is changing it.
+        """
+        with self._schema_lock:
+            return dict(self.schema)
+
+    def relevant_schema(self, question):
+        """
+        Selects the tables relevant to a question (and the tables linked to them by foreign keys)
+        so that only they are sent to the model. The whole schema is returned when it fits in
+        the schema token budget.
+        """
+        with self._schema_lock:
+            selected_tables = self.schema_linker.select_tables(question, self.schema_linking_top_k, self.schema_token_budget)
+            # Kept in schema order, so that the schema text is the same whenever the same tables are selected
+            selected_tables = set(selected_tables)
+            return {table: columns for table, columns in self.schema.items() if table in selected_tables}
+
+    def schema_to_text(self, schema):
+        """
+        Returns the text of the engine's schema, or of the tables of it selected by relevant_schema.
+        The text is rendered once per schema version and set of tables (see PromptBuilder.schema_text).
+        """
+        return self.prompt_builder.schema_text((self.schema_version, tuple(schema)), lambda: self.render_schema(schema))
+
+    def render_schema(self, schema):
+        def columns_to_text(columns):
+            column_texts = []
+            for col in columns:
+                if len(col) > 2 and col[2] == "REQUIRED":
+                    column_texts.append(f"{col[0]} {col[1]} NOT NULL")
+                else:
+                    column_texts.append(f"{col[0]} {col[1]}")
+            return ', '.join(column_texts)
+
+        def keys_to_text(table):
+            key_texts = []
+            table_keys = self.schema_keys.get(table, {})
+            if table_keys.get("primary_key"):
+                key_texts.append(f"PRIMARY KEY({', '.join(table_keys['primary_key'])})")
+            for column, ref_table, ref_column in table_keys.get("foreign_keys", []):
+                key_texts.append(f"FOREIGN KEY({column}) REFERENCES {ref_table}({ref_column})")
+            return ''.join(f", {text}" for text in key_texts)
+
+        schema_text = "Tables:\n"
+        for table, columns in schema.items():
+            schema_text += f"- {table} ({columns_to_text(columns)}{keys_to_text(table)})\n"
+        return schema_text
+
+    def translation_request(self, user_query, database_schema, feedback=None):
+        """
+        Builds the prompt of a translation and its translation cache key.
+
+        Parameters:
+        - user_query: The natural language question (or SQL query being refined).
+        - database_schema: The schema text sent to the model.
+        - feedback: Optional feedback to refine the query.
+
+        Returns:
+        - A tuple (prompt, cache_key).
+        """
+        prompt = self.prompt_builder.build(database_schema, user_query, feedback)
+        cache_key = TranslationCache.make_key(user_query, database_schema, feedback, self.model, self.temperature, self.dialect,
+                                              self.prompt_builder.static_prefix)
+        return prompt, cache_key
+
+    def parse_response(self, full_response):
+        """
+        Extracts the SQL query and its explanation from a model response.
+
+        Returns:
+        - A tuple (sql_query, explanation).
+        """
+        return parse_translation(full_response)
+
+    def translate_to_sql(self, user_query, database_schema, feedback=None, on_progress=None):
+        """
+        Translates a question into a PostgreSQL query with the model, or reuses the cached translation.
+
+        Parameters:
+        - user_query, database_schema, feedback: See translation_request.
+        - on_progress: Optional function receiving the response as it is streamed (see stream_translation).
+
+        Returns:
+        - A tuple (sql_query, explanation).
+        """
+        prompt, cache_key = self.translation_request(user_query, database_schema, feedback)
+        if on_progress is not None:
+            full_response = stream_translation(self.openai_client, prompt, on_progress, self.model, self.temperature,
+                                               self.translation_cache, cache_key, self.prompt_stats.record)
+        else:
+            full_response = request_translation(self.openai_client, prompt, self.model, self.temperature, self.translation_cache, cache_key,
+                                                self.prompt_stats.record)
+        return self.parse_response(full_response)
+
+    def check_sql(self, sql_query, pool):
+        """
+        Checks a generated query without running it: validate_sql first, then EXPLAIN, which plans
+        the query and reports unknown tables and columns or type errors.
+
+        Parameters:
+        - sql_query: The SQL query to check.
+        - pool: The connection pool EXPLAIN runs on, or None to only validate the query locally.
+
+        Returns:
+        - The error message, or None if the query is valid or could not be checked (e.g. the
+          database is unreachable).
+        """
+        errors, _ = validate_sql(sql_query, self.schema, dialect=self.dialect)
+        if errors:
+            return " ".join(errors)
+        if pool is None:
+            return None
+        try:
+            with pool.connection() as conn:
+                with conn.cursor() as cursor:
+                    cursor.execute("SET LOCAL statement_timeout = %s", (self.query_timeout * 1000,))
+                    cursor.execute(f"EXPLAIN {sql_query}")
+        except (psycopg2.ProgrammingError, psycopg2.DataError) as e:
+            return str(e).strip()
+        except (psycopg2.Error, PoolTimeoutError) as e:
+            logger.warning("Could not check the query with EXPLAIN: %s", e)
+        return None
+
+    def translate_and_check(self, user_query, database_schema, pool, feedback=None, failed_query=None,
+                            first_translation=None, on_progress=None):
+        """
+        Translates a question and, while check_sql reports an error, sends the error back to the
+        model to repair the query, up to repair_attempts translations (see translate_with_repair).
+
+        Parameters:
+        - user_query, database_schema, feedback: See translate_to_sql.
+        - pool: The connection pool EXPLAIN runs on, or None before connecting to the database.
+        - failed_query: Optional (sql_query, error_message) of a query that failed on execution.
+        - first_translation: Optional (sql_query, explanation) already translated for the question
+          (e.g. by batch_translation.translate_questions), checked as the first attempt.
+        - on_progress: Optional function receiving each attempt's response as it is streamed (see stream_translation).
+
+        Returns:
+        - A tuple (sql_query, explanation, attempts), attempts being the timed attempts of translate_with_repair.
+        """
+        pending = [first_translation] if first_translation is not None else []
+
+        def translate(attempt_feedback):
+            if pending:
+                return pending.pop()
+            return self.translate_to_sql(user_query, database_schema, attempt_feedback, on_progress)
+
+        return translate_with_repair(
+            translate,
+            lambda sql_query: self.check_sql(sql_query, pool),
+            max_attempts=self.repair_attempts, feedback=feedback, failed_query=failed_query, stats=self.repair_stats
+        )
+
+    def stream_query(self, sql_query, pool, batch_size=None, on_description=None):
+        """
+        Executes a SQL query with a server-side (named) cursor and yields its rows in batches,
+        so that only one batch is held in memory at a time.
+
+        The server aborts the query after query_timeout seconds. The connection is returned to
+        the pool when the generator is exhausted or closed. on_description, if given, is called
+        with the cursor description (column names and types) before the first batch is yielded.
+
+        Yields:
+        - (columns, rows) tuples, where rows is a list of at most batch_size row tuples. A query
+          returning no rows yields one empty batch, so that its columns are known.
+        """
+        batch_size = batch_size or self.stream_batch_size
+        with pool.connection() as conn:
+            # SET LOCAL only lasts until the transaction is rolled back when the connection is returned
+            with conn.cursor() as settings_cursor:
+                settings_cursor.execute("SET LOCAL statement_timeout = %s", (self.query_timeout * 1000,))
+            cursor = conn.cursor(name=f"nl_to_sql_{uuid.uuid4().hex}")
+            cursor.itersize = batch_size
+            self._running_connections.add(conn)
+            try:
+                cursor.execute(sql_query)
+                rows = cursor.fetchmany(batch_size)
+                if on_description is not None:
+                    on_description(cursor.description)
+                while True:
+                    yield [desc[0] for desc in cursor.description], rows
+                    rows = cursor.fetchmany(batch_size)
+                    if not rows:
+                        break
+            except extensions.QueryCanceledError:
+                if conn in self._cancelled_connections:
+                    raise QueryCancelledError("The query was cancelled.")
+                raise TimeoutError(f"The query did not finish within {self.query_timeout} seconds and was cancelled.")
+            finally:
+                self._running_connections.discard(conn)
+                self._cancelled_connections.discard(conn)
+                try:
+                    cursor.close()
+                except psycopg2.Error:
+                    pass  # The transaction failed; rolling it back on release closes the cursor
+
+    def execute_query(self, sql_query, pool, on_batch=None):
+        """
+        Executes a SQL query on a pooled connection, streaming its rows from a server-side cursor.
+        At most row_limit rows are kept; the result is marked truncated when the query returned more.
+
+        Parameters:
+        - sql_query: The SQL query to execute.
+        - pool: The connection pool to borrow the connection from.
+        - on_batch: Optional function called with the (partial) QueryResult each time a batch
+          of rows has been added to it.
+
+        Returns:
+        - A QueryResult holding the rows column by column.
+        """
+        row_limit = self.row_limit
+        result = None
+        batches = self.stream_query(sql_query, pool)
+        try:
+            for columns, rows in batches:
+                if result is None:
+                    result = QueryResult(columns)
+                elif len(result) >= row_limit:
+                    # A batch after the limit was reached, which only the cursor's next fetch tells
+                    result.truncated = True
+                    break
+                result.truncated = len(rows) > row_limit - len(result)
+                result.append_rows(rows[:row_limit - len(result)])
+                if on_batch is not None:
+                    on_batch(result)
+                if result.truncated:
+                    break
+        finally:
+            batches.close()
+        return result if result is not None else QueryResult([])
+
+    def execute_cached_query(self, sql_query, pool, on_batch=None):
+        """
+        Returns the results of a query from the result cache when the tables have not been written
+        to since they were cached, and executes it with execute_query otherwise.
+
+        Writes are detected with the statistics counters of pg_stat_user_tables. They are not
+        updated at once: a backend reports its counters at most once a second, so cached results
+        can be served for about a second after a write commits (longer on a busy server, where the
+        report may be postponed). Queries are not cached when the server does not count writes
+        (track_counts is off), or when they call a volatile function, built-in or user-defined.
+
+        Parameters:
+        - sql_query, pool, on_batch: See execute_query; on_batch is not called for cached results.
+
+        Returns:
+        - A tuple (result, from_cache).
+        """
+        if self.result_cache is None or not is_cacheable(sql_query):
+            return self.execute_query(sql_query, pool, on_batch), False
+        with pool.connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(RESULT_FRESHNESS_QUERY, {"functions": called_functions(sql_query)})
+                counts_writes, calls_volatile_function, freshness_token = cursor.fetchone()
+        if not counts_writes or calls_volatile_function:
+            return self.execute_query(sql_query, pool, on_batch), False
+        cache_key = ResultCache.make_key(sql_query, connection_key(pool.connection_details), freshness_token, self.row_limit)
+        result = self.result_cache.get(cache_key)
+        if result is not None:
+            return result, True
+        result = self.execute_query(sql_query, pool, on_batch)
+        self.result_cache.put(cache_key, result)
+        return result, False
+
+    def cancel(self):
+        """
+        Cancels the queries currently running on pooled connections.
+        """
+        for conn in list(self._running_connections):
+            self._cancelled_connections.add(conn)
+            conn.cancel()
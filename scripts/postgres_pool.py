@@ -0,0 +1,204 @@
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2 import extensions
+
+
+class PoolTimeoutError(Exception):
+    """
+    Raised when no connection becomes available within the checkout timeout.
+    """
+
+
+class PostgresConnectionPool:
+    """
+    A thread-safe pool of PostgreSQL connections.
+
+    Connections are opened lazily up to max_size (so creating the pool never blocks on
+    the network), health-checked when they are borrowed, reset when they are returned,
+    and closed once they have been idle for longer than idle_timeout (while keeping at
+    least min_size open).
+    """
+    def __init__(self, connection_details, min_size=1, max_size=5, idle_timeout=300,
+                 health_check_interval=30, checkout_timeout=30, readonly=False):
+        """
+        Parameters:
+        - connection_details: Keyword arguments passed to psycopg2.connect.
+        - min_size: Number of opened connections kept open even when idle.
+        - max_size: Maximum number of connections open at the same time.
+        - idle_timeout: Seconds after which an idle connection above min_size is closed.
+        - health_check_interval: Idle seconds after which a connection is pinged before reuse.
+        - checkout_timeout: Seconds to wait for a free connection before giving up.
+        - readonly: Whether the connections run read-only transactions, in which the server
+          refuses any write (including writes made by functions such as setval).
+        """
+        self.connection_details = dict(connection_details)
+        self.min_size = min_size
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.health_check_interval = health_check_interval
+        self.checkout_timeout = checkout_timeout
+        self.readonly = readonly
+
+        self._idle = []  # List of (connection, returned_at) tuples, most recently returned last
+        self._in_use = set()
+        self._opening = 0  # Connections being opened outside the lock
+        self._condition = threading.Condition()
+        self._closed = False
+        self._stats = {"created": 0, "closed": 0, "checkouts": 0, "waits": 0, "failed_health_checks": 0}
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+        self._stats["closed"] += 1
+
+    def _is_healthy(self, conn, idle_for):
+        # Called without the lock held, since pinging a dead connection can last a network timeout
+        if conn.closed:
+            return False
+        if idle_for < self.health_check_interval:
+            return True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except Exception:
+            with self._condition:
+                self._stats["failed_health_checks"] += 1
+            return False
+
+    def _prune_idle(self):
+        # Close connections that have been idle too long, keeping min_size open
+        now = time.monotonic()
+        keep = []
+        for conn, returned_at in self._idle:
+            open_count = len(keep) + len(self._in_use)
+            if now - returned_at > self.idle_timeout and open_count >= self.min_size:
+                self._discard(conn)
+            else:
+                keep.append((conn, returned_at))
+        self._idle = keep
+
+    def acquire(self):
+        """
+        Borrows a healthy connection from the pool, opening a new one if needed.
+
+        Returns:
+        - A psycopg2 connection. It must be handed back with release().
+        """
+        deadline = time.monotonic() + self.checkout_timeout
+        while True:
+            conn = None
+            with self._condition:
+                while True:
+                    if self._closed:
+                        raise PoolTimeoutError("The connection pool is closed")
+                    self._prune_idle()
+                    if self._idle:
+                        conn, returned_at = self._idle.pop()
+                        self._in_use.add(conn)  # Counted as in use while it is checked, so that max_size holds
+                        break
+                    if len(self._in_use) + self._opening < self.max_size:
+                        self._opening += 1
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise PoolTimeoutError(f"No connection available after {self.checkout_timeout} seconds")
+                    self._stats["waits"] += 1
+                    self._condition.wait(remaining)
+            if conn is None:
+                break  # Open a new connection
+
+            # Check the idle connection outside the lock so other threads are not blocked meanwhile
+            if self._is_healthy(conn, time.monotonic() - returned_at):
+                with self._condition:
+                    self._stats["checkouts"] += 1
+                return conn
+            with self._condition:
+                self._in_use.discard(conn)
+                self._discard(conn)
+                self._condition.notify()
+
+        # Open the new connection outside the lock so other threads are not blocked meanwhile
+        try:
+            conn = psycopg2.connect(**self.connection_details)
+            if self.readonly:
+                conn.set_session(readonly=True)
+        except Exception:
+            with self._condition:
+                self._opening -= 1
+                self._condition.notify()
+            raise
+        with self._condition:
+            self._opening -= 1
+            self._in_use.add(conn)
+            self._stats["created"] += 1
+            self._stats["checkouts"] += 1
+        return conn
+
+    def release(self, conn):
+        """
+        Returns a borrowed connection to the pool after resetting its session state.
+
+        Parameters:
+        - conn: The connection previously obtained from acquire().
+        """
+        with self._condition:
+            self._in_use.discard(conn)
+            if self._closed or conn.closed:
+                self._discard(conn)
+            else:
+                try:
+                    if conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+                        conn.rollback()
+                    if conn.autocommit:
+                        conn.autocommit = False
+                    self._idle.append((conn, time.monotonic()))
+                except Exception:
+                    self._discard(conn)
+            self._condition.notify()
+
+    @contextmanager
+    def connection(self):
+        """
+        Context manager that borrows a connection and always returns it to the pool.
+        """
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def stats(self):
+        """
+        Returns a snapshot of the pool counters.
+
+        Returns:
+        - A dictionary with the pool size limits, current usage and lifetime counters.
+        """
+        with self._condition:
+            snapshot = dict(self._stats)
+            snapshot.update({
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+                "in_use": len(self._in_use),
+                "idle": len(self._idle),
+            })
+            return snapshot
+
+    def close(self):
+        """
+        Closes every idle connection and marks the pool as closed.
+        Connections still in use are closed when they are released.
+        """
+        with self._condition:
+            self._closed = True
+            for conn, _ in self._idle:
+                self._discard(conn)
+            self._idle = []
+            self._condition.notify_all()
@@ -0,0 +1,153 @@
+import logging
+import threading
+from collections import OrderedDict
+
+# Rules of every translation prompt, the same for both databases
+TRANSLATION_RULES = [
+    "Use {dialect_name} syntax, and write the SQL query so that it is ready to be executed on {dialect_name}.",
+    "Provide a brief explanation of the SQL query after the query itself. Write it in the following format: Explanation: [explanation itself]",
+    "If no table or column satisfies the user's natural language request, return a message indicating that it is not possible to create a query.",
+    "Access nested fields directly using the dot notation. For example, use details.price to access the price field within the details record.",
+    "If feedback is provided, use it to refine the query. Specifically, adjust the SQL query to incorporate the feedback provided by the user.",
+    "While providing the SQL query do not give it in comment block.",
+    "When generating queries do not forget to use aliases.",
+]
+
+# Rules and schema format notes specific to each dialect
+DIALECT_RULES = {
+    "postgresql": {
+        "name": "PostgreSQL",
+        "rules": [],
+        "schema_format": [
+            "Each table is listed with its columns and their types inside parentheses.",
+            "Columns that cannot be NULL are marked NOT NULL.",
+            "The primary key and the foreign keys of a table follow its columns.",
+        ],
+    },
+    "bigquery": {
+        "name": "Google BigQuery (GoogleSQL)",
+        "rules": [
+            "If a column's type is RECORD, the details/fields of the nested structure are given inside the consecutive parenthesis block. "
+            "For example, the following is a valid syntax for columns with RECORD structure: "
+            "details RECORD(price FLOAT MODE(NULLABLE), quantity INTEGER MODE(REQUIRED)) MODE(NULLABLE)",
+            "If a column's type is RECORD and is REPEATED, use the UNNEST function to flatten the structure. Do not use JSON extraction syntax (->>).",
+        ],
+        "schema_format": [
+            "Each table is listed with its columns inside parentheses.",
+            "Columns of type RECORD have their fields listed inside nested parentheses.",
+            "Each column has its mode (NULLABLE or REQUIRED) specified.",
+        ],
+    },
+}
+
+logger = logging.getLogger(__name__)
+
+# Number of rendered schema texts kept per engine
+SCHEMA_BLOCK_CACHE_SIZE = 64
+
+
+class PromptBuilder:
+    """
+    Builds the translation prompts of one SQL dialect.
+
+    Prompts are ordered from the most to the least stable part: the rules (identical for every
+    request), then the schema (identical while the schema and the selected tables do not change),
+    then the question and the feedback. Requests in a session therefore share a long identical
+    prefix, which the model provider can cache, making the repeated part cheaper and faster.
+    The rules are rendered once, and rendered schema texts are kept per schema version.
+    """
+    def __init__(self, dialect, cache_size=SCHEMA_BLOCK_CACHE_SIZE):
+        """
+        Parameters:
+        - dialect: "postgresql" or "bigquery".
+        - cache_size: The number of rendered schema texts kept.
+        """
+        dialect_rules = DIALECT_RULES[dialect]
+        rules = [rule.format(dialect_name=dialect_rules["name"]) for rule in TRANSLATION_RULES] + dialect_rules["rules"]
+        self.static_prefix = "\n".join(
+            ["You are an expert SQL query generator. Translate user natural language questions into SQL queries based on the database schema provided.",
+             "When giving the answer to the user, follow these rules:", ""]
+            + [f"- {rule}" for rule in rules]
+            + ["", "The schema is provided in the following format:"]
+            + [f"- {note}" for note in dialect_rules["schema_format"]]
+        ) + "\n\n"
+        self.cache_size = cache_size
+        self._schema_texts = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def schema_text(self, key, render):
+        """
+        Returns the rendered schema text cached under key, rendering it with render() on a miss.
+
+        Parameters:
+        - key: Identifies the schema version and the selected tables, e.g. (schema_version, table_names).
+        - render: Function returning the schema text.
+        """
+        with self._lock:
+            if key in self._schema_texts:
+                self._schema_texts.move_to_end(key)
+                self.hits += 1
+                return self._schema_texts[key]
+            self.misses += 1
+        text = render()
+        with self._lock:
+            self._schema_texts[key] = text
+            while len(self._schema_texts) > self.cache_size:
+                self._schema_texts.popitem(last=False)
+        return text
+
+    def build(self, database_schema, user_query, feedback=None):
+        """
+        Returns the prompt for a question: the rules, the schema, the question and the feedback.
+
+        Parameters:
+        - database_schema: The schema text sent to the model.
+        - user_query: The natural language question (or SQL query being refined).
+        - feedback: Optional feedback to refine the query.
+        """
+        return (f"{self.static_prefix}Database Schema:\n{database_schema.strip()}\n\n"
+                f"Question:\n{user_query}\n\nFeedback:\n{feedback if feedback else 'None'}\n\nSQL Query:\n")
+
+
+class PromptStats:
+    """
+    Counts the tokens of the translation requests, as reported by the API, including the prompt
+    tokens served from the provider's prompt cache.
+    """
+    def __init__(self):
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+        self.completion_tokens = 0
+        self._lock = threading.Lock()
+
+    def record(self, usage):
+        """
+        Adds the usage of one model call (the usage field of the response) and logs it. Counts
+        missing from the usage (e.g. from OpenAI-compatible servers) are taken as 0.
+        """
+        prompt_tokens = getattr(usage, "prompt_tokens", None) or 0
+        completion_tokens = getattr(usage, "completion_tokens", None) or 0
+        cached_tokens = getattr(getattr(usage, "prompt_tokens_details", None), "cached_tokens", None) or 0
+        with self._lock:
+            self.calls += 1
+            self.prompt_tokens += prompt_tokens
+            self.cached_tokens += cached_tokens
+            self.completion_tokens += completion_tokens
+        logger.debug("Prompt tokens: %d (%d cached), completion tokens: %d", prompt_tokens, cached_tokens, completion_tokens)
+
+    def summary(self):
+        """
+        Returns the counters as lines of text.
+        """
+        with self._lock:
+            calls = self.calls or 1
+            cached_share = self.cached_tokens / self.prompt_tokens if self.prompt_tokens else 0.0
+            return "\n".join([
+                f"Model calls: {self.calls}",
+                f"Prompt tokens: {self.prompt_tokens} ({self.prompt_tokens / calls:.0f} per call)",
+                f"Cached prompt tokens: {self.cached_tokens} ({cached_share:.0%})",
+                f"Completion tokens: {self.completion_tokens}",
+            ])
@@ -0,0 +1,127 @@
+import threading
+import time
+
+
+def repair_feedback(sql_query, error_message):
+    """
+    Builds the feedback asking the model to fix a query that failed.
+    """
+    return (f"The previous SQL query failed with this error:\n{error_message}\n\n"
+            f"Previous SQL query:\n{sql_query}\n\n"
+            "Return a corrected SQL query that answers the same question.")
+
+
+def translate_with_repair(translate, check, max_attempts=3, feedback=None, failed_query=None, stats=None):
+    """
+    Translates a question, checks the query and, while the check fails, translates it again with
+    the error and the failed query as feedback, up to max_attempts translations.
+
+    The check is meant to be cheap and side-effect free (local validation, then EXPLAIN or a
+    BigQuery dry run), so no attempt executes the query.
+
+    Parameters:
+    - translate: Function taking the feedback (a string or None) and returning (sql_query, explanation).
+    - check: Function taking a SQL query and returning an error message, or None if the query is valid.
+    - max_attempts: The maximum number of translations.
+    - feedback: Optional feedback from the user, sent with every attempt.
+    - failed_query: Optional (sql_query, error_message) of a query that already failed, e.g. on
+      execution; the first attempt then asks the model to fix it.
+    - stats: Optional RepairStats updated with the outcome.
+
+    Returns:
+    - A tuple (sql_query, explanation, attempts) with the last translation and one dictionary per
+      attempt with its "sql_query", "error" (None if the check passed), "translate_seconds"
+      and "check_seconds". The last attempt has an error when every attempt failed.
+    """
+    attempts = []
+    repairing_failed_query = failed_query is not None
+    for _ in range(max_attempts):
+        repair = repair_feedback(*failed_query) if failed_query is not None else None
+        attempt_feedback = "\n\n".join(part for part in (feedback, repair) if part) or None
+
+        started = time.perf_counter()
+        sql_query, explanation = translate(attempt_feedback)
+        translated = time.perf_counter()
+        error = check(sql_query)
+        attempts.append({
+            "sql_query": sql_query,
+            "error": error,
+            "translate_seconds": translated - started,
+            "check_seconds": time.perf_counter() - translated,
+        })
+        if error is None:
+            break
+        failed_query = (sql_query, error)
+
+    if stats is not None:
+        stats.record(attempts, repairing_failed_query)
+    return sql_query, explanation, attempts
+
+
+def describe_attempts(attempts, repairing_failed_query=False):
+    """
+    Summarizes the attempts returned by translate_with_repair for the status line, or returns an
+    empty string when the first translation passed its check.
+
+    Parameters:
+    - attempts: The attempts returned by translate_with_repair.
+    - repairing_failed_query: Whether the translation repaired a query that failed on execution.
+    """
+    count = f"{len(attempts)} attempt{'s' if len(attempts) > 1 else ''}"
+    total_seconds = sum(attempt["translate_seconds"] + attempt["check_seconds"] for attempt in attempts)
+    if attempts[-1]["error"] is not None:
+        return f"The query still fails after {count} ({total_seconds:.1f}s): {attempts[-1]['error']}"
+    if repairing_failed_query:
+        return f"The query failed and was repaired automatically ({count}, {total_seconds:.1f}s); execute it again"
+    if len(attempts) > 1:
+        return f"Query repaired automatically after {count} ({total_seconds:.1f}s)"
+    return ""
+
+
+class RepairStats:
+    """
+    Counts how often translations pass their check the first time, are repaired or fail, and
+    how long the attempts take.
+    """
+    def __init__(self):
+        self.translations = 0
+        self.first_try = 0
+        self.repaired = 0
+        self.failed = 0
+        self.attempts = 0
+        self.translate_seconds = 0.0
+        self.check_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, attempts, repairing_failed_query=False):
+        """
+        Adds the attempts of one translation, as returned by translate_with_repair. Translations
+        repairing a query that failed on execution never count as valid on the first try.
+        """
+        with self._lock:
+            self.translations += 1
+            self.attempts += len(attempts)
+            if attempts[-1]["error"] is not None:
+                self.failed += 1
+            elif len(attempts) == 1 and not repairing_failed_query:
+                self.first_try += 1
+            else:
+                self.repaired += 1
+            self.translate_seconds += sum(attempt["translate_seconds"] for attempt in attempts)
+            self.check_seconds += sum(attempt["check_seconds"] for attempt in attempts)
+
+    def summary(self):
+        """
+        Returns the counters and the average time per attempt, as lines of text.
+        """
+        with self._lock:
+            attempts = self.attempts or 1
+            return "\n".join([
+                f"Translations: {self.translations}",
+                f"Valid on the first try: {self.first_try}",
+                f"Repaired automatically: {self.repaired}",
+                f"Still failing: {self.failed}",
+                f"Attempts: {self.attempts}",
+                f"Average translation time: {self.translate_seconds / attempts:.2f}s",
+                f"Average check time: {self.check_seconds / attempts:.2f}s",
+            ])
@@ -0,0 +1,245 @@
+import bisect
+from datetime import date
+
+import numpy as np
+
+# NumPy types used for columns whose values all share one Python type
+_TYPED_COLUMNS = {bool: np.bool_, int: np.int64, float: np.float64, date: "datetime64[D]"}
+
+
+def _encode_chunk(values):
+    """
+    Packs one batch of a column's values into a compact chunk.
+
+    Booleans, integers, floats and dates become NumPy arrays and strings a single UTF-8 buffer with
+    offsets; NULLs are recorded in a mask. Other values (timestamps, decimals, records, mixed
+    types) are kept as a plain list.
+
+    Returns:
+    - A (kind, data, mask) tuple, where mask is a boolean NumPy array or None when there are no NULLs.
+    """
+    if isinstance(values, np.ndarray) and values.dtype.kind in "biuf":
+        # Arrays without NULLs (e.g. converted from Arrow) are stored as they are, widened to 64 bits
+        return "typed", values.astype(np.bool_ if values.dtype.kind == "b" else np.float64 if values.dtype.kind == "f" else np.int64), None
+    value_types = {type(value) for value in values if value is not None}
+    value_type = value_types.pop() if len(value_types) == 1 else None
+    mask = None
+    if value_type in _TYPED_COLUMNS or value_type is str:
+        if any(value is None for value in values):
+            mask = np.fromiter((value is None for value in values), dtype=np.bool_, count=len(values))
+        if value_type is str:
+            encoded = [value.encode("utf-8") if value is not None else b"" for value in values]
+            offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+            np.cumsum([len(value) for value in encoded], out=offsets[1:])
+            return "str", (b"".join(encoded), offsets), mask
+        filler = value_type() if value_type is not date else date.min
+        try:
+            data = np.array([value if value is not None else filler for value in values], dtype=_TYPED_COLUMNS[value_type])
+        except OverflowError:
+            return "object", list(values), None  # Integers too large for int64
+        return "typed", data, mask
+    return "object", list(values), None
+
+
+def _decode_chunk(chunk, start, stop):
+    """
+    Returns the values of a chunk between two positions as a list of Python objects.
+    """
+    kind, data, mask = chunk
+    if kind == "object":
+        return data[start:stop]
+    if kind == "str":
+        buffer, offsets = data
+        bounds = offsets[start:stop + 1].tolist()
+        values = [buffer[bounds[i]:bounds[i + 1]].decode("utf-8") for i in range(len(bounds) - 1)]
+    else:
+        values = data[start:stop].tolist()
+    if mask is not None:
+        for i in np.flatnonzero(mask[start:stop]).tolist():
+            values[i] = None
+    return values
+
+
+def _chunk_nbytes(chunk):
+    kind, data, mask = chunk
+    size = mask.nbytes if mask is not None else 0
+    if kind == "object":
+        return size + 8 * len(data)  # Only the references; the objects themselves are not counted
+    if kind == "str":
+        return size + len(data[0]) + data[1].nbytes
+    return size + data.nbytes
+
+
+class QueryResult:
+    """
+    The rows of a query result, stored column by column.
+
+    Column names are kept once instead of once per row, and each batch of rows appended is
+    packed per column into typed NumPy arrays or UTF-8 buffers (see _encode_chunk), which takes
+    a fraction of the memory of one dictionary per row. Rows are read back as tuples by position.
+
+    Rows may be appended by one thread while another reads the rows counted by len().
+    """
+    def __init__(self, columns):
+        """
+        Parameters:
+        - columns: The column names, in the order of the values in each row.
+        """
+        self.columns = list(columns)
+        self._chunks = [[] for _ in self.columns]  # Per column, the list of packed chunks
+        self._chunk_starts = []  # Row number of the first row of each chunk
+        self._row_count = 0
+        self.source = None  # Optional reference the complete result can be read again from, set by the caller
+        self.truncated = False  # Whether the query returned more rows than were fetched, set by the caller
+
+    def __len__(self):
+        return self._row_count
+
+    def __bool__(self):
+        return self._row_count > 0
+
+    def __getstate__(self):
+        # The packed chunks are pickled as they are; source is left out since what it refers
+        # to (e.g. a query job's temporary table) may have expired when the result is unpickled
+        state = self.__dict__.copy()
+        state["source"] = None
+        return state
+
+    def __setstate__(self, state):
+        state.setdefault("truncated", False)  # Results cached before the attribute existed
+        self.__dict__.update(state)
+
+    def append_rows(self, rows):
+        """
+        Appends a batch of rows.
+
+        Parameters:
+        - rows: A sequence of row tuples (or any sequences) with one value per column.
+        """
+        if rows:
+            self.append_columns(list(zip(*rows)) if self.columns else [], len(rows))
+
+    def append_columns(self, columns, row_count=None):
+        """
+        Appends a batch of rows given column by column.
+
+        Parameters:
+        - columns: One sequence of values per column, or a NumPy array for columns without NULLs.
+        - row_count: The number of rows; only needed when the result has no columns.
+        """
+        row_count = len(columns[0]) if columns else row_count
+        if not row_count:
+            return
+        for values, chunks in zip(columns, self._chunks):
+            chunks.append(_encode_chunk(values))
+        self._chunk_starts.append(self._row_count)
+        self._row_count += row_count
+
+    def rows(self, start=0, stop=None):
+        """
+        Returns the rows between two positions.
+
+        Parameters:
+        - start: The position of the first row.
+        - stop: The position after the last row; defaults to the end of the result.
+
+        Returns:
+        - A list of row tuples.
+        """
+        start, stop, _ = slice(start, stop).indices(self._row_count)
+        if start >= stop:
+            return []
+        # Columns are read by position, since a result may have several columns with the same name (e.g. a join)
+        return list(zip(*(self.column_values(index, start, stop) for index in range(len(self.columns)))))
+
+    def column_values(self, index, start=0, stop=None):
+        """
+        Returns the values of one column between two row positions.
+
+        Parameters:
+        - index: The position of the column in columns.
+        - start: The position of the first row.
+        - stop: The position after the last row; defaults to the end of the result.
+
+        Returns:
+        - A list of values, with None for NULLs.
+        """
+        start, stop, _ = slice(start, stop).indices(self._row_count)
+        chunks = self._chunks[index]
+        values = []
+        position = bisect.bisect_right(self._chunk_starts, start) - 1
+        while start < stop:
+            chunk_start = self._chunk_starts[position]
+            chunk_stop = self._chunk_starts[position + 1] if position + 1 < len(self._chunk_starts) else self._row_count
+            values.extend(_decode_chunk(chunks[position], start - chunk_start, min(stop, chunk_stop) - chunk_start))
+            start = chunk_stop
+            position += 1
+        return values
+
+    def take(self, positions):
+        """
+        Returns the rows at the given positions, in the order given.
+
+        Parameters:
+        - positions: A sequence of row positions, e.g. a page of a sort order.
+
+        Returns:
+        - A list of row tuples.
+        """
+        return [self.rows(position, position + 1)[0] for position in positions]
+
+    def sort_order(self, index, descending=False):
+        """
+        Computes the order of the rows sorted by one column. NULLs are placed last and rows
+        with equal values keep their original order.
+
+        Parameters:
+        - index: The position of the column in columns.
+        - descending: Sort from the largest to the smallest value.
+
+        Returns:
+        - A NumPy array with the row positions in sorted order.
+        """
+        row_count = self._row_count  # Rows appended by another thread after this point are ignored
+        chunks = self._chunks[index][:bisect.bisect_left(self._chunk_starts, row_count)]
+        if chunks and all(chunk[0] == "typed" and chunk[1].dtype == chunks[0][1].dtype for chunk in chunks):
+            # Fast path for numbers, booleans and dates: sort the packed arrays directly
+            data = np.concatenate([chunk[1] for chunk in chunks])
+            nulls = np.concatenate([chunk[2] if chunk[2] is not None else np.zeros(len(chunk[1]), dtype=np.bool_) for chunk in chunks])
+            present = np.flatnonzero(~nulls)
+            if descending:
+                # Sorting the reversed values and reversing back keeps equal values in their original order
+                order = present[::-1][np.argsort(data[present][::-1], kind="stable")][::-1]
+            else:
+                order = present[np.argsort(data[present], kind="stable")]
+            return np.concatenate([order, np.flatnonzero(nulls)]).astype(np.int64)
+
+        values = self.column_values(index, 0, row_count)
+        present = [i for i, value in enumerate(values) if value is not None]
+        try:
+            present.sort(key=values.__getitem__, reverse=descending)
+        except TypeError:
+            present.sort(key=lambda i: str(values[i]), reverse=descending)  # Values of mixed types
+        nulls = [i for i, value in enumerate(values) if value is None]
+        return np.asarray(present + nulls, dtype=np.int64)
+
+    def iter_batches(self, batch_size=5000):
+        """
+        Yields the rows in order, as lists of at most batch_size row tuples.
+        """
+        for start in range(0, self._row_count, batch_size):
+            yield self.rows(start, start + batch_size)
+
+    def iter_dicts(self, batch_size=5000):
+        """
+        Yields the rows in order as dictionaries, built one at a time.
+        """
+        for batch in self.iter_batches(batch_size):
+            for row in batch:
+                yield dict(zip(self.columns, row))
+
+    def nbytes(self):
+        """
+        Returns the approximate number of bytes used by the packed values.
+        """
+        return sum(_chunk_nbytes(chunk) for chunks in self._chunks for chunk in chunks)
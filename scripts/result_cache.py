@@ -0,0 +1,201 @@
+import hashlib
+import json
+import os
+import pickle
+import re
+import threading
+
+# Directory where cached results are stored, one file per result
+RESULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".nl_to_sql_tool", "result_cache")
+
+# Literals, quoted identifiers, comments and whitespace, in the order they must be matched
+_SQL_PARTS = re.compile(r"""
+    (?P<literal>'(?:[^']|'')*'|"(?:[^"]|"")*"|`[^`]*`)
+  | (?P<comment>--[^\n]*|/\*.*?\*/)
+  | (?P<space>\s+)
+""", re.VERBOSE | re.DOTALL)
+
+# Built-in functions whose value changes between runs (or that change state, like nextval); queries
+# calling them are never cached
+_VOLATILE_FUNCTIONS = re.compile(
+    r'\b(now|random|rand|clock_timestamp|statement_timestamp|timeofday|gen_random_uuid|generate_uuid|'
+    r'current_timestamp|current_date|current_time|current_datetime|localtimestamp|localtime|session_user|current_user|'
+    r'nextval|currval|lastval|setval|txid_current|txid_current_if_assigned|pg_current_xact_id|pg_backend_pid|'
+    r'inet_client_addr|pg_postmaster_start_time|uuid_generate_v1|uuid_generate_v4)\b',
+    re.IGNORECASE
+)
+
+# A function call: an unquoted or quoted name followed by an opening parenthesis
+_FUNCTION_CALL = re.compile(r'(?:"((?:[^"]|"")+)"|\b([A-Za-z_][A-Za-z0-9_$]*))\s*\(')
+
+
+def normalize_sql(sql_query):
+    """
+    Normalizes a query for use in a cache key: comments are removed, runs of whitespace outside
+    literals become a single space and trailing semicolons are dropped. Case is kept, since
+    BigQuery table names and quoted identifiers are case-sensitive.
+    """
+    parts = []
+    position = 0
+    for match in _SQL_PARTS.finditer(sql_query):
+        if match.start() > position:
+            parts.append(sql_query[position:match.start()])
+        if match.group("literal"):
+            parts.append(match.group("literal"))
+        elif not parts or parts[-1] != " ":
+            parts.append(" ")  # Comments and whitespace between two tokens become one space
+        position = match.end()
+    parts.append(sql_query[position:])
+    return "".join(parts).strip().rstrip(";").strip()
+
+
+def is_cacheable(sql_query):
+    """
+    Tells whether the results of a query can be cached: it must be a SELECT (or WITH) query that
+    does not call a built-in function returning the current time, a random number, the current
+    user or a sequence value. Functions are recognized by name only, so user-defined volatile
+    functions are not detected here; see called_functions.
+    """
+    normalized = normalize_sql(sql_query)
+    without_literals = _SQL_PARTS.sub(" ", normalized)
+    return bool(re.match(r'(SELECT|WITH)\b', normalized, re.IGNORECASE)) and not _VOLATILE_FUNCTIONS.search(without_literals)
+
+
+def called_functions(sql_query):
+    """
+    Returns the names of the functions a query calls (and of keywords followed by a parenthesis,
+    such as IN), e.g. to look up their volatility in the database catalog. Unquoted names are
+    lowercased, as PostgreSQL folds them.
+    """
+    without_strings = re.sub(r"'(?:[^']|'')*'|--[^\n]*|/\*.*?\*/", " ", sql_query, flags=re.DOTALL)
+    return sorted({quoted.replace('""', '"') if quoted else name.lower()
+                   for quoted, name in _FUNCTION_CALL.findall(without_strings)})
+
+
+class ResultCache:
+    """
+    A cache of query results on disk, evicting the least recently used results once their total
+    size exceeds max_bytes.
+
+    Results are keyed by the normalized SQL, the connection they ran on, a freshness token that
+    changes when the data may have changed (e.g. table modification times) and the row limit.
+    Each result is stored in its own file in the column-by-column layout of QueryResult, so
+    loading it back does not rebuild any row.
+    """
+    def __init__(self, cache_dir=RESULT_CACHE_DIR, max_bytes=1024 ** 3):
+        """
+        Parameters:
+        - cache_dir: The directory holding the cached results.
+        - max_bytes: The maximum total size of the cached results on disk.
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(sql_query, connection_key, freshness_token, row_limit):
+        """
+        Builds the cache key of a query result.
+
+        Parameters:
+        - sql_query: The executed SQL query; it is normalized first.
+        - connection_key: Identifies the database the query ran on.
+        - freshness_token: A value that changes whenever the queried data may have changed.
+        - row_limit: The maximum number of rows fetched, since it changes the result.
+
+        Returns:
+        - A hexadecimal digest.
+        """
+        material = json.dumps([normalize_sql(sql_query), connection_key, freshness_token, row_limit], default=str)
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.pickle")
+
+    def get(self, key):
+        """
+        Returns the cached result for a key, or None, and marks it as recently used.
+        """
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                result = pickle.load(f)
+            os.utime(path)  # The modification time orders the entries for eviction
+        except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError):
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return result
+
+    def put(self, key, result):
+        """
+        Stores a result, then evicts the least recently used results if the cache is too large.
+        Results larger than the whole cache are not stored. Caching is best effort: a result that
+        cannot be written (e.g. the disk is full) is skipped.
+        """
+        path = self._path(key)
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with open(temp_path, 'wb') as f:
+                pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+            if os.path.getsize(temp_path) > self.max_bytes:
+                os.remove(temp_path)
+                return
+            os.replace(temp_path, path)
+        except OSError:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            return
+        self._evict()
+
+    def _entries(self):
+        entries = []
+        for name in os.listdir(self.cache_dir) if os.path.isdir(self.cache_dir) else []:
+            if name.endswith(".pickle"):
+                try:
+                    stat = os.stat(os.path.join(self.cache_dir, name))
+                except OSError:
+                    continue  # Removed by another thread meanwhile
+                entries.append((stat.st_mtime, stat.st_size, name))
+        return entries
+
+    def _evict(self):
+        with self._lock:
+            entries = sorted(self._entries())
+            total = sum(size for _, size, _ in entries)
+            for _, size, name in entries:
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(os.path.join(self.cache_dir, name))
+                except OSError:
+                    pass
+                total -= size
+
+    def clear(self):
+        """
+        Removes every cached result.
+        """
+        with self._lock:
+            for _, _, name in self._entries():
+                try:
+                    os.remove(os.path.join(self.cache_dir, name))
+                except OSError:
+                    pass
+
+    def stats(self):
+        """
+        Returns the cache counters.
+
+        Returns:
+        - A dictionary with the hits, misses, number of entries and their total size in bytes.
+        """
+        entries = self._entries()
+        return {"hits": self.hits, "misses": self.misses, "entries": len(entries), "bytes": sum(size for _, size, _ in entries)}
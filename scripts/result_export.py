@@ -0,0 +1,194 @@
+import base64
+import csv
+import gzip
+import json
+import os
+from datetime import date, datetime, time
+from decimal import Decimal
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    from arrow_types import infer_arrow_schema, rows_to_record_batch
+except ImportError:  # pyarrow is only needed for the Parquet and Arrow exports
+    pa = None
+
+PARQUET_ROW_GROUP_SIZE = 100000  # Rows buffered before a Parquet row group is written
+
+
+def json_default(obj):
+    """
+    Converts the values json cannot serialize by itself: dates and times to ISO 8601 strings,
+    decimals to strings (keeping their precision) and bytes to base64.
+    """
+    if isinstance(obj, (date, datetime, time)):
+        return obj.isoformat()
+    if isinstance(obj, Decimal):
+        return str(obj)
+    if isinstance(obj, (bytes, bytearray, memoryview)):
+        return base64.b64encode(bytes(obj)).decode("ascii")
+    raise TypeError(f"Object of type {obj.__class__.__name__} is not JSON serializable")
+
+
+def open_export_file(file_path):
+    """
+    Opens an export file for writing text, gzip-compressed when its name ends with .gz.
+    """
+    if file_path.lower().endswith(".gz"):
+        return gzip.open(file_path, 'wt', newline='', encoding='utf-8')
+    return open(file_path, 'w', newline='', encoding='utf-8')
+
+
+def _write_export(batches, file_path, write_batch, on_progress, footer=None, open_file=open_export_file):
+    # Shared loop of the writers: the file is removed if the export fails half-way
+    row_count = 0
+    try:
+        with open_file(file_path) as f:
+            for columns, rows in batches:
+                write_batch(f, columns, rows, row_count)
+                row_count += len(rows)
+                if on_progress is not None:
+                    on_progress(row_count)
+            if footer is not None:
+                footer(f, row_count)
+    except BaseException:
+        try:
+            os.remove(file_path)
+        except OSError:
+            pass
+        raise
+    finally:
+        if hasattr(batches, "close"):
+            batches.close()  # Releases the cursor or connection behind a generator stopped early
+    return row_count
+
+
+def write_csv(batches, file_path, on_progress=None):
+    """
+    Streams batches of rows into a CSV file with a header row, which is written from the columns
+    of the first batch even when there are no rows.
+
+    Parameters:
+    - batches: An iterable of (columns, rows) tuples, e.g. read from a database cursor.
+    - file_path: The file to write; compressed with gzip when it ends with .gz.
+    - on_progress: Optional function called with the number of rows written after each batch.
+
+    Returns:
+    - The number of rows written.
+    """
+    header_written = False
+
+    def write_batch(f, columns, rows, offset):
+        nonlocal header_written
+        writer = csv.writer(f)
+        if not header_written:
+            writer.writerow(columns)  # Write the header row once, even if the first batch is empty
+            header_written = True
+        writer.writerows(rows)
+
+    return _write_export(batches, file_path, write_batch, on_progress)
+
+
+def write_json(batches, file_path, on_progress=None):
+    """
+    Streams batches of rows into a JSON array of objects, formatted like json.dump(..., indent=4)
+    but without building the whole document in memory.
+
+    Parameters and return value are the same as for write_csv.
+    """
+    def write_batch(f, columns, rows, offset):
+        for row_number, row in enumerate(rows, offset):
+            item = json.dumps(dict(zip(columns, row)), default=json_default, indent=4)
+            f.write(("," if row_number else "[") + "\n    " + item.replace("\n", "\n    "))
+
+    return _write_export(batches, file_path, write_batch, on_progress,
+                         footer=lambda f, row_count: f.write("\n]" if row_count else "[]"))
+
+
+def write_ndjson(batches, file_path, on_progress=None):
+    """
+    Streams batches of rows into a newline-delimited JSON file, one object per line.
+
+    Parameters and return value are the same as for write_csv.
+    """
+    def write_batch(f, columns, rows, offset):
+        f.write("".join(json.dumps(dict(zip(columns, row)), default=json_default) + "\n" for row in rows))
+
+    return _write_export(batches, file_path, write_batch, on_progress)
+
+
+def _write_arrow_export(batches, file_path, on_progress, schema_for, open_writer, write_table, group_size=None):
+    # Shared part of the Parquet and Arrow writers: the schema is taken from the first batch, and
+    # rows are buffered until group_size of them can be written together
+    state = {"writer": None, "schema": None, "pending": []}
+
+    def flush(final):
+        table = pa.Table.from_batches(state["pending"], schema=state["schema"])
+        written = table.num_rows if final or group_size is None else table.num_rows - table.num_rows % group_size
+        if written:
+            write_table(state["writer"], table.slice(0, written))
+        state["pending"] = table.slice(written).to_batches()
+
+    def write_batch(sink, columns, rows, offset):
+        if state["writer"] is None:
+            schema = schema_for(columns) if schema_for is not None else None
+            state["schema"] = schema if schema is not None else infer_arrow_schema(columns, rows)
+            state["writer"] = open_writer(sink, state["schema"])
+        state["pending"].append(rows_to_record_batch(rows, state["schema"]))
+        if group_size is None or sum(batch.num_rows for batch in state["pending"]) >= group_size:
+            flush(False)
+
+    def footer(sink, row_count):
+        if state["writer"] is None:
+            state["schema"] = pa.schema([])  # No rows: write a valid, empty file
+            state["writer"] = open_writer(sink, state["schema"])
+        flush(True)
+        state["writer"].close()
+
+    return _write_export(batches, file_path, write_batch, on_progress, footer=footer,
+                         open_file=lambda path: pa.OSFile(path, 'wb'))
+
+
+def write_parquet(batches, file_path, on_progress=None, schema_for=None):
+    """
+    Streams batches of rows into a Parquet file, written in row groups of PARQUET_ROW_GROUP_SIZE rows.
+
+    Parameters:
+    - batches, file_path, on_progress: The same as for write_csv. The file is never gzipped;
+      Parquet compresses its pages itself.
+    - schema_for: Optional function returning the Arrow schema for the column names of the first
+      batch (e.g. built from the database column types). The types are inferred from the values
+      of the first batch when it is not given or returns None.
+
+    Returns:
+    - The number of rows written.
+    """
+    return _write_arrow_export(batches, file_path, on_progress, schema_for,
+                               lambda sink, schema: pq.ParquetWriter(sink, schema, compression="snappy"),
+                               lambda writer, table: writer.write_table(table, row_group_size=PARQUET_ROW_GROUP_SIZE),
+                               group_size=PARQUET_ROW_GROUP_SIZE)
+
+
+def write_arrow(batches, file_path, on_progress=None, schema_for=None):
+    """
+    Streams batches of rows into an Arrow IPC file (Feather version 2), which can be memory-mapped
+    when it is read back.
+
+    Parameters and return value are the same as for write_parquet.
+    """
+    return _write_arrow_export(batches, file_path, on_progress, schema_for, pa.ipc.new_file,
+                               lambda writer, table: writer.write_table(table))
+
+
+# Export formats offered in the export menu: name -> (writer, file extension)
+EXPORT_FORMATS = {
+    "CSV": (write_csv, ".csv"),
+    "JSON": (write_json, ".json"),
+    "NDJSON": (write_ndjson, ".ndjson"),
+}
+if pa is not None:
+    EXPORT_FORMATS["Parquet"] = (write_parquet, ".parquet")
+    EXPORT_FORMATS["Arrow"] = (write_arrow, ".arrow")
+
+# Formats that keep the column types; their writers take a schema_for argument
+TYPED_EXPORT_FORMATS = {"Parquet", "Arrow"}
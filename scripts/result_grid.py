@@ -0,0 +1,162 @@
+import tkinter as tk
+from tkinter import ttk
+
+import numpy as np
+
+MAX_CELL_LENGTH = 200  # Longer values are cut in the grid (exports keep them whole)
+COLUMN_WIDTH = 120  # Initial width of each column in pixels
+
+
+class ResultGrid(tk.Frame):
+    """
+    A virtualized grid showing a QueryResult.
+
+    The Treeview only ever holds the rows that fit in the window: scrolling moves a window
+    over the result and re-fills the same items, so only the visible rows are fetched from
+    the result and formatted, however many rows it has. Clicking a column heading sorts by
+    that column (clicking again reverses the order); columns are resized by dragging the
+    heading borders.
+    """
+    def __init__(self, master, height=15, **kwargs):
+        """
+        Parameters:
+        - master: The parent widget.
+        - height: The initial number of visible rows.
+        """
+        super().__init__(master, **kwargs)
+        self.tree = ttk.Treeview(self, show="headings", height=height, selectmode="browse")
+        self.vertical_scrollbar = ttk.Scrollbar(self, orient="vertical", command=self._on_scrollbar)
+        self.horizontal_scrollbar = ttk.Scrollbar(self, orient="horizontal", command=self.tree.xview)
+        self.tree.configure(xscrollcommand=self.horizontal_scrollbar.set)
+        self.position_label = tk.Label(self, text="", anchor="w")
+
+        self.tree.grid(row=0, column=0, sticky="nsew")
+        self.vertical_scrollbar.grid(row=0, column=1, sticky="ns")
+        self.horizontal_scrollbar.grid(row=1, column=0, sticky="ew")
+        self.position_label.grid(row=2, column=0, columnspan=2, sticky="ew")
+        self.grid_rowconfigure(0, weight=1)
+        self.grid_columnconfigure(0, weight=1)
+
+        self.tree.bind("<Configure>", self._on_resize)
+        self.tree.bind("<MouseWheel>", lambda event: self._scroll_by(-3 if event.delta > 0 else 3))
+        self.tree.bind("<Button-4>", lambda event: self._scroll_by(-3))
+        self.tree.bind("<Button-5>", lambda event: self._scroll_by(3))
+        self.tree.bind("<Prior>", lambda event: self._scroll_by(-self.visible_rows))
+        self.tree.bind("<Next>", lambda event: self._scroll_by(self.visible_rows))
+        self.tree.bind("<Home>", lambda event: self._scroll_to(0))
+        self.tree.bind("<End>", lambda event: self._scroll_to(self._row_count()))
+
+        self.result = None
+        self.visible_rows = height
+        self.first_row = 0  # Position in the (sorted) result of the first visible row
+        self._order = None  # Row positions in sorted order, None when unsorted
+        self._sort_column = None  # Position of the column sorted by
+        self._descending = False
+
+    def show(self, result):
+        """
+        Displays a result, or refreshes the display after rows were added to the result shown.
+
+        Parameters:
+        - result: The QueryResult to display. Passing the same result again keeps the
+          scroll position and sort order; rows added since are listed after the sorted ones.
+        """
+        if result is not self.result:
+            self.result = result
+            self.first_row = 0
+            self._order = None
+            self._sort_column = None
+            self._descending = False
+            columns = [f"c{i}" for i in range(len(result.columns))]
+            self.tree.delete(*self.tree.get_children())
+            self.tree.configure(columns=columns)
+            for index, (column_id, name) in enumerate(zip(columns, result.columns)):
+                self.tree.heading(column_id, text=name, command=lambda index=index: self.sort_by(index))
+                self.tree.column(column_id, width=COLUMN_WIDTH, minwidth=40, stretch=False)
+        elif self._order is not None and len(self._order) < len(result):
+            self._order = np.concatenate([self._order, np.arange(len(self._order), len(result), dtype=np.int64)])
+        self._render()
+
+    def clear(self):
+        """
+        Removes the displayed result.
+        """
+        self.result = None
+        self._order = None
+        self.tree.delete(*self.tree.get_children())
+        self.tree.configure(columns=())
+        self.position_label.config(text="")
+
+    def sort_by(self, index):
+        """
+        Sorts the rows by a column, reversing the order if the grid is already sorted by it.
+
+        Parameters:
+        - index: The position of the column (columns may share a name, e.g. in a join).
+        """
+        if self.result is None:
+            return
+        self._descending = not self._descending if index == self._sort_column else False
+        self._sort_column = index
+        self._order = self.result.sort_order(index, self._descending)
+        for position, (column_id, name) in enumerate(zip(self.tree["columns"], self.result.columns)):
+            arrow = (" ▼" if self._descending else " ▲") if position == index else ""
+            self.tree.heading(column_id, text=f"{name}{arrow}")
+        self.first_row = 0
+        self._render()
+
+    def _row_count(self):
+        return len(self.result) if self.result is not None else 0
+
+    def _page(self, start, stop):
+        # Fetch only the rows of the visible window, following the sort order if there is one
+        if self._order is None:
+            return self.result.rows(start, stop)
+        return self.result.take(self._order[start:stop].tolist())
+
+    def _render(self):
+        row_count = self._row_count()
+        self.first_row = max(0, min(self.first_row, row_count - self.visible_rows))
+        rows = self._page(self.first_row, self.first_row + self.visible_rows) if row_count else []
+
+        # Re-use the existing items so that scrolling does not create or destroy widgets
+        items = self.tree.get_children()
+        if len(items) > len(rows):
+            self.tree.delete(*items[len(rows):])
+        for i, row in enumerate(rows):
+            values = [str(value)[:MAX_CELL_LENGTH] for value in row]
+            if i < len(items):
+                self.tree.item(items[i], values=values)
+            else:
+                self.tree.insert("", "end", values=values)
+
+        if row_count:
+            self.vertical_scrollbar.set(self.first_row / row_count, (self.first_row + len(rows)) / row_count)
+            self.position_label.config(text=f"Rows {self.first_row + 1}-{self.first_row + len(rows)} of {row_count}")
+        else:
+            self.vertical_scrollbar.set(0, 1)
+            self.position_label.config(text="No rows" if self.result is not None else "")
+
+    def _scroll_to(self, first_row):
+        self.first_row = first_row
+        self._render()
+        return "break"
+
+    def _scroll_by(self, row_delta):
+        return self._scroll_to(self.first_row + row_delta)
+
+    def _on_scrollbar(self, action, amount, unit=None):
+        if action == "moveto":
+            self._scroll_to(int(float(amount) * self._row_count()))
+        elif action == "scroll":
+            step = self.visible_rows if unit == "pages" else 1
+            self._scroll_by(int(amount) * step)
+
+    def _on_resize(self, event):
+        # Fit the window to the number of rows the Treeview has room for (one row height goes to the headings)
+        row_height = ttk.Style().lookup("Treeview", "rowheight") or 20
+        visible_rows = max(1, event.height // int(row_height) - 1)
+        if visible_rows != self.visible_rows:
+            self.visible_rows = visible_rows
+            if self.result is not None:
+                self._render()
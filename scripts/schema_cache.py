@@ -0,0 +1,76 @@
+import hashlib
+import json
+import os
+
+# Directory where cached schemas are stored, one file per connection
+SCHEMA_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".nl_to_sql_tool", "schema_cache")
+
+
+def connection_cache_key(*parts):
+    """
+    Builds the cache key identifying a connection.
+
+    Parameters:
+    - parts: The values identifying the connection, e.g. project and dataset, or host, port and database.
+
+    Returns:
+    - A hexadecimal digest usable as a file name.
+    """
+    return hashlib.sha256("\x1f".join(str(part) for part in parts).encode("utf-8")).hexdigest()
+
+
+def _cache_path(key, cache_dir):
+    return os.path.join(cache_dir, f"{key}.json")
+
+
+def load_cached_tables(key, cache_dir=SCHEMA_CACHE_DIR):
+    """
+    Loads the cached tables for a connection.
+
+    Parameters:
+    - key: The connection cache key.
+    - cache_dir: The directory holding the cache files.
+
+    Returns:
+    - A dictionary mapping table names to {"fingerprint": ..., "columns": [...], ...} entries,
+      or an empty dictionary if nothing is cached or the cache file is unreadable.
+    """
+    try:
+        with open(_cache_path(key, cache_dir), 'r') as f:
+            return json.load(f).get("tables", {})
+    except (OSError, ValueError):
+        return {}
+
+
+def save_cached_tables(key, tables, cache_dir=SCHEMA_CACHE_DIR):
+    """
+    Stores the tables for a connection, replacing the previous cache file atomically.
+
+    Parameters:
+    - key: The connection cache key.
+    - tables: A dictionary mapping table names to their cache entries.
+    - cache_dir: The directory holding the cache files.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    path = _cache_path(key, cache_dir)
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, 'w') as f:
+        json.dump({"tables": tables}, f)
+    os.replace(temp_path, path)
+
+
+def stale_tables(cached_tables, fingerprints):
+    """
+    Compares cached fingerprints with the current ones.
+
+    Parameters:
+    - cached_tables: The cached entries returned by load_cached_tables.
+    - fingerprints: A dictionary mapping every current table name to its current fingerprint.
+
+    Returns:
+    - The names of tables that are new or whose fingerprint changed, in the order of fingerprints.
+    """
+    return [
+        table for table, fingerprint in fingerprints.items()
+        if cached_tables.get(table, {}).get("fingerprint") != fingerprint
+    ]
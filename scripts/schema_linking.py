@@ -0,0 +1,214 @@
+import hashlib
+import json
+import math
+import re
+from collections import Counter
+
+# Splits identifiers and questions into words: snake_case, camelCase, ACRONYMS and numbers
+_WORD_PATTERN = re.compile(r'[A-Z]+(?![a-z])|[A-Z]?[a-z]+|\d+')
+
+# Question words that carry no information about which tables are needed
+_STOP_WORDS = {
+    "a", "all", "an", "and", "are", "as", "at", "be", "by", "count", "did", "do", "does", "each", "for",
+    "from", "give", "has", "have", "how", "in", "is", "it", "list", "many", "me", "much", "of", "on", "or",
+    "per", "show", "than", "that", "the", "their", "there", "to", "was", "were", "what", "when", "where",
+    "which", "who", "with",
+}
+
+TABLE_NAME_WEIGHT = 3.0  # Weight of a question word matching the table name
+COLUMN_NAME_WEIGHT = 1.0  # Weight of a question word matching a column name
+NEIGHBOUR_DISCOUNT = 0.5  # Score share given to tables linked by a foreign key to a selected table
+VECTOR_SCORE_WEIGHT = 4.0  # Weight of the n-gram similarity between a question word and a table
+VECTOR_MIN_SIMILARITY = 0.4  # Similarities below this are ignored
+
+
+def _stem(word):
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 4 and word.endswith(("ses", "xes", "ches", "shes")):
+        return word[:-2]
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+
+def tokenize(text):
+    """
+    Splits text or an identifier into lower-case, stemmed words.
+
+    Parameters:
+    - text: The text to split, e.g. "customerOrders", "order_items" or a question.
+
+    Returns:
+    - A list of words.
+    """
+    return [_stem(word.lower()) for word in _WORD_PATTERN.findall(text)]
+
+
+def _column_words(columns):
+    words = []
+    for col in columns:
+        words.extend(tokenize(col[0]))
+        if len(col) > 3 and col[1] == 'RECORD':
+            words.extend(_column_words(col[2]))
+    return words
+
+
+def infer_foreign_keys(schema):
+    """
+    Guesses foreign keys from column names when the database does not declare them,
+    e.g. a column customer_id referencing a table named customer or customers.
+
+    Parameters:
+    - schema: The schema dictionary.
+
+    Returns:
+    - A dictionary mapping table names to lists of (column, referenced_table, referenced_column) tuples.
+    """
+    tables_by_word = {}
+    for table in schema:
+        tables_by_word.setdefault(_stem(table.split(".")[-1].lower()), table)
+    foreign_keys = {}
+    for table, columns in schema.items():
+        for col in columns:
+            name = col[0].lower()
+            if name.endswith("_id"):
+                referenced = tables_by_word.get(_stem(name[:-3]))
+                if referenced and referenced != table:
+                    foreign_keys.setdefault(table, []).append((col[0], referenced, "id"))
+    return foreign_keys
+
+
+class SchemaLinker:
+    """
+    A lexical index over table and column names used to pick the tables relevant to a question.
+
+    The index is updated incrementally: only tables whose columns changed are re-indexed.
+    When a SchemaVectorIndex is attached, fuzzy n-gram matches between question words and
+    table or column names (e.g. "revenues" and "revenue_usd") add to the exact word matches.
+    """
+    def __init__(self, render_table, vector_index=None):
+        """
+        Parameters:
+        - render_table: A function returning the prompt text of a single table, used to estimate its token cost.
+        - vector_index: Optional SchemaVectorIndex kept in sync with the schema and used for fuzzy matching.
+        """
+        self.render_table = render_table
+        self.vector_index = vector_index
+        self._signatures = {}  # table -> hash of its columns
+        self._table_words = {}  # table -> set of words in the table name
+        self._column_words = {}  # table -> set of words in its column names
+        self._token_costs = {}  # table -> estimated prompt tokens
+        self._document_frequency = Counter()
+        self._neighbours = {}  # table -> set of tables linked to it by a foreign key
+
+    def update(self, schema, foreign_keys=None):
+        """
+        Brings the index in line with the schema, re-indexing only new or changed tables.
+
+        Parameters:
+        - schema: The schema dictionary.
+        - foreign_keys: Optional dictionary mapping tables to (column, referenced_table, referenced_column)
+          tuples. Foreign keys are inferred from column names when not given.
+        """
+        if self.vector_index is not None:
+            self.vector_index.sync(schema)
+        for table in list(self._signatures):
+            if table not in schema:
+                self._remove(table)
+        for table, columns in schema.items():
+            signature = hashlib.sha1(json.dumps([table, columns], default=str).encode("utf-8")).hexdigest()
+            if self._signatures.get(table) == signature:
+                continue
+            self._remove(table)
+            self._signatures[table] = signature
+            self._table_words[table] = set(tokenize(table))
+            self._column_words[table] = set(_column_words(columns))
+            self._token_costs[table] = max(1, len(self.render_table(table, columns)) // 4)
+            self._document_frequency.update(self._table_words[table] | self._column_words[table])
+
+        if foreign_keys is None:
+            foreign_keys = infer_foreign_keys(schema)
+        self._neighbours = {table: set() for table in schema}
+        for table, keys in foreign_keys.items():
+            for _, referenced_table, _ in keys:
+                if table in self._neighbours and referenced_table in self._neighbours:
+                    self._neighbours[table].add(referenced_table)
+                    self._neighbours[referenced_table].add(table)
+
+    def _remove(self, table):
+        if table in self._signatures:
+            self._document_frequency.subtract(self._table_words[table] | self._column_words[table])
+            del self._signatures[table], self._table_words[table], self._column_words[table], self._token_costs[table]
+
+    def rank_tables(self, question):
+        """
+        Scores every table against the question.
+
+        Parameters:
+        - question: The natural language question (or SQL query being refined).
+
+        Returns:
+        - A list of (table, score) tuples with a positive score, best first.
+        """
+        words = {word for word in tokenize(question) if word not in _STOP_WORDS}
+        table_count = len(self._signatures)
+        fuzzy_scores = Counter()
+        if self.vector_index is not None:
+            for word in words:
+                if len(word) >= 3:
+                    for table, similarity in self.vector_index.table_scores(word).items():
+                        if similarity >= VECTOR_MIN_SIMILARITY:
+                            fuzzy_scores[table] += VECTOR_SCORE_WEIGHT * similarity
+        scores = []
+        for table in self._signatures:
+            score = fuzzy_scores.get(table, 0.0)
+            for word in words:
+                weight = 0.0
+                if word in self._table_words[table]:
+                    weight += TABLE_NAME_WEIGHT
+                if word in self._column_words[table]:
+                    weight += COLUMN_NAME_WEIGHT
+                if weight:
+                    score += weight * math.log(1 + table_count / self._document_frequency[word])
+            if score > 0:
+                scores.append((table, score))
+        scores.sort(key=lambda item: item[1], reverse=True)
+        return scores
+
+    def select_tables(self, question, top_k=8, token_budget=3000):
+        """
+        Picks the tables to send to the model for a question.
+
+        The top_k best matching tables are taken first, followed by the tables linked to them by
+        foreign keys, as long as their estimated size fits in the token budget. If the whole
+        schema fits in the budget, or nothing matches the question, every table is kept in
+        schema order until the budget is used up.
+
+        Parameters:
+        - question: The natural language question (or SQL query being refined).
+        - top_k: The number of directly matching tables to consider.
+        - token_budget: The maximum estimated number of prompt tokens spent on the schema.
+
+        Returns:
+        - The list of selected table names.
+        """
+        ranked = self.rank_tables(question)
+        if sum(self._token_costs.values()) <= token_budget or not ranked:
+            candidates = list(self._signatures)
+        else:
+            scores = dict(ranked[:top_k])
+            for table, score in ranked[:top_k]:
+                for neighbour in self._neighbours.get(table, ()):
+                    scores[neighbour] = max(scores.get(neighbour, 0.0), score * NEIGHBOUR_DISCOUNT)
+            candidates = sorted(scores, key=scores.get, reverse=True)
+
+        selected = []
+        used_tokens = 0
+        for table in candidates:
+            cost = self._token_costs[table]
+            if used_tokens + cost > token_budget and selected:
+                continue
+            selected.append(table)
+            used_tokens += cost
+        return selected
@@ -0,0 +1,321 @@
+import hashlib
+import json
+import os
+import shutil
+import uuid
+import zlib
+
+import numpy as np
+
+# Directory where indexes are stored, one subdirectory per connection
+SCHEMA_INDEX_DIR = os.path.join(os.path.expanduser("~"), ".nl_to_sql_tool", "schema_index")
+
+NGRAM_SIZE = 3  # Length of the character n-grams
+NUM_FEATURES = 1 << 20  # Size of the hashed feature space
+
+# Arrays written by save() and memory-mapped by load()
+_ARRAY_NAMES = ("features", "offsets", "postings", "weights", "raw_elements", "raw_features", "raw_counts")
+
+# File naming the version subdirectory holding the current index of a directory
+_CURRENT_FILE = "CURRENT"
+
+
+def _ngram_features(text, ngram_size=NGRAM_SIZE):
+    """
+    Returns the hashed character n-gram features of a text and their counts.
+    """
+    padded = f" {text.lower()} "
+    counts = {}
+    for i in range(max(1, len(padded) - ngram_size + 1)):
+        feature = zlib.crc32(padded[i:i + ngram_size].encode("utf-8")) % NUM_FEATURES
+        counts[feature] = counts.get(feature, 0) + 1
+    return counts
+
+
+def _schema_elements(table, columns, prefix=""):
+    """
+    Lists the searchable elements of a table: the table itself and every (nested) column.
+    """
+    elements = [] if prefix else [(None, table)]
+    for col in columns:
+        path = f"{prefix}{col[0]}"
+        if len(col) > 3 and col[1] == 'RECORD':
+            elements.append((path, f"{col[0]} RECORD"))
+            elements.extend(_schema_elements(table, col[2], f"{path}."))
+        else:
+            elements.append((path, f"{col[0]} {col[1]}"))
+    return elements
+
+
+class SchemaVectorIndex:
+    """
+    A character n-gram TF-IDF index over table and column names and types.
+
+    Each table contributes one element for itself and one per column. The index is compiled into
+    an inverted index held in NumPy arrays, which can be saved to a directory and memory-mapped
+    back. Tables are added, replaced or removed individually; the inverted index is recompiled
+    lazily on the next search.
+    """
+    def __init__(self):
+        self._tables = {}  # table -> {"signature", "columns" (element labels), "features", "counts", "elements"}
+        self._compiled = None  # Inverted index arrays, None when it needs recompiling
+        self._element_labels = []  # Global element id -> (table, column path or None)
+        self._table_starts = np.zeros(0, dtype=np.int64)  # First element id of each table, in _table_order
+        self._table_order = []
+
+    @staticmethod
+    def _signature(table, columns):
+        return hashlib.sha1(json.dumps([table, columns], default=str).encode("utf-8")).hexdigest()
+
+    def update_table(self, table, columns):
+        """
+        Indexes a table, or re-indexes it if its columns changed.
+
+        Parameters:
+        - table: The table name.
+        - columns: The table's columns from the schema dictionary.
+
+        Returns:
+        - True if the table was (re-)indexed, False if it was already up to date.
+        """
+        signature = self._signature(table, columns)
+        if table in self._tables and self._tables[table]["signature"] == signature:
+            return False
+        elements, features, counts, labels = [], [], [], []
+        for local_id, (column, text) in enumerate(_schema_elements(table, columns)):
+            labels.append(column)
+            for feature, count in _ngram_features(text).items():
+                elements.append(local_id)
+                features.append(feature)
+                counts.append(count)
+        self._tables[table] = {
+            "signature": signature,
+            "columns": labels,
+            "elements": np.asarray(elements, dtype=np.int32),
+            "features": np.asarray(features, dtype=np.int32),
+            "counts": np.asarray(counts, dtype=np.float32),
+        }
+        self._compiled = None
+        return True
+
+    def remove_table(self, table):
+        """
+        Removes a table from the index.
+        """
+        if self._tables.pop(table, None) is not None:
+            self._compiled = None
+
+    def sync(self, schema):
+        """
+        Brings the index in line with a schema dictionary, touching only new, changed or dropped tables.
+
+        Parameters:
+        - schema: The schema dictionary.
+
+        Returns:
+        - True if anything changed.
+        """
+        changed = False
+        for table in list(self._tables):
+            if table not in schema:
+                self.remove_table(table)
+                changed = True
+        for table, columns in schema.items():
+            changed = self.update_table(table, columns) or changed
+        return changed
+
+    def _compile(self):
+        self._table_order = list(self._tables)
+        self._element_labels = []
+        starts, all_elements, all_features, all_counts = [], [], [], []
+        for table in self._table_order:
+            entry = self._tables[table]
+            starts.append(len(self._element_labels))
+            all_elements.append(np.asarray(entry["elements"], dtype=np.int64) + len(self._element_labels))
+            all_features.append(np.asarray(entry["features"]))
+            all_counts.append(np.asarray(entry["counts"]))
+            self._element_labels.extend((table, column) for column in entry["columns"])
+        self._table_starts = np.asarray(starts, dtype=np.int64)
+
+        element_count = len(self._element_labels)
+        elements = np.concatenate(all_elements) if all_elements else np.zeros(0, dtype=np.int64)
+        features = np.concatenate(all_features) if all_features else np.zeros(0, dtype=np.int32)
+        counts = np.concatenate(all_counts) if all_counts else np.zeros(0, dtype=np.float32)
+
+        # Sort the (element, feature) pairs by feature to build the posting lists
+        order = np.argsort(features, kind="stable")
+        elements, features, counts = elements[order], features[order], counts[order]
+        unique_features, offsets = np.unique(features, return_index=True)
+        document_frequency = np.diff(np.append(offsets, len(features)))
+        idf = np.log((element_count + 1) / (document_frequency + 1)) + 1
+        weights = counts * np.repeat(idf, document_frequency).astype(np.float32)
+        norms = np.sqrt(np.bincount(elements, weights=weights ** 2, minlength=element_count))
+        weights = (weights / np.maximum(norms[elements], 1e-12)).astype(np.float32)
+
+        self._compiled = {
+            "features": unique_features.astype(np.int32),
+            "offsets": np.append(offsets, len(features)).astype(np.int64),
+            "postings": elements.astype(np.int32),
+            "weights": weights,
+            "idf": idf.astype(np.float32),
+        }
+
+    def _element_scores(self, text):
+        if self._compiled is None:
+            self._compile()
+        compiled = self._compiled
+        scores = np.zeros(len(self._element_labels), dtype=np.float32)
+        if not len(compiled["features"]):
+            return scores
+        query = _ngram_features(text)
+        query_features = np.fromiter(query, dtype=np.int32, count=len(query))
+        positions = np.minimum(np.searchsorted(compiled["features"], query_features), len(compiled["features"]) - 1)
+        found = compiled["features"][positions] == query_features
+        # n-grams that no element contains count towards the query norm with the highest idf
+        unseen_idf = np.log(len(self._element_labels) + 1) + 1
+        query_counts = np.asarray([query[feature] for feature in query], dtype=np.float32)
+        idf = np.where(found, compiled["idf"][positions], unseen_idf)
+        query_weights = (query_counts * idf)[found]
+        query_norm = np.sqrt(np.sum((query_counts * idf) ** 2)) or 1.0
+        for position, query_weight in zip(positions[found], query_weights / query_norm):
+            start, end = compiled["offsets"][position], compiled["offsets"][position + 1]
+            np.add.at(scores, compiled["postings"][start:end], query_weight * compiled["weights"][start:end])
+        return scores
+
+    def search(self, text, limit=20):
+        """
+        Finds the tables and columns most similar to a text.
+
+        Parameters:
+        - text: The text to look up, typically one word of the question.
+        - limit: The maximum number of results.
+
+        Returns:
+        - A list of (table, column path or None, cosine similarity) tuples, best first.
+        """
+        scores = self._element_scores(text)
+        if not len(scores):
+            return []
+        best = np.argsort(-scores)[:limit]
+        return [(*self._element_labels[i], float(scores[i])) for i in best if scores[i] > 0]
+
+    def table_scores(self, text):
+        """
+        Scores every table by its most similar element (the table name or one of its columns).
+
+        Parameters:
+        - text: The text to look up.
+
+        Returns:
+        - A dictionary mapping table names to cosine similarities.
+        """
+        scores = self._element_scores(text)
+        if not len(scores):
+            return {}
+        best_per_table = np.maximum.reduceat(scores, self._table_starts)
+        return dict(zip(self._table_order, best_per_table.tolist()))
+
+    def save(self, directory):
+        """
+        Saves the index to a directory as .npy arrays plus a JSON file with the labels.
+
+        Every save writes a new version subdirectory and then switches the directory's CURRENT
+        file to it, so a reader sees either the old or the new index, never a mix of both, and
+        files memory-mapped by load() are never overwritten (which Windows refuses). Older
+        versions are removed once they are no longer open.
+        """
+        if self._compiled is None:
+            self._compile()
+        version = uuid.uuid4().hex
+        version_dir = os.path.join(directory, version)
+        os.makedirs(version_dir)
+        raw_elements, raw_features, raw_counts, tables = [], [], [], {}
+        position = 0
+        for table in self._table_order:
+            entry = self._tables[table]
+            size = len(entry["features"])
+            tables[table] = {"signature": entry["signature"], "columns": entry["columns"], "range": [position, position + size]}
+            raw_elements.append(np.asarray(entry["elements"]))
+            raw_features.append(np.asarray(entry["features"]))
+            raw_counts.append(np.asarray(entry["counts"]))
+            position += size
+        arrays = dict(self._compiled)
+        arrays["raw_elements"] = np.concatenate(raw_elements) if raw_elements else np.zeros(0, dtype=np.int32)
+        arrays["raw_features"] = np.concatenate(raw_features) if raw_features else np.zeros(0, dtype=np.int32)
+        arrays["raw_counts"] = np.concatenate(raw_counts) if raw_counts else np.zeros(0, dtype=np.float32)
+        for name in _ARRAY_NAMES + ("idf",):
+            np.save(os.path.join(version_dir, f"{name}.npy"), arrays[name])
+        with open(os.path.join(version_dir, "tables.json"), 'w') as f:
+            json.dump({"tables": tables, "order": self._table_order}, f)
+
+        current_path = os.path.join(directory, _CURRENT_FILE)
+        with open(f"{current_path}.{version}.tmp", 'w') as f:
+            f.write(version)
+        os.replace(f"{current_path}.{version}.tmp", current_path)
+
+        # Remove the older versions; those still memory-mapped (on Windows) are left for a later save
+        for entry in os.listdir(directory):
+            path = os.path.join(directory, entry)
+            if entry == version or entry == _CURRENT_FILE or entry.endswith(".tmp"):
+                continue
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    @classmethod
+    def load(cls, directory):
+        """
+        Loads the current version of an index saved with save(), memory-mapping its arrays.
+
+        Returns:
+        - The loaded index, or None if the directory does not hold a readable index.
+        """
+        try:
+            with open(os.path.join(directory, _CURRENT_FILE), 'r') as f:
+                version_dir = os.path.join(directory, f.read().strip())
+            with open(os.path.join(version_dir, "tables.json"), 'r') as f:
+                metadata = json.load(f)
+            arrays = {name: np.load(os.path.join(version_dir, f"{name}.npy"), mmap_mode='r') for name in _ARRAY_NAMES + ("idf",)}
+        except (OSError, ValueError):
+            return None
+        index = cls()
+        for table in metadata["order"]:
+            entry = metadata["tables"][table]
+            start, end = entry["range"]
+            index._tables[table] = {
+                "signature": entry["signature"],
+                "columns": entry["columns"],
+                "elements": arrays["raw_elements"][start:end],
+                "features": arrays["raw_features"][start:end],
+                "counts": arrays["raw_counts"][start:end],
+            }
+        index._table_order = metadata["order"]
+        index._element_labels = [(table, column) for table in index._table_order for column in metadata["tables"][table]["columns"]]
+        starts = np.cumsum([0] + [len(metadata["tables"][table]["columns"]) for table in index._table_order[:-1]])
+        index._table_starts = np.asarray(starts if index._table_order else [], dtype=np.int64)
+        index._compiled = {name: arrays[name] for name in ("features", "offsets", "postings", "weights", "idf")}
+        return index
+
+
+def open_schema_index(key, schema, index_dir=SCHEMA_INDEX_DIR):
+    """
+    Loads the index stored for a connection, updates the tables that changed and saves it back.
+
+    Parameters:
+    - key: The connection cache key.
+    - schema: The current schema dictionary of the connection.
+    - index_dir: The directory holding the indexes.
+
+    Returns:
+    - The up-to-date index.
+    """
+    directory = os.path.join(index_dir, key)
+    loaded_index = SchemaVectorIndex.load(directory)
+    index = loaded_index or SchemaVectorIndex()
+    if index.sync(schema) or loaded_index is None:
+        index.save(directory)
+    return index
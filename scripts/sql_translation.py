@@ -0,0 +1,138 @@
+# Model settings used when an engine is created without them
+OPENAI_MODEL = "gpt-4o-mini"
+OPENAI_TEMPERATURE = 0.3
+MAX_RESPONSE_TOKENS = 200
+
+SYSTEM_MESSAGE = "You are an expert SQL query generator."
+
+# Separates the SQL query from its explanation in the model responses
+EXPLANATION_MARKER = "Explanation:"
+
+
+def translation_messages(prompt):
+    """
+    Returns the chat messages sent to the model for a translation prompt.
+    """
+    return [{"role": "system", "content": SYSTEM_MESSAGE}, {"role": "user", "content": prompt}]
+
+
+def request_translation(client, prompt, model=OPENAI_MODEL, temperature=OPENAI_TEMPERATURE, cache=None, cache_key=None, on_usage=None):
+    """
+    Sends a translation prompt to the model, or returns the cached response for the same request.
+
+    Parameters:
+    - client: The OpenAI client.
+    - prompt: The complete user prompt.
+    - model, temperature: The model settings.
+    - cache: Optional TranslationCache; responses are looked up and stored under cache_key.
+    - cache_key: The key built with TranslationCache.make_key, required when a cache is given.
+    - on_usage: Optional function called with the token usage of the model call (e.g. PromptStats.record).
+
+    Returns:
+    - The model response, with the SQL query followed by "Explanation:" and its explanation.
+    """
+    if cache is not None:
+        full_response = cache.get(cache_key)
+        if full_response is not None:
+            return full_response
+    response = client.chat.completions.create(
+        model=model,
+        messages=translation_messages(prompt),
+        max_tokens=MAX_RESPONSE_TOKENS,
+        temperature=temperature,
+        stop=["SQL Query:"]
+    )
+    if on_usage is not None and response.usage is not None:
+        on_usage(response.usage)
+    full_response = response.choices[0].message.content.strip()
+    if cache is not None:
+        cache.put(cache_key, full_response)
+    return full_response
+
+
+def stream_translation(client, prompt, on_progress, model=OPENAI_MODEL, temperature=OPENAI_TEMPERATURE, cache=None, cache_key=None,
+                       on_usage=None):
+    """
+    Like request_translation, but streams the response (stream=True) and calls on_progress as
+    tokens arrive, so the query can be shown while the model is still writing it. A cached
+    response is passed to on_progress at once.
+
+    Parameters:
+    - client, prompt, model, temperature, cache, cache_key, on_usage: See request_translation.
+    - on_progress: Function called with (sql_text, explanation_text, sql_complete) each time text
+      arrives; explanation_text is empty until sql_complete, which becomes True as soon as the
+      "Explanation:" marker ends the SQL part.
+
+    Returns:
+    - The complete model response, as returned by request_translation.
+    """
+    splitter = ResponseSplitter()
+    if cache is not None:
+        full_response = cache.get(cache_key)
+        if full_response is not None:
+            splitter.feed(full_response)
+            on_progress(*splitter.parts())
+            return full_response
+    stream = client.chat.completions.create(
+        model=model,
+        messages=translation_messages(prompt),
+        max_tokens=MAX_RESPONSE_TOKENS,
+        temperature=temperature,
+        stop=["SQL Query:"],
+        stream=True,
+        stream_options={"include_usage": True}  # The last chunk then carries the token usage
+    )
+    for chunk in stream:
+        delta = chunk.choices[0].delta.content if chunk.choices else None
+        if delta:
+            splitter.feed(delta)
+            on_progress(*splitter.parts())
+        if on_usage is not None and getattr(chunk, "usage", None) is not None:
+            on_usage(chunk.usage)
+    full_response = splitter.text.strip()
+    if cache is not None:
+        cache.put(cache_key, full_response)
+    return full_response
+
+
+class ResponseSplitter:
+    """
+    Splits a model response into its SQL part and its explanation while the response is streamed,
+    looking for the marker only in the text that arrived since the last call.
+    """
+    def __init__(self):
+        self.text = ""
+        self._marker_at = -1  # Position of EXPLANATION_MARKER in the text, -1 until it arrives
+
+    def feed(self, delta):
+        # The marker may be split between two deltas, so the search starts just before the new text
+        search_from = max(0, len(self.text) - len(EXPLANATION_MARKER) + 1)
+        self.text += delta
+        if self._marker_at < 0:
+            self._marker_at = self.text.find(EXPLANATION_MARKER, search_from)
+
+    def parts(self):
+        """
+        Returns:
+        - A tuple (sql_text, explanation_text, sql_complete) for the text received so far.
+        """
+        if self._marker_at < 0:
+            # Text that may be the start of the marker (e.g. "Expl") is held back until the rest arrives
+            for length in range(min(len(EXPLANATION_MARKER) - 1, len(self.text)), 0, -1):
+                if self.text.endswith(EXPLANATION_MARKER[:length]):
+                    return self.text[:-length].strip(), "", False
+            return self.text.strip(), "", False
+        return self.text[:self._marker_at].strip(), self.text[self._marker_at + len(EXPLANATION_MARKER):].strip(), True
+
+
+def parse_translation(full_response):
+    """
+    Splits a model response into the SQL query and its explanation.
+
+    Returns:
+    - A tuple (sql_query, explanation).
+    """
+    sql_query = full_response.split(EXPLANATION_MARKER)[0].strip()
+    explanation = full_response.split(EXPLANATION_MARKER)[1].strip() if EXPLANATION_MARKER in full_response else "No explanation provided."
+    return sql_query, explanation
+
@@ -0,0 +1,326 @@
+import re
+from collections import namedtuple
+
+# A token of a SQL query: its kind, its text, its value (the name of an identifier without
+# quotes, the upper-cased text of a word) and its position in the query
+Token = namedtuple("Token", ["kind", "text", "value", "position"])
+
+# String literal and quoted identifier syntax of each dialect, tried before the common tokens
+_DIALECT_TOKENS = {
+    "postgresql": r"""
+        (?P<comment>--[^\n]*|/\*.*?\*/)
+      | (?P<string>[Ee]'(?:[^'\\]|\\.|'')*'|'(?:[^']|'')*'|\$(?P<tag>\w*)\$.*?\$(?P=tag)\$)
+      | (?P<quoted>"(?:[^"]|"")*")
+    """,
+    "bigquery": r"""
+        (?P<comment>--[^\n]*|\#[^\n]*|/\*.*?\*/)
+      | (?P<string>[RrBb]{0,2}(?:'''.*?'''|\"\"\".*?\"\"\"|'(?:[^'\\\n]|\\.)*'|"(?:[^"\\\n]|\\.)*"))
+      | (?P<quoted>`[^`]*`)
+    """,
+}
+_COMMON_TOKENS = r"""
+  | (?P<space>\s+)
+  | (?P<number>(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)
+  | (?P<word>[A-Za-z_][\w$]*)
+  | (?P<parameter>[@:$%][\w({]+\)?s?)
+  | (?P<operator>::|<=|>=|<>|!=|\|\||->>|->|[-+*/%<>=,;().\[\]{}|&^~!?:])
+  | (?P<unterminated>'|"|`|/\*)
+  | (?P<other>.)
+"""
+_TOKEN_PATTERNS = {dialect: re.compile(tokens + _COMMON_TOKENS, re.VERBOSE | re.DOTALL) for dialect, tokens in _DIALECT_TOKENS.items()}
+
+# Row locking clauses of a SELECT (FOR UPDATE, FOR NO KEY UPDATE, FOR SHARE, FOR KEY SHARE)
+_LOCKING_CLAUSES = [("UPDATE",), ("NO", "KEY", "UPDATE"), ("SHARE",), ("KEY", "SHARE")]
+
+# Words ending a table reference in a FROM clause, i.e. that cannot be a table alias
+_CLAUSE_KEYWORDS = {"ON", "USING", "WHERE", "GROUP", "ORDER", "HAVING", "LIMIT", "OFFSET", "FETCH", "JOIN", "INNER",
+                    "LEFT", "RIGHT", "FULL", "OUTER", "CROSS", "NATURAL", "UNION", "EXCEPT", "INTERSECT", "WINDOW",
+                    "QUALIFY", "FOR", "TABLESAMPLE", "LATERAL", "SELECT", "FROM", "WITH", "PIVOT", "UNPIVOT", "AS"}
+
+# Schemas of system tables, which are not part of the user schema
+_SYSTEM_SCHEMAS = {"information_schema", "pg_catalog"}
+
+# Columns every table has without them being listed in the schema
+_PSEUDO_COLUMNS = {"_partitiontime", "_partitiondate", "_table_suffix", "_file_name",
+                   "ctid", "xmin", "xmax", "cmin", "cmax", "tableoid", "oid"}
+
+
+class SqlSyntaxError(ValueError):
+    """
+    Raised by tokenize_sql for a string literal, quoted identifier or comment that is not closed.
+    """
+
+
+def tokenize_sql(sql_query, dialect="bigquery"):
+    """
+    Splits a SQL query into tokens, leaving out whitespace and comments.
+
+    Parameters:
+    - sql_query: The SQL query.
+    - dialect: "bigquery" or "postgresql", which differ in how strings and identifiers are quoted.
+
+    Returns:
+    - A list of Token tuples. Word tokens have kind "word" and an upper-cased value; quoted
+      identifiers have kind "quoted" and the identifier as value.
+    """
+    tokens = []
+    for match in _TOKEN_PATTERNS[dialect].finditer(sql_query):
+        kind = match.lastgroup
+        text = match.group(kind)
+        if kind in ("space", "comment"):
+            continue
+        if kind == "unterminated":
+            what = "comment" if text == "/*" else "string literal" if text == "'" or (text == '"' and dialect == "bigquery") else "quoted identifier"
+            raise SqlSyntaxError(f"Unterminated {what} at position {match.start()}.")
+        if kind == "word":
+            value = text.upper()
+        elif kind == "quoted":
+            value = text[1:-1].replace('""', '"')
+        else:
+            value = text
+        tokens.append(Token(kind, text, value, match.start()))
+    return tokens
+
+
+def _is_identifier(token):
+    return token is not None and token.kind in ("word", "quoted")
+
+
+def _name(token):
+    # Identifiers are compared case-insensitively; unquoted words keep their original spelling
+    return (token.text if token.kind == "word" else token.value).lower()
+
+
+def _structure_errors(tokens):
+    errors = []
+    depth = 0
+    for token in tokens:
+        if token.text == "(":
+            depth += 1
+        elif token.text == ")":
+            depth -= 1
+            if depth < 0:
+                errors.append(f"Unexpected closing parenthesis at position {token.position}.")
+                depth = 0
+    if depth > 0:
+        errors.append(f"{depth} parenthesis{'es are' if depth > 1 else ' is'} not closed.")
+
+    semicolons = [i for i, token in enumerate(tokens) if token.text == ";"]
+    if semicolons and semicolons[0] < len(tokens) - 1 and any(token.text != ";" for token in tokens[semicolons[0]:]):
+        errors.append("The query contains several statements; only one can be executed at a time.")
+
+    first_word = next((token for token in tokens if token.text != "("), None)
+    if first_word is None or first_word.value not in ("SELECT", "WITH"):
+        statement = first_word.text.upper() if first_word is not None else "empty"
+        errors.append(f"Only SELECT queries can be executed; this is a{'n' if statement[0] in 'AEIOU' else ''} {statement} statement.")
+    else:
+        write_clauses = _write_clauses(tokens)
+        if write_clauses:
+            errors.append(f"The query contains {', '.join(write_clauses)}; only read-only SELECT queries can be executed.")
+    return errors
+
+
+def _starts_write_statement(tokens, i):
+    # Whether tokens[i] starts an INSERT, UPDATE, DELETE or MERGE statement rather than naming a column
+    value = tokens[i].value
+    following = tokens[i + 1] if i + 1 < len(tokens) else None
+    if following is None or following.kind != "word":
+        return False
+    if value in ("INSERT", "MERGE"):
+        return following.value == "INTO"
+    if value == "DELETE":
+        return following.value == "FROM"
+    if value == "UPDATE":
+        # UPDATE table [[AS] alias] SET ...
+        parts, end = _read_reference(tokens, i + 1)
+        if end < len(tokens) and tokens[end].value == "AS":
+            end += 1
+        if end < len(tokens) and _is_identifier(tokens[end]) and tokens[end].value != "SET":
+            end += 1
+        return bool(parts) and end < len(tokens) and tokens[end].kind == "word" and tokens[end].value == "SET"
+    return False
+
+
+def _write_clauses(tokens):
+    # Writes a statement starting with SELECT or WITH can still contain: SELECT ... INTO, data-modifying
+    # common table expressions (WITH x AS (DELETE ...), or WITH x AS (...) DELETE ...) and row locking
+    # clauses. Words in other positions, e.g. columns named update or call, are not flagged.
+    clauses = []
+    openers = []  # Index of the opening parenthesis of every enclosing group
+    closed_group = None  # Index of the opening parenthesis of the group that the previous token closed
+    for i, token in enumerate(tokens):
+        previous = tokens[i - 1] if i else None
+        if token.text == "(":
+            openers.append(i)
+        elif token.text == ")":
+            closed_group = openers.pop() if openers else None
+            continue
+        if token.kind == "word" and previous is not None and previous.text != "." and previous.value != "AS":
+            if token.value == "INTO" and previous.value not in ("INSERT", "MERGE"):
+                clauses.append("INTO")
+            elif token.value in ("INSERT", "UPDATE", "DELETE", "MERGE") and _starts_write_statement(tokens, i):
+                # The body of a common table expression or a subquery, or the statement after WITH x AS (...)
+                after_common_table = (previous.text == ")" and closed_group is not None and closed_group > 0
+                                      and tokens[closed_group - 1].value in ("AS", "MATERIALIZED"))
+                if previous.text == "(" or after_common_table:
+                    clauses.append(token.value)
+            elif token.value == "FOR" and previous.text != ",":
+                words = tuple(t.value for t in tokens[i + 1:i + 4])
+                locking = next((clause for clause in _LOCKING_CLAUSES if words[:len(clause)] == clause), None)
+                if locking is not None:
+                    clauses.append(" ".join(("FOR",) + locking))
+        closed_group = None
+    return sorted(set(clauses))
+
+
+def _adjacent(token, next_token):
+    return token.position + len(token.text) == next_token.position
+
+
+def _read_reference(tokens, i):
+    # Reads a dotted name (a.b.c, `a.b.c` or "a"."b") starting at tokens[i]; returns its parts and the next index
+    parts = []
+    while _is_identifier(tokens[i] if i < len(tokens) else None):
+        token = tokens[i]
+        if token.text.startswith("`"):
+            parts.extend(token.value.split("."))
+        else:
+            part = token.text if token.kind == "word" else token.value
+            # Unquoted BigQuery project IDs may contain dashes (my-project.dataset.table)
+            while (i + 2 < len(tokens) and tokens[i + 1].text == "-" and tokens[i + 2].kind in ("word", "number")
+                   and _adjacent(tokens[i], tokens[i + 1]) and _adjacent(tokens[i + 1], tokens[i + 2])):
+                part += "-" + tokens[i + 2].text
+                i += 2
+            parts.append(part)
+        if i + 2 < len(tokens) and tokens[i + 1].text == "." and _is_identifier(tokens[i + 2]):
+            i += 2
+        else:
+            i += 1
+            break
+    return parts, i
+
+
+def _table_references(tokens):
+    # Yields (parts, alias, position) for the tables named after FROM, JOIN and commas of a FROM list
+    selects = [False]  # Whether a SELECT appeared at each parenthesis depth
+    for i, token in enumerate(tokens):
+        if token.text == "(":
+            selects.append(False)
+        elif token.text == ")" and len(selects) > 1:
+            selects.pop()
+        elif token.kind == "word" and token.value == "SELECT":
+            selects[-1] = True
+        if token.value not in ("FROM", "JOIN") or token.kind != "word":
+            continue
+        # FROM without a SELECT at the same depth belongs to a function, e.g. EXTRACT(YEAR FROM column)
+        if token.value == "FROM" and (not selects[-1] or i >= 2 and tokens[i - 1].value == "DISTINCT" and tokens[i - 2].value in ("IS", "NOT")):
+            continue
+        j = i + 1
+        while True:
+            if j < len(tokens) and tokens[j].value == "LATERAL":
+                j += 1
+            parts, end = _read_reference(tokens, j)
+            if not parts or (end < len(tokens) and tokens[end].text == "("):
+                break  # A subquery or a table function such as UNNEST(...)
+            alias = None
+            if end < len(tokens) and tokens[end].value == "AS":
+                end += 1
+            if end < len(tokens) and _is_identifier(tokens[end]) and not (tokens[end].kind == "word" and tokens[end].value in _CLAUSE_KEYWORDS):
+                alias = _name(tokens[end])
+                end += 1
+            yield parts, alias, tokens[j].position
+            if end < len(tokens) and tokens[end].text == "," and token.value == "FROM":
+                j = end + 1
+            else:
+                break
+
+
+def _common_table_names(tokens):
+    # Names defined by WITH name AS (...) or WITH name (columns) AS (...)
+    names = set()
+    for i, token in enumerate(tokens[:-2]):
+        if not _is_identifier(token):
+            continue
+        j = i + 1
+        if tokens[j].text == "(":
+            depth = 0
+            while j < len(tokens):
+                depth += {"(": 1, ")": -1}.get(tokens[j].text, 0)
+                j += 1
+                if depth == 0:
+                    break
+        if j + 1 < len(tokens) and tokens[j].value == "AS" and tokens[j + 1].text == "(":
+            names.add(_name(token))
+    return names
+
+
+def _schema_warnings(tokens, schema):
+    warnings = []
+    tables_by_name = {}
+    for table in schema:
+        tables_by_name[table.lower()] = table
+        tables_by_name.setdefault(table.lower().rsplit(".", 1)[-1], table)
+    common_tables = _common_table_names(tokens)
+
+    aliases = {}  # Alias or table name -> schema table, for the tables found in the schema
+    for parts, alias, position in _table_references(tokens):
+        names = [part.lower() for part in parts]
+        if _SYSTEM_SCHEMAS.intersection(names) or names[-1].startswith("pg_") or names[-1] == "__tables__":
+            continue
+        if len(names) == 1 and names[0] in common_tables:
+            continue
+        table = tables_by_name.get(".".join(names)) or tables_by_name.get(".".join(names[-2:])) or tables_by_name.get(names[-1])
+        if table is None:
+            warnings.append(f"Table {'.'.join(parts)} is not in the schema.")
+            continue
+        aliases[names[-1]] = table
+        if alias is not None:
+            aliases[alias] = table
+
+    # Qualified column references (alias.column) whose alias names a table of the schema
+    reported = set()
+    for i in range(len(tokens) - 2):
+        token = tokens[i]
+        if not _is_identifier(token) or tokens[i + 1].text != "." or not _is_identifier(tokens[i + 2]):
+            continue
+        if i > 0 and tokens[i - 1].text == "." or i + 3 < len(tokens) and tokens[i + 3].text == "(":
+            continue  # Part of a longer name, or a function call
+        table = aliases.get(_name(token))
+        if table is None or _name(token) in common_tables:
+            continue
+        column = _name(tokens[i + 2])
+        columns = {col[0].lower() for col in schema[table]}
+        if column not in columns and column not in _PSEUDO_COLUMNS and (table, column) not in reported:
+            reported.add((table, column))
+            warnings.append(f"Column {tokens[i + 2].value if tokens[i + 2].kind == 'quoted' else tokens[i + 2].text} is not in table {table}.")
+    return warnings
+
+
+def validate_sql(sql_query, schema=None, dialect="bigquery"):
+    """
+    Checks a generated query locally before it is sent to the database.
+
+    The query must be a single read-only SELECT (or WITH ... SELECT) statement with balanced
+    parentheses and closed literals. When a schema is given, the tables named after FROM and
+    JOIN must be in it, and qualified column references (alias.column) must name columns of
+    their table. Unqualified column names are not checked, since they cannot be told apart
+    from select-list aliases without a full parser.
+
+    Parameters:
+    - sql_query: The SQL query.
+    - schema: Optional schema dictionary mapping table names to lists of column tuples.
+    - dialect: "bigquery" or "postgresql".
+
+    Returns:
+    - A tuple (errors, warnings) of lists of messages. Errors mean the query must not be run;
+      warnings mean it refers to tables or columns missing from the schema, which may
+      also come from an incomplete schema.
+    """
+    try:
+        tokens = tokenize_sql(sql_query, dialect)
+    except SqlSyntaxError as e:
+        return [str(e)], []
+    errors = _structure_errors(tokens)
+    if errors or not schema:
+        return errors, []
+    return errors, _schema_warnings(tokens, schema)
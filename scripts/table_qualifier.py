@@ -0,0 +1,72 @@
+import functools
+import re
+
+# Parts of a query in which table names must not be rewritten: string literals and comments
+_SKIPPED = r"""'(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*"|--[^\n]*|\#[^\n]*|/\*.*?\*/"""
+
+# EXTRACT(part FROM column) uses FROM without naming a table
+_EXTRACT_PREFIX = re.compile(r'\bEXTRACT\s*\(\s*\w+\s+$', re.IGNORECASE)
+
+
+def _trie_pattern(names):
+    # Builds a regular expression matching any of the names, sharing their common prefixes, so
+    # that matching takes time proportional to the length of a name, not to the number of names
+    trie = {}
+    for name in names:
+        node = trie
+        for char in name:
+            node = node.setdefault(char, {})
+        node[""] = {}
+
+    def build(node):
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+        if "" in node:
+            return "(?:" + "|".join(branches) + ")?"
+        return branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+
+    return build(trie)
+
+
+@functools.lru_cache(maxsize=8)
+def _compile(table_names):
+    # Compiled once per set of table names: the pattern and a case-insensitive name lookup
+    pattern = re.compile(
+        rf"(?P<skipped>{_SKIPPED})"
+        rf"|\b(?P<keyword>FROM|JOIN)(?P<space>\s+)(?P<quote>`?)(?P<name>{_trie_pattern(table_names)})(?P=quote)(?![\w.])",
+        re.IGNORECASE | re.DOTALL
+    )
+    lookup = {name.lower(): name for name in sorted(table_names, reverse=True)}
+    return pattern, lookup
+
+
+def qualify_tables(sql_query, table_names, qualify):
+    """
+    Rewrites the table names following FROM and JOIN in a single pass over a query.
+
+    Only the given table names are rewritten, so references that are already qualified (e.g.
+    `project.dataset.table` or dataset.table), aliases, CTE names and UNNEST calls are kept,
+    as are names inside string literals and comments. Names are matched case-insensitively.
+
+    Parameters:
+    - sql_query: The SQL query.
+    - table_names: The table names of the schema, e.g. the keys of the schema dictionary.
+    - qualify: Function returning the qualified reference for a table name.
+
+    Returns:
+    - The SQL query with its table references qualified.
+    """
+    table_names = frozenset(table_names)
+    if not table_names:
+        return sql_query
+    pattern, lookup = _compile(table_names)
+
+    def replace(match):
+        if match.group("skipped") or _EXTRACT_PREFIX.search(sql_query, max(0, match.start() - 64), match.start()):
+            return match.group(0)
+        name = match.group("name")
+        name = name if name in table_names else lookup[name.lower()]
+        return f"{match.group('keyword')}{match.group('space')}{qualify(name)}"
+
+    return pattern.sub(replace, sql_query)
@@ -0,0 +1,141 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# Default location of the persistent translation cache
+TRANSLATION_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".nl_to_sql_tool", "translation_cache.sqlite3")
+
+
+class TranslationCache:
+    """
+    An LRU cache of model responses with time-based expiry.
+
+    Entries are kept in memory and, when a path is given, also in an SQLite file so
+    that they survive restarts. The cache is safe to use from several threads.
+    """
+    def __init__(self, max_entries=512, ttl=7 * 24 * 3600, path=None):
+        """
+        Parameters:
+        - max_entries: The maximum number of entries kept in memory and on disk.
+        - ttl: Seconds after which an entry expires.
+        - path: Optional path of the SQLite file backing the cache.
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (value, stored_at), least recently used first
+        self._lock = threading.Lock()
+        self._db = None
+        if path:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("CREATE TABLE IF NOT EXISTS translations (key TEXT PRIMARY KEY, value TEXT, stored_at REAL)")
+            self._db.execute("DELETE FROM translations WHERE stored_at < ?", (time.time() - ttl,))
+            self._db.commit()
+
+    @staticmethod
+    def make_key(question, schema_text, feedback, model, temperature, dialect, prompt_prefix):
+        """
+        Builds the cache key for a translation request.
+
+        Parameters:
+        - question: The natural language question (or SQL query being refined).
+        - schema_text: The schema text sent to the model.
+        - feedback: The user feedback, or None.
+        - model: The model name.
+        - temperature: The sampling temperature.
+        - dialect: The SQL dialect of the tool.
+        - prompt_prefix: The rules preceding the schema in the prompt (PromptBuilder.static_prefix),
+          so that responses to an older version of the prompt are not reused.
+
+        Returns:
+        - A hexadecimal digest identifying the request.
+        """
+        normalized_question = " ".join(question.split())
+        schema_hash = hashlib.sha256(schema_text.encode("utf-8")).hexdigest()
+        prefix_hash = hashlib.sha256(prompt_prefix.encode("utf-8")).hexdigest()
+        payload = json.dumps([normalized_question, schema_hash, feedback or "", model, temperature, dialect, prefix_hash])
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        """
+        Returns the cached value for a key, or None if it is missing or expired.
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None and self._db is not None:
+                row = self._db.execute("SELECT value, stored_at FROM translations WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    entry = row
+                    self._entries[key] = entry
+            if entry is not None and now - entry[1] <= self.ttl:
+                self._entries.move_to_end(key)
+                self._evict_memory()
+                self.hits += 1
+                return entry[0]
+            if entry is not None:
+                self._remove(key)
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        """
+        Stores a value, evicting the least recently used entries beyond max_entries.
+        """
+        stored_at = time.time()
+        with self._lock:
+            self._entries[key] = (value, stored_at)
+            self._entries.move_to_end(key)
+            if self._db is not None:
+                self._db.execute("INSERT OR REPLACE INTO translations (key, value, stored_at) VALUES (?, ?, ?)", (key, value, stored_at))
+            for oldest_key in self._evict_memory():
+                if self._db is not None:
+                    self._db.execute("DELETE FROM translations WHERE key = ?", (oldest_key,))
+            if self._db is not None:
+                # Entries that were only on disk are trimmed to the same limit, oldest first
+                self._db.execute(
+                    "DELETE FROM translations WHERE key NOT IN (SELECT key FROM translations ORDER BY stored_at DESC LIMIT ?)",
+                    (self.max_entries,)
+                )
+                self._db.commit()
+
+    def _evict_memory(self):
+        # Drops the least recently used entries held in memory beyond max_entries and returns their keys
+        evicted = []
+        while len(self._entries) > self.max_entries:
+            evicted.append(self._entries.popitem(last=False)[0])
+        return evicted
+
+    def _remove(self, key):
+        self._entries.pop(key, None)
+        if self._db is not None:
+            self._db.execute("DELETE FROM translations WHERE key = ?", (key,))
+            self._db.commit()
+
+    def clear(self):
+        """
+        Removes every entry and resets the counters.
+        """
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+            if self._db is not None:
+                self._db.execute("DELETE FROM translations")
+                self._db.commit()
+
+    def stats(self):
+        """
+        Returns the cache counters.
+
+        Returns:
+        - A dictionary with the number of hits, misses and entries held in memory.
+        """
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries)}
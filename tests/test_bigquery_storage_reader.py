@@ -0,0 +1,100 @@
+from types import SimpleNamespace
+
+import pytest
+
+pa = pytest.importorskip("pyarrow")
+
+import bigquery_storage_reader
+from bigquery_storage_reader import iter_record_batches, read_table
+
+TABLE = SimpleNamespace(project="p", dataset_id="d", table_id="t")
+TABLE_PATH = "projects/p/datasets/d/tables/t"
+
+
+class LocalReadClient:
+    """
+    Stands in for BigQueryReadClient, serving Arrow record batches from memory. The table is split
+    into the given streams; asking for a single stream (to preserve the order) concatenates them.
+    """
+    def __init__(self, streams):
+        self.streams = streams  # List of streams, each a list of record batches
+        self.sessions = []  # The (parent, table path, max_stream_count) of every session created
+        self.read_streams = []
+        self._batches = {}
+
+    def create_read_session(self, parent, read_session, max_stream_count=0):
+        self.sessions.append((parent, read_session.table, max_stream_count))
+        streams = self.streams
+        if max_stream_count == 1 and len(streams) > 1:
+            streams = [[record_batch for stream in streams for record_batch in stream]]
+        session = SimpleNamespace(streams=[])
+        for i, record_batches in enumerate(streams):
+            name = f"{read_session.table}/streams/{i}"
+            self._batches[name] = record_batches
+            session.streams.append(SimpleNamespace(name=name))
+        return session
+
+    def read_rows(self, name):
+        self.read_streams.append(name)
+        pages = [SimpleNamespace(to_arrow=lambda record_batch=record_batch: record_batch) for record_batch in self._batches[name]]
+        return SimpleNamespace(rows=lambda session=None: SimpleNamespace(pages=pages))
+
+
+@pytest.fixture(autouse=True)
+def storage_types(monkeypatch):
+    # The read session request is built with the library's types, which only need to carry the table path here
+    types = SimpleNamespace(ReadSession=lambda table, data_format: SimpleNamespace(table=table, data_format=data_format),
+                            DataFormat=SimpleNamespace(ARROW="ARROW"))
+    monkeypatch.setattr(bigquery_storage_reader, "bigquery_storage", SimpleNamespace(types=types))
+
+
+def batch(start, stop):
+    return pa.RecordBatch.from_pydict({"id": list(range(start, stop)), "name": [f"n{i}" for i in range(start, stop)]})
+
+
+def make_streams():
+    # Three streams of two batches each, 30 rows in all
+    return [[batch(s * 10, s * 10 + 5), batch(s * 10 + 5, s * 10 + 10)] for s in range(3)]
+
+
+def test_streams_are_read_in_parallel():
+    client = LocalReadClient(make_streams())
+    record_batches = list(iter_record_batches(client, "billing", TABLE, max_streams=4))
+
+    assert client.sessions == [("projects/billing", TABLE_PATH, 4)]
+    assert sorted(client.read_streams) == [f"{TABLE_PATH}/streams/{i}" for i in range(3)]
+    assert sorted(value for record_batch in record_batches for value in record_batch.column("id").to_pylist()) == list(range(30))
+
+
+def test_preserve_order_reads_one_stream():
+    client = LocalReadClient(make_streams())
+    result = read_table(client, "billing", TABLE, ["id", "name"], preserve_order=True)
+
+    assert client.sessions[0][2] == 1
+    assert client.read_streams == [f"{TABLE_PATH}/streams/0"]
+    assert [row[0] for row in result.rows()] == list(range(30))
+
+
+def test_row_limit_cuts_the_last_batch():
+    client = LocalReadClient(make_streams())
+    result = read_table(client, "billing", TABLE, ["id", "name"], row_limit=7, preserve_order=True)
+
+    assert len(result) == 7
+    assert result.columns == ["id", "name"]
+    assert result.rows() == [(i, f"n{i}") for i in range(7)]
+
+
+def test_row_limit_with_parallel_streams():
+    client = LocalReadClient(make_streams())
+    result = read_table(client, "billing", TABLE, ["id", "name"], row_limit=12)
+
+    assert len(result) == 12
+    assert len(set(row[0] for row in result.rows())) == 12
+
+
+def test_empty_table_keeps_its_columns():
+    client = LocalReadClient([[]])
+    result = read_table(client, "billing", TABLE, ["id", "name"])
+
+    assert len(result) == 0
+    assert result.columns == ["id", "name"]